@@ -0,0 +1,366 @@
+"""异步翻译引擎（asyncio）
+
+同步引擎每个在途请求占用一个线程；这里的异步引擎让所有请求共用一个事件循环和一个
+httpx.AsyncClient 连接池。它不提高吞吐量：benchmarks.py async（1个CPU）中各并发级别
+都比同步引擎慢，c=100 时异步引擎为同步引擎的 0.75–0.9 倍，同步外观 0.73–0.86 倍。
+原生 asyncio 调用（translate_many）的收益是线程数（c=100 时 2 个对 101 个）；
+经 SyncEngine 使用时调用线程照样阻塞，收益只是在途请求可以取消（见 HedgedEngine）。
+
+- AsyncGoogleEngine / AsyncDeepLEngine / AsyncPotEngine: gtx、DeepL 和本地 Pot 接口
+- 每次请求都有截止时间（超时即取消请求），调用方取消任务时请求同样被取消
+- 连接数受 AsyncHTTPClient 的上限约束，超出的请求在连接池中排队
+- SyncEngine: 在后台事件循环上运行异步引擎，对外是普通的 TranslationEngine，
+  translate_text 等同步调用方、限流/重试/分段等包装无需修改
+
+配置（translator_config.json）:
+    "async_engines": true,          # 引擎请求走异步HTTP客户端（需要安装httpx；不提高吞吐量）
+    "async_max_connections": 100    # 所有异步引擎共用的最大连接数
+
+    async with AsyncGoogleEngine() as engine:
+        results = await translate_many(engine, texts, "auto", "en", concurrency=100)
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import CancelledError as FutureCancelled, TimeoutError as FutureTimeout
+from typing import Awaitable, List, Optional, TypeVar
+
+from engines import (EngineError, TranslationEngine, current_cancellation, deepl_base_url,
+                     deepl_form, gtx_batch_params, gtx_params, parse_deepl, parse_gtx, parse_gtx_batch)
+from metrics import metrics
+
+try:
+    import httpx  # 可选依赖
+except ImportError:
+    httpx = None
+
+T = TypeVar("T")
+
+MAX_CONNECTIONS = 100
+# httpcore 的连接池为每个请求遍历全部连接，开销与 在途请求数×连接数 成正比；
+# 按每份不超过该连接数拆成多个小连接池，请求分给在途请求最少的一个
+SHARD_CONNECTIONS = 10
+
+
+class AsyncHTTPClient:
+    """异步HTTP客户端：所有引擎共用的连接池（若干个 httpx.AsyncClient）
+
+    总连接数不超过max_connections，超出的请求在连接池中排队。
+    httpx.AsyncClient 只能在创建它的事件循环中使用，shared_client() 按事件循环各建一个。
+    """
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, http2: bool = False, verify=True):
+        if httpx is None:
+            raise RuntimeError("异步引擎需要安装httpx")
+        self.max_shards = max(1, -(-max_connections // SHARD_CONNECTIONS))
+        self.per_shard = max(1, max_connections // self.max_shards)
+        self.http2 = http2
+        # 各个小连接池共用一个SSL上下文（每次创建都要加载CA证书）
+        create_ssl_context = getattr(httpx, "create_ssl_context", None)
+        self.verify = create_ssl_context(verify=verify) if create_ssl_context else verify
+        self.clients = []
+        self._in_flight = []
+
+    def _pick(self) -> int:
+        """在途请求最少的连接池；都已满且还能拆分时新建一个"""
+        index = min(range(len(self.clients)), key=self._in_flight.__getitem__, default=-1)
+        if (index < 0 or self._in_flight[index] >= self.per_shard) \
+                and len(self.clients) < self.max_shards:
+            limits = httpx.Limits(max_connections=self.per_shard,
+                                  max_keepalive_connections=self.per_shard)
+            self.clients.append(httpx.AsyncClient(limits=limits, http2=self.http2,
+                                                  verify=self.verify))
+            self._in_flight.append(0)
+            index = len(self.clients) - 1
+        return index
+
+    async def request(self, method: str, url: str, timeout: float, **kwargs):
+        """发送请求；连接、排队和读取都计入timeout"""
+        index = self._pick()
+        self._in_flight[index] += 1
+        try:
+            return await self.clients[index].request(method, url, timeout=timeout, **kwargs)
+        finally:
+            self._in_flight[index] -= 1
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+_client_options = {"max_connections": MAX_CONNECTIONS}
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHTTPClient]" = \
+    weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def configure_client(**options):
+    """设置之后新建的共享客户端的参数（max_connections、http2、verify）"""
+    _client_options.update(options)
+
+
+def shared_client() -> AsyncHTTPClient:
+    """当前事件循环的共享客户端"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            client = _clients[loop] = AsyncHTTPClient(**_client_options)
+        return client
+
+
+async def close_shared_client():
+    """关闭当前事件循环的共享客户端（在事件循环结束前调用）"""
+    with _clients_lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def with_deadline(awaitable: Awaitable[T], timeout: float) -> T:
+    """在timeout秒内完成，否则取消并抛出EngineError（可重试）"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise EngineError(f"{timeout:g} 秒内没有响应", reason="deadline", retryable=True) from None
+
+
+class AsyncTranslationEngine:
+    """异步翻译引擎基类，接口与 TranslationEngine 对应
+
+    具体引擎实现 request()（失败时抛出EngineError），translate() 在此基础上
+    加上截止时间，并把失败转换为返回None。
+    """
+    name = "base"
+    max_chars = 2000
+    max_batch = 1
+    base_url = ""
+
+    def __init__(self, client: Optional[AsyncHTTPClient] = None):
+        self._client = client
+
+    @property
+    def http(self) -> AsyncHTTPClient:
+        return self._client if self._client is not None else shared_client()
+
+    async def _send(self, method: str, url: str, timeout: float, **kwargs):
+        try:
+            with metrics.span("engine_request", engine=self.name):
+                return await self.http.request(method, url, timeout, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise EngineError(f"翻译错误: {e}", reason=type(e).__name__, retryable=True) from e
+
+    async def request(self, text: str, source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> str:
+        """发出一次翻译请求，失败抛出EngineError"""
+        raise NotImplementedError
+
+    async def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                            timeout: float = 5.0) -> List[str]:
+        """在一次请求中翻译多个片段；不支持批量的引擎并发逐个请求"""
+        return list(await asyncio.gather(*(self.request(text, source_lang, target_lang, timeout)
+                                           for text in texts)))
+
+    async def translate(self, text: str, source_lang: str, target_lang: str,
+                        timeout: float = 5.0) -> Optional[str]:
+        """翻译文本，超时或失败返回None"""
+        try:
+            return await with_deadline(self.request(text, source_lang, target_lang, timeout),
+                                       timeout)
+        except EngineError as e:
+            print(f"[{self.name}] {e}")
+            metrics.inc("engine_errors", engine=self.name, reason=e.reason)
+            return None
+
+    async def warm_up(self, timeout: float = 3.0) -> bool:
+        """预先完成DNS、TCP和TLS握手"""
+        try:
+            await self.http.request("HEAD", self.base_url + "/", timeout)
+            return True
+        except Exception as e:
+            print(f"预热{self.name}连接失败: {e}")
+            return False
+
+    async def aclose(self):
+        """关闭引擎自己的客户端（共享客户端由 close_shared_client 关闭）"""
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+        await close_shared_client()
+
+
+class AsyncGoogleEngine(AsyncTranslationEngine):
+    """Google Translate (gtx) 异步引擎"""
+    name = "google"
+    max_chars = 1000
+    max_batch = 128
+
+    def __init__(self, base_url: str = "https://translate.googleapis.com",
+                 client: Optional[AsyncHTTPClient] = None):
+        super().__init__(client)
+        self.base_url = base_url.rstrip("/")
+
+    async def request(self, text: str, source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> str:
+        response = await self._send("GET", f"{self.base_url}/translate_a/single", timeout,
+                                    params=gtx_params(text, source_lang, target_lang))
+        return parse_gtx(response)
+
+    async def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                            timeout: float = 5.0) -> List[str]:
+        if len(texts) == 1:
+            return [await self.request(texts[0], source_lang, target_lang, timeout)]
+        response = await self._send("GET", f"{self.base_url}/translate_a/t", timeout,
+                                    params=gtx_batch_params(texts, source_lang, target_lang))
+        return parse_gtx_batch(response, len(texts))
+
+
+class AsyncDeepLEngine(AsyncTranslationEngine):
+    """DeepL API 异步引擎"""
+    name = "deepl"
+    max_chars = 5000
+    max_batch = 50
+
+    def __init__(self, api_key: str = "", base_url: Optional[str] = None,
+                 client: Optional[AsyncHTTPClient] = None):
+        super().__init__(client)
+        self.api_key = api_key
+        self.base_url = (base_url or deepl_base_url(api_key)).rstrip("/")
+
+    async def request(self, text: str, source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> str:
+        return (await self.request_batch([text], source_lang, target_lang, timeout))[0]
+
+    async def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                            timeout: float = 5.0) -> List[str]:
+        response = await self._send(
+            "POST", f"{self.base_url}/v2/translate", timeout,
+            headers={"Authorization": f"DeepL-Auth-Key {self.api_key}"},
+            data=deepl_form(texts, source_lang, target_lang))
+        return parse_deepl(response, len(texts))
+
+
+class AsyncPotEngine(AsyncTranslationEngine):
+    """本地 Pot 翻译接口（POST /translate，与 translation_daemon 的接口相同）"""
+    name = "pot"
+    max_chars = 5000
+
+    def __init__(self, base_url: str = "http://127.0.0.1:60828",
+                 client: Optional[AsyncHTTPClient] = None):
+        super().__init__(client)
+        self.base_url = base_url.rstrip("/")
+
+    async def request(self, text: str, source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> str:
+        response = await self._send("POST", f"{self.base_url}/translate", timeout,
+                                    json={"text": text, "from": source_lang, "to": target_lang})
+        if response.status_code != 200:
+            raise EngineError(f"Pot 返回错误: {response.status_code}",
+                              status=response.status_code,
+                              retryable=response.status_code >= 500)
+        # 返回 {"text": 译文}，或直接返回译文文本
+        try:
+            translated = response.json()
+            if isinstance(translated, dict):
+                translated = translated.get("text")
+        except ValueError:
+            translated = response.text
+        if not isinstance(translated, str):
+            raise EngineError("翻译结果格式错误", reason="format")
+        return translated
+
+
+async def translate_many(engine: AsyncTranslationEngine, texts: List[str], source_lang: str,
+                         target_lang: str, concurrency: int = 100,
+                         timeout: float = 5.0) -> List[Optional[str]]:
+    """并发翻译多条文本（同时在途不超过concurrency个），结果与texts一一对应"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def translate_one(text: str) -> Optional[str]:
+        async with semaphore:
+            return await engine.translate(text, source_lang, target_lang, timeout)
+    return list(await asyncio.gather(*(translate_one(text) for text in texts)))
+
+
+class EventLoopThread:
+    """在守护线程中运行的事件循环，供同步代码提交协程"""
+    def __init__(self, name: str = "async-engines"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, awaitable: Awaitable[T], timeout: float) -> T:
+        """在事件循环中执行并等待结果；超过timeout时取消协程并抛出EngineError
+
+        调用线程有取消句柄（对冲模式的请求）时，取消句柄也会中止协程。
+        """
+        future = asyncio.run_coroutine_threadsafe(awaitable, self.loop)
+        cancellation = current_cancellation()
+        if cancellation is not None:
+            cancellation.on_cancel(future.cancel)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise EngineError(f"{timeout:g} 秒内没有响应", reason="deadline",
+                              retryable=True) from None
+        except FutureCancelled:
+            raise EngineError("请求已取消", reason="cancelled") from None
+
+
+event_loop = EventLoopThread()
+
+
+class SyncEngine(TranslationEngine):
+    """异步引擎的同步外观：请求在共享的后台事件循环中执行，调用线程只是等待结果"""
+    # 协程自身按timeout取消；这里多等一点，让取消后的EngineError能传回来
+    GRACE = 0.5
+
+    def __init__(self, engine: AsyncTranslationEngine, runner: Optional[EventLoopThread] = None):
+        self.engine = engine
+        self.runner = runner or event_loop
+        self.name = engine.name
+        self.max_chars = engine.max_chars
+        self.max_batch = engine.max_batch
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        return self.runner.run(with_deadline(
+            self.engine.request(text, source_lang, target_lang, timeout), timeout),
+            timeout + self.GRACE)
+
+    def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> List[str]:
+        return self.runner.run(with_deadline(
+            self.engine.request_batch(texts, source_lang, target_lang, timeout), timeout),
+            timeout + self.GRACE)
+
+    def warm_up(self):
+        """在后台事件循环中预先建立连接，不等待结果"""
+        asyncio.run_coroutine_threadsafe(self.engine.warm_up(), self.runner.loop)
+
+
+def create_async_engine(name: str, config: dict) -> AsyncTranslationEngine:
+    """按名称创建单个异步引擎"""
+    if name == "google":
+        return AsyncGoogleEngine()
+    if name == "deepl":
+        return AsyncDeepLEngine(config.get("deepl_api_key") or config.get("api_key", ""))
+    if name == "pot":
+        return AsyncPotEngine(config.get("pot_url", "http://127.0.0.1:60828"))
+    raise ValueError(f"未知的翻译引擎: {name}")
@@ -0,0 +1,359 @@
+"""批量翻译命令行工具（流式处理，内存占用与输入大小无关）
+
+用法:
+    python batch_translate.py chat.txt -o chat.en.txt
+    python batch_translate.py export.jsonl --format jsonl --field content -o out.jsonl
+    cat log.txt | python batch_translate.py - > log.en.txt
+
+使用 translator_config.json 中的引擎设置（api_type/engines、source_lang、target_lang），
+按行（或JSONL记录）并发翻译、按输入顺序输出，相邻的记录合并为一次批量请求。
+已是目标语言的记录原样输出，源语言为auto时按每条记录的检测结果确定。
+指定 -o 时会写入检查点，中断后使用相同参数加 --resume 从断点继续。
+"""
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, TextIO
+
+
+class Record(NamedTuple):
+    """一条待翻译记录：text为None表示原样输出"""
+    index: int
+    raw: str                # 原始行（不含换行符）
+    text: Optional[str]     # 需要翻译的文本
+    data: Optional[dict]    # JSONL记录
+    source_lang: Optional[str] = None   # 源语言（auto时为检测结果）
+    translated: Optional[str] = None    # 不需要请求引擎的译文（已是目标语言）
+
+
+def read_text(lines: Iterable[str]) -> Iterator[Record]:
+    """纯文本：每行一条记录，空行原样保留"""
+    for index, line in enumerate(lines):
+        raw = line.rstrip("\r\n")
+        yield Record(index, raw, raw if raw.strip() else None, None)
+
+
+def read_jsonl(lines: Iterable[str], field: str) -> Iterator[Record]:
+    """JSONL：翻译每条记录的field字段，无法解析或没有该字段的行原样保留"""
+    for index, line in enumerate(lines):
+        raw = line.rstrip("\r\n")
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+        text = data.get(field) if isinstance(data, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            yield Record(index, raw, None, None)
+        else:
+            yield Record(index, raw, text, data)
+
+
+def detect_languages(records: Iterable[Record], target_lang: str, source_lang: str = "auto",
+                     chunk: int = 512) -> Iterator[Record]:
+    """按块批量检测语言：已是目标语言的记录直接以原文作为译文，源语言为auto时填入检测结果"""
+    from language_detect import choose_source_lang, detect_batch, is_target_language
+
+    def flush(block):
+        detections = detect_batch(record.text for record in block)
+        for record, detection in zip(block, detections):
+            if is_target_language(detection, target_lang):
+                yield record._replace(translated=record.text)
+            elif source_lang.lower() == "auto":
+                yield record._replace(source_lang=choose_source_lang(detection))
+            else:
+                yield record._replace(source_lang=source_lang)
+
+    block = []
+    for record in records:
+        if record.text is None:
+            # 不需要翻译的记录不能越过前面的记录，先把已积累的块输出
+            yield from flush(block)
+            block = []
+            yield record
+            continue
+        block.append(record)
+        if len(block) >= chunk:
+            yield from flush(block)
+            block = []
+    yield from flush(block)
+
+
+# 批量模式下每组最多的记录数和字符数（引擎会再按自身限制拆分）
+BATCH_RECORDS = 32
+BATCH_CHARS = 4000
+
+
+def group_records(records: Iterable[Record], max_records: int = BATCH_RECORDS,
+                  max_chars: int = BATCH_CHARS) -> Iterator[List[Record]]:
+    """把相邻的、源语言相同的待翻译记录分为一组；不需要请求引擎的记录单独成组"""
+    group: List[Record] = []
+    size = 0
+    for record in records:
+        if record.text is None or record.translated is not None:
+            if group:
+                yield group
+                group, size = [], 0
+            yield [record]
+            continue
+        if group and (len(group) >= max_records or size + len(record.text) > max_chars
+                      or record.source_lang != group[0].source_lang):
+            yield group
+            group, size = [], 0
+        group.append(record)
+        size += len(record.text)
+    if group:
+        yield group
+
+
+def translate_ordered(records: Iterable[Record], translate: Callable[[str, str], Optional[str]],
+                      concurrency: int = 4,
+                      translate_batch: Optional[Callable[[List[str], str], List[Optional[str]]]] = None
+                      ) -> Iterator[tuple]:
+    """并发翻译并按输入顺序产出 (记录, 译文)
+
+    指定translate_batch(文本列表, 源语言)时，相邻记录分组后每组只发一次请求。
+    同时在途的记录（组）不超过 concurrency*2 条，因此内存占用是常数。
+    """
+    window = max(1, concurrency) * 2
+    pending = deque()
+
+    def submit(pool, group: List[Record]):
+        record = group[0]
+        if record.text is None or record.translated is not None:
+            return None
+        source_lang = record.source_lang or "auto"
+        if translate_batch is None:
+            return pool.submit(lambda: [translate(record.text, source_lang)])
+        return pool.submit(translate_batch, [record.text for record in group], source_lang)
+
+    def results(group: List[Record], future) -> Iterator[tuple]:
+        translations = future.result() if future else [record.translated for record in group]
+        yield from zip(group, translations)
+
+    groups = (group_records(records) if translate_batch is not None
+              else ([record] for record in records))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency),
+                            thread_name_prefix="batch") as pool:
+        for group in groups:
+            pending.append((group, submit(pool, group)))
+            if len(pending) >= window:
+                yield from results(*pending.popleft())
+        while pending:
+            yield from results(*pending.popleft())
+
+
+def format_output(record: Record, translated: Optional[str], fmt: str, target_field: str) -> str:
+    """生成输出行；翻译失败时保留原文"""
+    if record.text is None or translated is None:
+        return record.raw
+    if fmt == "jsonl":
+        data = dict(record.data)
+        data[target_field] = translated
+        return json.dumps(data, ensure_ascii=False)
+    # 译文中的换行会破坏行对应关系
+    return translated.replace("\r", " ").replace("\n", " ")
+
+
+class Checkpoint:
+    """检查点：已完成的记录数和对应的输出文件偏移"""
+    def __init__(self, path: str):
+        self.path = path
+        self.done = 0
+        self.offset = 0
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.done, self.offset = int(state["done"]), int(state["offset"])
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def save(self, done: int, offset: int):
+        """原子地写入（先写临时文件再替换）"""
+        self.done, self.offset = done, offset
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"done": done, "offset": offset}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class Progress:
+    """吞吐量统计（字符/秒），定期输出到stderr"""
+    def __init__(self, interval: float = 2.0, stream: TextIO = sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.records = 0
+        self.chars = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+    def add(self, record: Record, translated: Optional[str]):
+        self.records += 1
+        if record.text is not None:
+            self.chars += len(record.text)
+            if translated is None:
+                self.failed += 1
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final: bool = False):
+        elapsed = max(1e-9, time.perf_counter() - self.start)
+        prefix = "完成" if final else "进度"
+        print(f"{prefix}: {self.records} 条，{self.chars} 字符，{self.chars / elapsed:.0f} 字符/秒，"
+              f"失败 {self.failed} 条，用时 {elapsed:.1f} 秒", file=self.stream, flush=True)
+
+
+def run(lines: Iterable[str], output, translate: Callable[[str, str], Optional[str]],
+        fmt: str = "text", field: str = "text", target_field: str = "translation",
+        concurrency: int = 4, checkpoint: Optional[Checkpoint] = None,
+        checkpoint_every: int = 100, progress: Optional[Progress] = None,
+        target_lang: Optional[str] = None, source_lang: str = "auto",
+        translate_batch: Optional[Callable[[List[str], str], List[Optional[str]]]] = None
+        ) -> Progress:
+    """翻译lines并写入output（二进制文件对象），translate(文本, 源语言) 返回译文
+
+    指定translate_batch时相邻记录分组批量翻译（见 translate_ordered）。
+
+    指定target_lang时先检测语言，跳过已是目标语言的记录。
+    有检查点时跳过已完成的记录，并定期记录进度。
+    """
+    progress = progress or Progress()
+    records = read_jsonl(lines, field) if fmt == "jsonl" else read_text(lines)
+    skip = checkpoint.done if checkpoint else 0
+    if skip:
+        records = (record for record in records if record.index >= skip)
+    if target_lang:
+        records = detect_languages(records, target_lang, source_lang)
+    else:
+        records = (record._replace(source_lang=source_lang) for record in records)
+
+    done = skip
+    try:
+        for record, translated in translate_ordered(records, translate, concurrency,
+                                                    translate_batch):
+            output.write(format_output(record, translated, fmt, target_field).encode("utf-8") + b"\n")
+            done = record.index + 1
+            progress.add(record, translated)
+            if checkpoint and done % checkpoint_every == 0:
+                output.flush()
+                checkpoint.save(done, output.tell())
+    finally:
+        # 中断时也记录已写出的部分
+        output.flush()
+        if checkpoint:
+            checkpoint.save(done, output.tell())
+    return progress
+
+
+def make_translator(config: dict, target_lang: str, use_cache: bool = True,
+                    timeout: float = 30.0) -> tuple:
+    """按配置创建翻译函数（与快捷键工具相同的引擎、限流和缓存）
+
+    返回 (translate(文本, 源语言), translate_batch(文本列表, 源语言))。
+    """
+    from engines import build_engine
+    from translation_daemon import TranslationService
+
+    engine = build_engine(config)
+    engine.warm_up()
+    if not use_cache:
+        return (lambda text, source_lang: engine.translate(text, source_lang, target_lang, timeout),
+                lambda texts, source_lang: engine.translate_batch(texts, source_lang, target_lang,
+                                                                  timeout))
+    service = TranslationService(engine)
+    return (lambda text, source_lang: service.translate(text, source_lang, target_lang,
+                                                        timeout=timeout),
+            lambda texts, source_lang: service.translate_batch(texts, source_lang, target_lang,
+                                                               timeout))
+
+
+def main(argv=None) -> int:
+    import argparse
+    from engines import load_engine_config
+
+    parser = argparse.ArgumentParser(description="流式批量翻译文本文件、JSONL或标准输入")
+    parser.add_argument("input", help="输入文件，- 表示标准输入")
+    parser.add_argument("-o", "--output", help="输出文件（默认标准输出）")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("--field", default="text", help="JSONL中要翻译的字段")
+    parser.add_argument("--target-field", default="translation", help="JSONL中写入译文的字段")
+    parser.add_argument("--config", default="translator_config.json")
+    parser.add_argument("--from", dest="source_lang", help="源语言（默认取配置 source_lang）")
+    parser.add_argument("--to", dest="target_lang", help="目标语言（默认取配置 target_lang）")
+    parser.add_argument("-j", "--concurrency", type=int, default=4, help="并发请求数")
+    parser.add_argument("--resume", action="store_true", help="从检查点继续")
+    parser.add_argument("--no-cache", action="store_true", help="不使用翻译缓存")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="每条记录单独请求（默认相邻记录合并为一次批量请求）")
+    args = parser.parse_args(argv)
+
+    config = load_engine_config(args.config)
+    source_lang = args.source_lang or config.get("source_lang", "auto")
+    target_lang = args.target_lang or config.get("target_lang", "en")
+    if args.resume and not args.output:
+        print("--resume 需要指定 -o 输出文件", file=sys.stderr)
+        return 2
+
+    try:
+        translate, translate_batch = make_translator(config, target_lang, not args.no_cache)
+    except ValueError as e:
+        print(f"创建翻译引擎失败: {e}", file=sys.stderr)
+        return 2
+
+    checkpoint = None
+    if args.output:
+        checkpoint = Checkpoint(f"{args.output}.ckpt")
+        if args.resume and checkpoint.load():
+            print(f"从第 {checkpoint.done} 条继续", file=sys.stderr)
+        else:
+            checkpoint.done = checkpoint.offset = 0
+
+    source = (sys.stdin if args.input == "-"
+              else open(args.input, "r", encoding="utf-8", errors="replace", newline=""))
+    try:
+        if args.output:
+            mode = "r+b" if checkpoint.done and os.path.exists(args.output) else "wb"
+            output = open(args.output, mode)
+            output.seek(checkpoint.offset)
+            output.truncate()
+        else:
+            output = sys.stdout.buffer
+            # 引擎和缓存的日志打印到stdout，改到stderr以免混入译文
+            sys.stdout = sys.stderr
+        try:
+            progress = run(source, output, translate, args.format, args.field, args.target_field,
+                           args.concurrency, checkpoint, target_lang=target_lang,
+                           source_lang=source_lang,
+                           translate_batch=None if args.no_batch else translate_batch)
+        except KeyboardInterrupt:
+            print("已中断，使用 --resume 从检查点继续", file=sys.stderr)
+            return 130
+        finally:
+            if args.output:
+                output.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    progress.report(final=True)
+    if checkpoint:
+        checkpoint.remove()
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1295 @@
+"""性能基准测试
+
+用法: python benchmarks.py [名称 ...]，不带参数时运行全部基准。
+所有基准都使用本地替身服务，不访问真实翻译接口。
+
+    python benchmarks.py e2e --save-baseline   记录基线（benchmark_baseline.json）
+    python benchmarks.py e2e --threshold 0.5   任一阶段比基线慢50%以上时以非零状态退出
+"""
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+BENCHMARKS: Dict[str, Callable] = {}
+RESULTS: Dict[str, dict] = {}  # 本次运行的统计结果，按标签索引
+
+
+def benchmark(name: str):
+    """注册基准测试"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(label: str, samples: List[float]) -> dict:
+    """打印并返回耗时统计（毫秒）"""
+    stats = {
+        "p50": percentile(samples, 50) * 1000,
+        "p95": percentile(samples, 95) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+        "n": len(samples),
+    }
+    print(f"{label:<40} p50={stats['p50']:8.3f}ms p95={stats['p95']:8.3f}ms "
+          f"p99={stats['p99']:8.3f}ms n={stats['n']}")
+    RESULTS[label] = stats
+    return stats
+
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    """模拟Google gtx和DeepL接口的请求处理器"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _count(self):
+        with self.server.lock:
+            self.server.requests += 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ("/translate_a/single", "/translate_a/t"):
+            self._reply(404, {})
+            return
+        self._count()
+        if self.latency:
+            time.sleep(self.latency)
+        query = parse_qs(url.query)
+        texts = query.get("q", [""])
+        if url.path == "/translate_a/t":
+            # 源语言为auto时每项附带检测到的语言
+            auto = query.get("sl", ["auto"])[0] == "auto"
+            self._reply(200, [[f"[en]{text}", "zh-CN"] if auto else f"[en]{text}"
+                              for text in texts])
+            return
+        self._reply(200, [[[f"[en]{text}", text, None, None] for text in texts]])
+
+    def do_POST(self):
+        self._count()
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if self.latency:
+            time.sleep(self.latency)
+        texts = form.get("text", [""])
+        self._reply(200, {"translations": [
+            {"detected_source_language": "ZH", "text": f"[en]{text}"} for text in texts
+        ]})
+
+
+class FakeEngineServer:
+    """本地翻译接口替身，可选HTTPS"""
+    def __init__(self, tls: bool = False, latency: float = 0.0):
+        self.tls = tls
+        self.latency = latency
+        self.cert_dir = None
+        self.cert_file = None
+        handler = type("Handler", (FakeEngineHandler,), {"latency": latency})
+        # 默认的监听队列只有5，高并发时连接会被拒绝后重试
+        server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 256})
+        self.server = server_class(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.server.requests = 0  # 收到的翻译请求数
+        self.server.lock = threading.Lock()
+        if tls:
+            self._wrap_tls()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _wrap_tls(self):
+        """使用临时自签名证书启用TLS"""
+        if not shutil.which("openssl"):
+            raise RuntimeError("需要openssl命令生成测试证书")
+        self.cert_dir = tempfile.mkdtemp(prefix="fake-engine-")
+        self.cert_file = os.path.join(self.cert_dir, "cert.pem")
+        key_file = os.path.join(self.cert_dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+             "-keyout", key_file, "-out", self.cert_file, "-days", "1",
+             "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+            check=True, capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert_file, key_file)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self.tls else "http"
+        return f"{scheme}://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.cert_dir:
+            shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+
+@benchmark("http_pool")
+def bench_http_pool(rounds: int = 50):
+    """冷连接（每次新建连接）与预热会话池的延迟对比"""
+    import requests
+    from http_pool import SessionPool
+
+    with FakeEngineServer(tls=True) as server:
+        url = f"{server.url}/translate_a/single"
+        params = {"client": "gtx", "sl": "zh-CN", "tl": "en", "dt": "t", "q": "你好"}
+
+        cold = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            with requests.Session() as session:
+                session.get(url, params=params, timeout=5, verify=server.cert_file)
+            cold.append(time.perf_counter() - start)
+
+        pool = SessionPool("bench", base_url=server.url + "/", keepalive_interval=0,
+                           verify=server.cert_file)
+        first_start = time.perf_counter()
+        pool.warm_up()
+        warm_up_cost = time.perf_counter() - first_start
+        warm = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            pool.get(url, params=params, timeout=5)
+            warm.append(time.perf_counter() - start)
+        pool.close()
+
+    report("http_pool cold (new TLS connection)", cold)
+    report("http_pool warm (pooled keep-alive)", warm)
+    print(f"{'http_pool warm-up (one-off)':<40} {warm_up_cost * 1000:8.3f}ms")
+
+
+def sample_text(size: int) -> str:
+    """生成约size字节（UTF-8）的中英混合多段落文本"""
+    paragraphs = [
+        "今天下午三点开会，请大家提前准备好材料。会议室在三楼！有问题吗？",
+        "The build is green again. Please rebase before merging, thanks!",
+        "  缩进的段落；包含分号、逗号，以及省略号……还有英文 words 混排。",
+        "",
+    ]
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        paragraph = paragraphs[i % len(paragraphs)]
+        parts.append(paragraph)
+        total += len(paragraph.encode("utf-8")) + 1
+        i += 1
+    return "\n".join(parts)
+
+
+@benchmark("segmenter")
+def bench_segmenter():
+    """长文本分段并发翻译：1KB/100KB/1MB，串行与并发对比，并校验拼接结果"""
+    import segmenter
+    from engines import GoogleEngine
+    from segmenter import SegmentingEngine
+
+    ok = True
+    with FakeEngineServer(latency=0.005) as server:
+        engine = GoogleEngine(base_url=server.url)
+        for size in (1024, 100 * 1024, 1024 * 1024):
+            text = sample_text(size)
+            for concurrency in (1, 4):
+                segmenter.ENGINE_CONCURRENCY["google"] = concurrency
+                segmenter._semaphores.clear()
+                start = time.perf_counter()
+                translated = SegmentingEngine(engine).translate(text, "zh-CN", "en")
+                elapsed = time.perf_counter() - start
+                exact = translated is not None and translated.replace("[en]", "") == text
+                ok = ok and exact
+                print(f"{size // 1024:>5}KB concurrency={concurrency} {elapsed * 1000:10.1f}ms "
+                      f"{len(text) / elapsed:12.0f} chars/s exact={exact}")
+    return ok
+
+
+@benchmark("batching")
+def bench_batching(paragraphs: int = 200, lines: int = 2000, latency: float = 0.02):
+    """多段文本和批量任务的请求次数与耗时：每段一次请求与批量请求对比"""
+    import io
+    from concurrent.futures import ThreadPoolExecutor
+    import batch_translate
+    import segmenter
+    from engines import DeepLEngine, GoogleEngine
+    from segmenter import SegmentingEngine
+
+    ok = True
+    segmenter.ENGINE_CONCURRENCY.update(google=4, deepl=2)
+    segmenter._semaphores.clear()
+    # 多段落文本：按句子切分后的片段（与增量翻译相同的路径）
+    text = sample_text(paragraphs * 120)
+    sources = [segment.text for segment in segmenter.segment_text(text, 1000) if segment.translate]
+    sources = [sentence.text for source in sources
+               for sentence in segmenter.sentence_segments(source) if sentence.translate]
+    with FakeEngineServer(latency=latency) as server:
+        for name, engine in (("google", GoogleEngine(base_url=server.url)),
+                             ("deepl", DeepLEngine("key:fx", base_url=server.url))):
+            concurrency = segmenter.ENGINE_CONCURRENCY[name]
+            for batched in (False, True):
+                before = server.requests
+                start = time.perf_counter()
+                if batched:
+                    translations = SegmentingEngine(engine).translate_segments(
+                        sources, "zh-CN", "en")
+                else:
+                    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                        translations = list(pool.map(
+                            lambda source: engine.translate(source, "zh-CN", "en"), sources))
+                elapsed = time.perf_counter() - start
+                exact = translations == [f"[en]{source}" for source in sources]
+                ok &= exact
+                mode = "batch" if batched else "per segment"
+                print(f"{'segments ' + name + ' ' + mode + ' ' + str(len(sources)):<40} "
+                      f"{elapsed * 1000:8.1f}ms requests={server.requests - before} exact={exact}")
+
+        # 批量任务：每行一条记录
+        engine = SegmentingEngine(GoogleEngine(base_url=server.url))
+        rows = [f"第{i}条消息：今天下午三点开会，请准时参加。" for i in range(lines)]
+        for batched in (False, True):
+            output = io.BytesIO()
+            before = server.requests
+            start = time.perf_counter()
+            batch_translate.run(
+                (row + "\n" for row in rows), output,
+                lambda text, source_lang: engine.translate(text, source_lang, "en"),
+                concurrency=4, progress=batch_translate.Progress(interval=1e9),
+                source_lang="zh-CN",
+                translate_batch=(lambda texts, source_lang: engine.translate_batch(
+                    texts, source_lang, "en")) if batched else None)
+            elapsed = time.perf_counter() - start
+            exact = output.getvalue().decode("utf-8").splitlines() == [f"[en]{row}" for row in rows]
+            ok &= exact
+            mode = "batch" if batched else "per record"
+            print(f"{'batch_translate ' + mode + ' ' + str(lines) + ' lines':<40} "
+                  f"{elapsed * 1000:8.1f}ms requests={server.requests - before} exact={exact}")
+    return ok
+
+
+def _serve_fake_engine(latency: float, urls):
+    with FakeEngineServer(latency=latency) as server:
+        urls.put(server.url)
+        threading.Event().wait()
+
+
+class FakeEngineProcess:
+    """在子进程中运行的本地翻译接口替身（高并发测试时不与客户端争抢GIL）"""
+    def __init__(self, latency: float = 0.0):
+        import multiprocessing
+        self.urls = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve_fake_engine,
+                                               args=(latency, self.urls), daemon=True)
+        self.url = None
+
+    def __enter__(self):
+        self.process.start()
+        self.url = self.urls.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join(5)
+
+
+@benchmark("async")
+def bench_async(levels=(1, 10, 100), latency: float = 0.05, per_level: int = 10):
+    """并发请求吞吐量：阻塞引擎（每个在途请求一个线程）、异步引擎、异步引擎的同步外观
+
+    每个并发级别发出 max(50, 并发数*per_level) 个请求，替身接口（子进程）每个请求延迟latency秒。
+    vs blocking 为相对阻塞引擎的吞吐量；异步引擎的收益看线程数（threads），不看吞吐量。
+    """
+    import asyncio
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    import async_engines
+    from engines import GoogleEngine
+
+    # 线程数超过连接池大小时 urllib3 会为每个多出的连接打印警告
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    ok = True
+    with FakeEngineProcess(latency=latency) as server:
+        blocking = GoogleEngine(base_url=server.url)
+        facade = async_engines.SyncEngine(async_engines.AsyncGoogleEngine(base_url=server.url))
+
+        def threaded(engine, texts, concurrency):
+            peak = threading.active_count()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(engine.translate, text, "zh-CN", "en") for text in texts]
+                peak = max(peak, threading.active_count())
+                return [future.result() for future in futures], peak
+
+        def native(texts, concurrency):
+            async def run():
+                async with async_engines.AsyncGoogleEngine(base_url=server.url) as engine:
+                    return await async_engines.translate_many(engine, texts, "zh-CN", "en",
+                                                              concurrency)
+            return asyncio.run(run()), threading.active_count()
+
+        for concurrency in levels:
+            texts = [f"第{i}条消息，今天下午三点开会。" for i in range(max(50, concurrency * per_level))]
+            expected = [f"[en]{text}" for text in texts]
+            baseline = None
+            for mode, run in (("blocking", lambda: threaded(blocking, texts, concurrency)),
+                              ("asyncio", lambda: native(texts, concurrency)),
+                              ("sync facade", lambda: threaded(facade, texts, concurrency))):
+                start = time.perf_counter()
+                cpu = time.process_time()
+                results, threads = run()
+                cpu = time.process_time() - cpu
+                elapsed = time.perf_counter() - start
+                exact = results == expected
+                ok &= exact
+                rate = len(texts) / elapsed
+                baseline = baseline or rate
+                print(f"{'async ' + mode + ' c=' + str(concurrency):<40} {elapsed * 1000:8.1f}ms "
+                      f"{rate:6.0f} req/s vs blocking {rate / baseline:4.2f} "
+                      f"cpu={cpu / len(texts) * 1000:5.2f}ms/req threads={threads} exact={exact}")
+    return ok
+
+
+@benchmark("hedge")
+def bench_hedge(deadline: float = 5.0, latency: float = 2.0):
+    """对冲引擎：快引擎返回后，落选的请求（重试退避中 / 异步请求在途）多久释放线程"""
+    import async_engines
+    from engines import EngineError, HedgedEngine, TranslationEngine
+    from resilience import ResilientEngine
+
+    class Fast(TranslationEngine):
+        name = "fast"
+
+        def request(self, text, source_lang, target_lang, timeout=5.0):
+            time.sleep(0.05)
+            return f"[{target_lang}]{text}"
+
+    class Unavailable(TranslationEngine):
+        name = "unavailable"
+
+        def request(self, text, source_lang, target_lang, timeout=5.0):
+            time.sleep(0.1)
+            raise EngineError("HTTP 503", status=503, retryable=True)
+
+    class Finished(TranslationEngine):
+        """记录落选请求在工作线程中结束的时间"""
+        def __init__(self, engine):
+            self.engine = engine
+            self.name = engine.name
+            self.done = threading.Event()
+            self.at = 0.0
+
+        def translate(self, text, source_lang, target_lang, timeout=5.0):
+            try:
+                return self.engine.translate(text, source_lang, target_lang, timeout)
+            finally:
+                self.at = time.perf_counter()
+                self.done.set()
+
+    ok = True
+    with FakeEngineProcess(latency=latency) as server:
+        losers = (
+            ("retrying", ResilientEngine(Unavailable(), max_attempts=10, backoff_base=1.0,
+                                         backoff_cap=1.0)),
+            ("async in flight",
+             async_engines.SyncEngine(async_engines.AsyncGoogleEngine(base_url=server.url))),
+        )
+        for label, engine in losers:
+            loser = Finished(engine)
+            hedged = HedgedEngine([Fast(), loser], deadline=deadline)
+            result = hedged.translate("你好", "zh-CN", "en")
+            won = time.perf_counter()
+            released = loser.done.wait(deadline)
+            held = loser.at - won if released else deadline
+            # 落选请求应当在选出结果后立即中止，而不是占用线程到截止时间
+            passed = result == "[en]你好" and released and held < 0.5
+            ok &= passed
+            print(f"{'hedge loser ' + label:<40} released after {held * 1000:8.1f}ms "
+                  f"(deadline {deadline * 1000:.0f}ms) ok={passed}")
+    return ok
+
+
+@benchmark("startup")
+def bench_startup(scripts=("simple_translator.py", "silent_translator.py"), rounds: int = 3,
+                  budget: float = 1.0):
+    """从进程启动到键盘监听注册完成的时间，超过budget秒时失败
+
+    没有安装 pywin32 时在子进程中使用 fake_win32 替身层。translator.py 首次运行会写入
+    默认配置文件，不在此列（可用 python startup.py translator.py 单独检查）。
+    """
+    import startup
+
+    fake = startup.needs_fake_win32()
+    here = os.path.dirname(os.path.abspath(__file__))
+    ok = True
+    for script in scripts:
+        samples = []
+        for _ in range(rounds):
+            elapsed = startup.time_to_listening(os.path.join(here, script), timeout=30.0,
+                                                fake_win32=fake)
+            if elapsed is None:
+                print(f"{script} 未能进入监听状态")
+                ok = False
+                break
+            samples.append(elapsed)
+        if samples:
+            stats = report(f"startup {script} time to listening", samples)
+            ok = ok and stats["p50"] <= budget * 1000
+    return ok
+
+
+@benchmark("clipboard")
+def bench_clipboard(rounds: int = 50):
+    """剪贴板读写：事件驱动等待与原固定延时的对比，以及目标无响应时的超时"""
+    import random
+    from clipboard_sync import ClipboardTransfer, SimulatedClipboard
+
+    # 原实现中 get_text_by_clipboard / set_text_by_clipboard 的固定延时总和
+    legacy_copy = 0.3 + 0.2 + 0.2 + 0.3
+    legacy_paste = 0.2 + 0.1 + 0.1 + 0.1
+
+    rng = random.Random(0)
+    copies, pastes = [], []
+    for _ in range(rounds):
+        backend = SimulatedClipboard("你好，世界", copy_delay=rng.uniform(0.002, 0.03),
+                                     paste_delay=rng.uniform(0.002, 0.03))
+        backend.set_text("原剪贴板")
+        transfer = ClipboardTransfer(backend)
+        start = time.perf_counter()
+        text = transfer.copy_all(1)
+        copies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        transfer.paste_all(1, "Hello, world")
+        pastes.append(time.perf_counter() - start)
+        if text != "你好，世界" or backend.content != "Hello, world" \
+                or backend.get_text() != "原剪贴板":
+            print("剪贴板结果错误")
+            return False
+
+    report("clipboard copy (event-driven)", copies)
+    report("clipboard paste (event-driven)", pastes)
+    print(f"{'clipboard copy (legacy fixed sleeps)':<40} {legacy_copy * 1000:8.3f}ms")
+    print(f"{'clipboard paste (legacy fixed sleeps)':<40} {legacy_paste * 1000:8.3f}ms")
+
+    hung = SimulatedClipboard("x", copy_delay=None, paste_delay=None)
+    transfer = ClipboardTransfer(hung, timeout=0.2)
+    start = time.perf_counter()
+    text = transfer.copy_all(1)
+    elapsed = time.perf_counter() - start
+    print(f"{'clipboard copy, unresponsive target':<40} {elapsed * 1000:8.3f}ms (timeout 200ms)")
+    # 没有确认粘贴时不能报告成功
+    pasted = transfer.paste_all(1, "Hello, world")
+    return text == "" and elapsed < 0.3 and pasted is False
+
+
+@benchmark("metrics")
+def bench_metrics(iterations: int = 200000):
+    """指标埋点的单次开销：关闭时与启用时对比"""
+    from metrics import Metrics
+
+    def per_call(func) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1e9
+
+    def empty():
+        pass
+
+    baseline = per_call(empty)
+    for enabled in (False, True):
+        metrics = Metrics(enabled=enabled)
+
+        def span():
+            with metrics.span("stage", stage="read"):
+                pass
+
+        def inc():
+            metrics.inc("cache_hits", tier="memory")
+
+        state = "enabled" if enabled else "disabled"
+        print(f"{'metrics span (' + state + ')':<40} {per_call(span) - baseline:8.1f}ns/call")
+        print(f"{'metrics inc (' + state + ')':<40} {per_call(inc) - baseline:8.1f}ns/call")
+
+
+@benchmark("detect")
+def bench_detect(rounds: int = 2000, batch: int = 20000):
+    """文字与语言检测：单条聊天消息的耗时，批量时向量化与逐条检测对比"""
+    import language_detect
+
+    messages = [
+        "今天下午三点开会，请大家准时参加。Please bring your laptop. 谢谢！",
+        "The build is green again. Please rebase before merging, thanks!",
+        "明日の会議は午後三時からです。資料を準備してください。",
+        "Привет, как дела? Увидимся завтра.",
+    ]
+    for message in messages[:2]:
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            language_detect.detect(message)
+            samples.append(time.perf_counter() - start)
+        report(f"detect {len(message)} chars", samples)
+
+    texts = [messages[i % len(messages)] for i in range(batch)]
+    language_detect.detect_batch(texts[:1000], min_chars=0)  # 预先导入NumPy
+    start = time.perf_counter()
+    looped = [language_detect.detect(text) for text in texts]
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = language_detect.detect_batch(texts)
+    vector_time = time.perf_counter() - start
+    print(f"{'detect batch ' + str(batch) + ' (loop)':<40} {loop_time * 1000:8.3f}ms")
+    print(f"{'detect batch ' + str(batch) + ' (batch)':<40} {vector_time * 1000:8.3f}ms")
+
+    # 没有重音字母的拉丁文字不能当作英文：既不跳过，也不指定 sl=en
+    latin = ["Hola, como estas? Nos vemos manana en la oficina.",
+             "Selamat pagi, apa kabar? Sampai jumpa besok.",
+             "The build is green again."]
+    unknown = [language_detect.detect(text) for text in latin]
+    unknown_ok = (all(d.language is None for d in unknown)
+                  and not any(language_detect.is_target_language(d, "EN") for d in unknown)
+                  and all(language_detect.choose_source_lang(d) == "auto" for d in unknown)
+                  and language_detect.detect_batch(latin, min_chars=0) == unknown)
+    print(f"{'detect plain latin as unknown':<40} ok={unknown_ok}")
+    return looped == vectorized and unknown_ok
+
+
+@benchmark("hotkeys")
+def bench_hotkeys(iterations: int = 20000):
+    """键盘钩子每个事件的匹配开销：编译后的匹配器与逐键比较字符串的旧写法对比"""
+    import enum
+    from hotkeys import HotkeyMatcher
+
+    class Key(enum.Enum):
+        ctrl_l = "ctrl_l"
+        ctrl_r = "ctrl_r"
+        shift = "shift"
+        cmd = "cmd"
+        f12 = "f12"
+        space = "space"
+        backspace = "backspace"
+        enter = "enter"
+
+    class KeyCode:
+        # 与Windows上的pynput一致：每个KeyCode都带vk
+        def __init__(self, char, vk=None):
+            self.char = char
+            self.vk = vk if vk is not None else ord(char.upper()) if char.isalnum() else None
+
+        def __str__(self):
+            return repr(self.char)
+
+    # 普通打字：字母、空格、退格、回车，没有触发任何快捷键
+    typing = [Key.space if c == " " else KeyCode(c) for c in "the quick brown fox jumps over"]
+    typing += [Key.shift, KeyCode("T"), Key.backspace, Key.enter]
+    fired = []
+    matcher = HotkeyMatcher({"translate": ["ctrl+win+t", "space space space"], "quit": "shift+f12"},
+                            {"translate": lambda: fired.append(1), "quit": lambda: fired.append(1)},
+                            Key)
+
+    state = {"ctrl": False, "win": False, "t": False}
+
+    def legacy_press(key):
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            state["ctrl"] = True
+        elif key == Key.cmd:
+            state["win"] = True
+        elif str(key) == "'t'" or str(key) == "'\\x14'":
+            if state["t"]:
+                return
+            state["t"] = True
+        if state["ctrl"] and state["win"] and state["t"]:
+            fired.append(1)
+
+    def legacy_release(key):
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            state["ctrl"] = False
+        elif key == Key.cmd:
+            state["win"] = False
+        elif str(key) == "'t'" or str(key) == "'\\x14'":
+            state["t"] = False
+
+    def per_event(press, release) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for key in typing:
+                press(key)
+                release(key)
+        return (time.perf_counter() - start) / (iterations * len(typing) * 2) * 1e9
+
+    print(f"{'hotkeys legacy str(key)':<40} {per_event(legacy_press, legacy_release):8.1f}ns/event")
+    print(f"{'hotkeys compiled matcher':<40} "
+          f"{per_event(matcher.on_press, matcher.on_release):8.1f}ns/event")
+
+    # 触发：连按三次空格与 Ctrl+Win+T
+    for key in [Key.space] * 3:
+        matcher.on_press(key)
+        matcher.on_release(key)
+    matcher.on_press(Key.ctrl_l)
+    matcher.on_press(Key.cmd)
+    matcher.on_press(KeyCode("\x14", 0x54))
+    matcher.on_release(KeyCode("\x14", 0x54))
+    matcher.on_release(Key.cmd)
+    matcher.on_release(Key.ctrl_l)
+
+    # 标点键：按虚拟键码（按住Ctrl时char可能为空），或按字符（vk未登记，如其他键盘布局）
+    punctuation = HotkeyMatcher({"translate": ["ctrl+/", "ctrl+.", "ctrl+ü"]},
+                                {"translate": lambda: fired.append(1)}, Key)
+    for key in (KeyCode("/", 0xBF), KeyCode(None, 0xBE), KeyCode("ü", 0xBA)):
+        punctuation.on_press(Key.ctrl_l)
+        punctuation.on_press(key)
+        punctuation.on_release(key)
+        punctuation.on_release(Key.ctrl_l)
+    return len(fired) == 5
+
+
+@benchmark("memory")
+def bench_memory(sizes=(1000, 10000, 50000), rounds: int = 200):
+    """翻译记忆：查询耗时随记忆大小的变化，以及近似重复消息的复用率"""
+    import random
+    from translation_memory import TranslationMemory
+
+    rng = random.Random(0)
+    chars = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+    names = ["Tom", "Jerry", "Alice", "Bob", "Carol", "Dave", "Eve", "Mallory"]
+
+    def sentence() -> str:
+        return "".join(rng.choice(chars) for _ in range(rng.randint(8, 20)))
+
+    ok = True
+    for size in sizes:
+        memory = TranslationMemory(":memory:")
+        templates = []
+        for i in range(size):
+            text = f"{sentence()}{rng.randint(1, 999)}{sentence()}，{rng.choice(names)}。"
+            memory.add(text, "zh-CN", "en", f"[en]{text}")
+            if i % max(1, size // rounds) == 0:
+                templates.append(text)
+
+        samples = []
+        reused = 0
+        for text in templates[:rounds]:
+            # 只改数字和名字的近似重复消息
+            query = text
+            for name in names:
+                query = query.replace(f"，{name}。", f"，{rng.choice(names)}。")
+            query = "".join(str(rng.randint(0, 9)) if ch.isdigit() else ch for ch in query)
+            start = time.perf_counter()
+            match = memory.lookup(query, "zh-CN", "en")
+            samples.append(time.perf_counter() - start)
+            if match is not None:
+                reused += 1
+                ok = ok and match.translation == f"[en]{query}"
+        for _ in range(rounds):
+            start = time.perf_counter()
+            memory.lookup(sentence() + sentence(), "zh-CN", "en")
+            samples.append(time.perf_counter() - start)
+        report(f"memory lookup ({size} segments)", samples)
+        print(f"{'memory near-duplicates reused':<40} {reused}/{len(templates[:rounds])}")
+        memory.close()
+
+    # 英译法：普通单词在译文中原样出现（hotel）不能当作名字替换，名字和数字可以
+    memory = TranslationMemory(":memory:")
+    memory.add("I saw a big hotel near the station.", "en", "fr",
+               "J'ai vu un grand hotel près de la gare.")
+    memory.add("Yesterday I met Tom near the station at 5.", "en", "fr",
+               "Hier j'ai rencontré Tom près de la gare à 5.")
+    word = memory.lookup("I saw a big house near the station.", "en", "fr")
+    name = memory.lookup("Yesterday I met Alice near the station at 7.", "en", "fr")
+    memory.close()
+    same_script_ok = (word is None and name is not None
+                      and name.translation == "Hier j'ai rencontré Alice près de la gare à 7.")
+    print(f"{'memory same-script word patch refused':<40} {same_script_ok}")
+    return ok and same_script_ok
+
+
+@benchmark("daemon")
+def bench_daemon(rounds: int = 200):
+    """本地翻译服务：一次本地往返的开销（与进程内翻译对比，缓存命中与未命中）"""
+    from engines import GoogleEngine
+    from segmenter import SegmentingEngine
+    from translation_cache import TranslationCache
+    from translation_daemon import DaemonClient, TranslationService, serve
+
+    ok = True
+    cache_dir = tempfile.mkdtemp(prefix="bench-daemon-")
+    try:
+        with FakeEngineServer() as server:
+            cache = TranslationCache(os.path.join(cache_dir, "cache.db"))
+            service = TranslationService(SegmentingEngine(GoogleEngine(base_url=server.url)), cache,
+                                         memory=_NoMemory())
+            daemon = serve(service, 0)
+            threading.Thread(target=daemon.serve_forever, daemon=True).start()
+            client = DaemonClient(daemon.server_address[1])
+
+            for label, translator in (("in-process", service), ("daemon", client)):
+                misses, hits = [], []
+                for i in range(rounds):
+                    text = f"{label} 第{i}句，今天下午三点开会。"
+                    start = time.perf_counter()
+                    translated = translator.translate(text, "zh-CN", "en")
+                    misses.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    again = translator.translate(text, "zh-CN", "en")
+                    hits.append(time.perf_counter() - start)
+                    ok = ok and translated == again == f"[en]{text}"
+                report(f"daemon {label} cache miss", misses)
+                report(f"daemon {label} cache hit", hits)
+            daemon.shutdown()
+            daemon.server_close()
+            cache.close()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # 旧版配置模板（"api_type": "deepl"、空密钥）不能把前端从默认引擎换成无法使用的DeepL
+    from engines import engine_names
+    legacy = {"api_type": "deepl", "api_key": ""}
+    resolved = (engine_names(legacy), engine_names(legacy, "deepl"),
+                engine_names(dict(legacy, api_key="bench:fx")))
+    resolved_ok = resolved == (["google"], ["deepl"], ["deepl"])
+    print(f"{'daemon engine for keyless api_type':<40} {resolved} ok={resolved_ok}")
+    return ok and resolved_ok
+
+
+# 端到端基准中模拟的窗口: (名称, 窗口类名, 标题, 输入框类名, 输入框的UI Automation类型)
+E2E_WINDOWS = [
+    ("word", "OpusApp", "文档1 - Word", "_WwG", "DocumentControl"),
+    ("notepad", "Notepad", "无标题 - 记事本", "Edit", None),
+    ("wechat", "WeChatMainWndForPC", "微信", "RICHEDIT50W", None),
+    ("qq", "TXGuiFoundation", "", "QQEdit", None),
+    ("dingtalk", "StandardFrame_DingTalk", None, None, None),
+    ("chrome", "Chrome_WidgetWin_1", "", "Chrome_RenderWidgetHostHWND", "EditControl"),
+    ("default", "SomeEditorWindow", "", None, None),
+]
+E2E_SIZES = (64, 1024, 16 * 1024)
+
+
+class _NoCache:
+    """不缓存，每次触发都完整走一遍翻译流程"""
+    def get(self, *args):
+        return None
+
+    def put(self, *args):
+        pass
+
+
+class _NoMemory:
+    """不使用翻译记忆"""
+    def lookup(self, *args):
+        return None
+
+    def add(self, *args):
+        pass
+
+    def stats(self):
+        return {}
+
+
+@benchmark("e2e")
+def bench_e2e(rounds: int = 10, latency: float = 0.002):
+    """快捷键按下到文本替换完成的端到端延迟（替身Win32层 + 本地翻译接口替身）
+
+    按处理器（Google引擎）和按引擎（记事本窗口）分别统计各阶段耗时：
+    dispatch 按键到开始处理（含防抖延时）、read 读取文本、translate 翻译、
+    replace 替换文本、total 总耗时。
+    """
+    import contextlib
+    import io
+    import fake_win32
+
+    desktop = fake_win32.install()
+    from pynput.keyboard import Key
+    from engines import DeepLEngine, GoogleEngine
+    from segmenter import SegmentingEngine
+    from simple_translator import SimpleTranslator
+    from translation_daemon import TranslationService
+    import uia_cache
+
+    class BenchTranslator(SimpleTranslator):
+        """记录各阶段耗时的翻译器"""
+        def __init__(self, engine):
+            self.bench_engine = engine
+            self.stages = {}
+            self.pressed_at = 0.0
+            self.done = threading.Event()
+            super().__init__()
+            for handler in self.handlers:
+                handler.get_text = self._timed("read", handler.get_text)
+                handler.set_text = self._timed("replace", handler.set_text)
+
+        def load_services(self):
+            self.translator = TranslationService(SegmentingEngine(self.bench_engine), _NoCache(),
+                                                 memory=_NoMemory())
+
+        def _timed(self, stage, func):
+            def wrapper(*args):
+                start = time.perf_counter()
+                try:
+                    return func(*args)
+                finally:
+                    self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+            return wrapper
+
+        def translate_text(self, text, window_key=None, source_lang=None):
+            return self._timed("translate", super().translate_text)(text, window_key, source_lang)
+
+        def handle_translation(self, job=None):
+            self.stages["dispatch"] = time.perf_counter() - self.pressed_at
+            try:
+                super().handle_translation(job)
+            finally:
+                self.stages["total"] = time.perf_counter() - self.pressed_at
+                self.done.set()
+
+        def trigger(self, hwnd: int) -> dict:
+            """模拟按下 Shift+F11，等待处理完成，返回各阶段耗时"""
+            self.stages = {}
+            self.last_text = None
+            self.translator.incremental.forget(hwnd)
+            self.done.clear()
+            desktop.foreground = hwnd
+            self.pressed_at = time.perf_counter()
+            self.on_press(Key.shift)
+            self.on_press(Key.f11)
+            self.on_release(Key.f11)
+            self.on_release(Key.shift)
+            if not self.done.wait(30):
+                raise RuntimeError("翻译超时")
+            return self.stages
+
+    def run(translator, window, size) -> tuple:
+        text = sample_text(size)
+        stages = {stage: [] for stage in ("dispatch", "read", "translate", "replace", "total")}
+        replaced = exact = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(rounds):
+                desktop.input_window(window.hwnd).text = text
+                for stage, elapsed in translator.trigger(window.hwnd).items():
+                    stages[stage].append(elapsed)
+                result = desktop.input_text(window.hwnd)
+                if result.startswith("[en]"):
+                    replaced += 1
+                    exact += result.replace("[en]", "") == text.strip()
+        return stages, replaced, exact
+
+    def summarize(label, stages, replaced, exact):
+        for stage, samples in stages.items():
+            report(f"{label} {stage}", samples)
+        # exact: 替换后的文本去掉替身译文标记后与原文一致（读取完整、没有截断）
+        print(f"{label + ' replaced':<40} {replaced}/{rounds} exact={exact}/{rounds}")
+        return replaced == rounds and exact == rounds
+
+    with FakeEngineServer(latency=latency) as server:
+        engines = {
+            "google": GoogleEngine(base_url=server.url),
+            "deepl": DeepLEngine(api_key="bench:fx", base_url=server.url),
+        }
+        translators = {name: BenchTranslator(engine) for name, engine in engines.items()}
+        for translator in translators.values():
+            translator.services.wait(5)
+        uia_ready = uia_cache.get_automation(5) is not None
+        windows = {}
+        for name, class_name, title, edit_class, control_type in E2E_WINDOWS:
+            windows[name] = desktop.create_app(class_name, title or "", edit_class, control_type)
+        print(f"UI Automation 替身: {'已加载' if uia_ready else '不可用'}")
+
+        ok = True
+        for name, window in windows.items():
+            for size in E2E_SIZES:
+                label = f"e2e {name}/google {size}B"
+                ok = summarize(label, *run(translators["google"], window, size)) and ok
+        # Google 已在按处理器统计中覆盖
+        for size in E2E_SIZES:
+            ok = summarize(f"e2e notepad/deepl {size}B",
+                           *run(translators["deepl"], windows["notepad"], size)) and ok
+
+    # 翻译进行中再次按下快捷键：前一个任务被取消，新任务仍须完成替换
+    with FakeEngineServer(latency=0.5) as server:
+        translator = BenchTranslator(GoogleEngine(base_url=server.url))
+        translator.services.wait(5)
+        window = windows["notepad"]
+        text = sample_text(64)
+        desktop.input_window(window.hwnd).text = text
+        desktop.foreground = window.hwnd
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.worker.submit(window.hwnd)
+            time.sleep(0.2)  # 第一个任务正在等待翻译结果
+            translator.worker.submit(window.hwnd)
+            give_up = time.monotonic() + 5
+            while not desktop.input_text(window.hwnd).startswith("[en]") \
+                    and time.monotonic() < give_up:
+                time.sleep(0.05)
+            translator.worker.stop()
+        resubmitted = desktop.input_text(window.hwnd).startswith("[en]")
+        print(f"{'e2e resubmit while translating':<40} replaced={resubmitted}")
+        ok = ok and resubmitted
+    # 任何一次替换失败或文本不完整都算失败
+    return ok
+
+
+def check_regressions(baseline: Dict[str, dict], threshold: float, slack_ms: float,
+                      metric: str = "p50") -> List[str]:
+    """与基线比较，返回超出 基线*(1+threshold)+slack_ms 的条目"""
+    regressions = []
+    for label, stats in RESULTS.items():
+        base = baseline.get(label)
+        if base is None:
+            continue
+        limit = base[metric] * (1 + threshold) + slack_ms
+        if stats[metric] > limit:
+            regressions.append(f"{label}: {metric} {stats[metric]:.3f}ms > {limit:.3f}ms "
+                               f"(基线 {base[metric]:.3f}ms)")
+    return regressions
+
+
+@benchmark("hang")
+def bench_hang(rounds: int = 5, budget: float = 0.2):
+    """目标程序卡死时的读取耗时（替身Win32层）
+
+    首次调用在时间预算内失败并把窗口加入黑名单，之后的调用立即失败；
+    其他正常窗口不受影响（UI Automation 换用新的工作线程）。
+    """
+    import contextlib
+    import io
+    import fake_win32
+
+    desktop = fake_win32.install()
+    import win32_calls
+    from simple_translator import ChromeHandler, NotepadHandler
+
+    notepad = desktop.create_app("Notepad", "无标题 - 记事本", "Edit")
+    chrome = desktop.create_app("Chrome_WidgetWin_1", "", "Chrome_RenderWidgetHostHWND",
+                                "EditControl")
+    healthy = desktop.create_app("Chrome_WidgetWin_1", "", "Chrome_RenderWidgetHostHWND",
+                                 "EditControl")
+    desktop.input_window(healthy.hwnd).text = "still responsive"
+    handlers = {"message": NotepadHandler(), "uia": ChromeHandler()}
+    first = {"message": [], "uia": []}
+    blacklisted = {"message": [], "uia": []}
+    healthy_ok = True
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            win32_calls.hung_windows.clear()
+            desktop.hang(notepad.hwnd)
+            desktop.hang(chrome.hwnd)
+            for kind, hwnd in (("message", notepad.hwnd), ("uia", chrome.hwnd)):
+                desktop.foreground = hwnd
+                start = time.perf_counter()
+                try:
+                    if kind == "message":
+                        win32_calls.get_text(desktop.input_window(hwnd).hwnd, timeout=budget)
+                    else:
+                        win32_calls.call_uia(hwnd, handlers[kind].read_value, hwnd,
+                                             timeout=budget)
+                except win32_calls.WindowTimeout:
+                    pass
+                first[kind].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                handlers[kind].peek_text(hwnd)
+                blacklisted[kind].append(time.perf_counter() - start)
+            desktop.foreground = healthy.hwnd
+            healthy_ok &= handlers["uia"].peek_text(healthy.hwnd) == "still responsive"
+            desktop.resume(notepad.hwnd)
+            desktop.resume(chrome.hwnd)
+        win32_calls.hung_windows.clear()
+
+    for kind in first:
+        report(f"hang {kind} first call (budget {budget * 1000:.0f}ms)", first[kind])
+        report(f"hang {kind} blacklisted", blacklisted[kind])
+    print(f"{'hang healthy window':<40} {'ok' if healthy_ok else 'FAILED'} "
+          f"(abandoned uia threads: {win32_calls.uia_worker.abandoned})")
+    return healthy_ok and all(max(samples) < budget * 2 for samples in first.values()) \
+        and all(max(samples) < 0.01 for samples in blacklisted.values())
+
+
+@benchmark("largetext")
+def bench_largetext(size: int = 8 * 1024 * 1024):
+    """读取超大编辑框文本的耗时和内存峰值（替身Win32层）
+
+    tobytes: 一次 WM_GETTEXT 后 tobytes() 再解码（原来的方式）；
+    memoryview: win32_calls.get_text，直接从缓冲区解码；
+    stream: 逐块处理 win32_calls.iter_text，不保留整个文档（每行两条消息，耗时更长，
+    在翻译流水线中与翻译重叠）。
+    替身的 WM_GETTEXT 自身会编码一份完整文本，计入前两种方式的峰值。
+    e2e: SimpleTranslator.translate_large 的整个过程（读取、翻译、核对原文、写回），
+    stream write 分块写回，single write 为编辑框长度上限不够时的一次性写回。
+    """
+    import contextlib
+    import gc
+    import io
+    import types
+    import tracemalloc
+    import fake_win32
+
+    desktop = fake_win32.install()
+    import win32_calls
+    import win32con
+    import win32gui
+
+    window = desktop.create_app("Notepad", "large.log - 记事本", "Edit")
+    edit = desktop.input_window(window.hwnd)
+    edit.text = sample_text(size).replace("\n", "\r\n")
+    length = len(edit.text)
+
+    def tobytes() -> int:
+        buffer = win32gui.PyMakeBuffer((length + 1) * 2)
+        win32gui.SendMessage(edit.hwnd, win32con.WM_GETTEXT, length + 1, buffer)
+        return len(buffer[:length * 2].tobytes().decode("utf-16-le"))
+
+    def memoryview_() -> int:
+        return len(win32_calls.get_text(edit.hwnd))
+
+    def stream() -> int:
+        return sum(len(chunk) for chunk in win32_calls.iter_text(edit.hwnd))
+
+    edit.lines()  # 替身的行表只建一次，不计入
+    ok = True
+    for name, read in (("tobytes", tobytes), ("memoryview", memoryview_), ("stream", stream)):
+        gc.collect()
+        start = time.perf_counter()
+        chars = read()
+        elapsed = time.perf_counter() - start
+        # 内存峰值单独测一次（tracemalloc 会显著拖慢逐行读取）
+        tracemalloc.start()
+        read()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        ok &= chars == length
+        print(f"{'largetext ' + name + ' ' + str(length) + ' chars':<40} "
+              f"{elapsed * 1000:8.1f}ms peak={peak / 1024 / 1024:7.2f}MB")
+
+    # 端到端：分块读取 + 翻译 + 核对原文 + 写回。替身编辑框的文本在本进程中，
+    # 峰值按每条窗口消息发出时的内存采样，扣除替身程序持有的文本
+    from simple_translator import SimpleTranslator, WindowHandler
+
+    class EditHandler(WindowHandler):
+        """一次性写回时直接 WM_SETTEXT（不走剪贴板，采样才能看到整个译文）"""
+        def set_text(self, hwnd, text):
+            return win32_calls.set_text(edit.hwnd, text)
+
+    class Echo:
+        def translate(self, text, source_lang, target_lang):
+            return f"[en]{text}"
+
+    class LargeTextTranslator(SimpleTranslator):
+        def __init__(self):
+            self.services = types.SimpleNamespace(wait=lambda timeout: True)
+            self.translator = Echo()
+            self.source_lang, self.target_lang = "auto", "en"
+
+    source = edit.text
+    translator = LargeTextTranslator()
+    send_message = win32gui.SendMessageTimeout
+    peak = [0, 0]  # 基准值, 峰值
+
+    def sampled(*args):
+        current = tracemalloc.get_traced_memory()[0] - edit.resident_bytes(exclude=(source,))
+        peak[1] = max(peak[1], current - peak[0])
+        return send_message(*args)
+
+    win32gui.SendMessageTimeout = sampled
+    try:
+        # 记事本取消了长度上限，分块写回；默认上限（30000）时退回一次性写回
+        for name, limit in (("stream write", 0x7FFFFFFE), ("single write", 30000)):
+            edit.text_limit = limit
+            desktop.foreground = window.hwnd
+            timings = []
+            for traced in (False, True):
+                edit.text = source
+                edit.lines()
+                gc.collect()
+                if traced:
+                    tracemalloc.start()
+                    peak[:] = [tracemalloc.get_traced_memory()[0], 0]
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    translator.translate_large(None, window.hwnd, EditHandler(), edit.hwnd, length)
+                timings.append(time.perf_counter() - start)
+                if traced:
+                    tracemalloc.stop()
+                ok &= edit.text.replace("[en]", "") == source
+            print(f"{'largetext e2e ' + name + ' ' + str(length) + ' chars':<40} "
+                  f"{timings[0] * 1000:8.1f}ms peak={peak[1] / 1024 / 1024:7.2f}MB")
+    finally:
+        win32gui.SendMessageTimeout = send_message
+
+    # 翻译期间修改了已经读过的部分（开头）：不能覆盖修改
+    edit.text = source
+    edited = "!" + source[1:]
+
+    class EditingEcho(Echo):
+        def translate(self, text, source_lang, target_lang):
+            edit.text = edited
+            return super().translate(text, source_lang, target_lang)
+
+    translator.translator = EditingEcho()
+    with contextlib.redirect_stdout(io.StringIO()):
+        translator.translate_large(None, window.hwnd, EditHandler(), edit.hwnd, length)
+    kept = edit.text == edited
+    print(f"{'largetext edited during translation kept':<40} {kept}")
+    return ok and kept
+
+
+@benchmark("protect")
+def bench_protect(size: int = 16 * 1024 * 1024, rounds: int = 3):
+    """受保护片段：在大型聊天记录导出上的扫描/还原吞吐量，以及发送给引擎的字符减少比例"""
+    import random
+    from protected_spans import protect
+
+    rng = random.Random(23)
+    messages = [
+        "今天下午三点开会，请大家准时参加。",
+        "The build is green again, please rebase before merging.",
+        "看下这个 https://github.com/example/project/pull/{n}/files?diff=split 有问题吗",
+        "@张三\u2005报错日志在 C:\\Users\\dev\\logs\\app-{n}.log 里",
+        "run `pip install -r requirements.txt` then /usr/local/bin/app --port {n}",
+        "哈哈哈😂😂 [捂脸]",
+        "[通知] 明天停电，请提前保存文件",
+        "👍🏽",
+        "发邮件给 ops{n}@example.com 抄送 @李四 谢谢",
+        "https://example.com/share/{n}",
+        "```\nTraceback (most recent call last):\n  File \"app.py\", line {n}\n```",
+    ]
+    lines = []
+    total = 0
+    while total < size:
+        line = f"2024-05-{rng.randint(1, 28):02d} 10:{rng.randint(0, 59):02d} 用户{rng.randint(1, 50)}: " \
+               + rng.choice(messages).format(n=rng.randint(1, 99999))
+        lines.append(line)
+        total += len(line.encode("utf-8")) + 1
+    export = "\n".join(lines)
+    megabytes = len(export.encode("utf-8")) / 1024 / 1024
+
+    # 对比：不整段跳过普通文本，在每个字符处尝试所有模式
+    import re
+    import protected_spans
+    naive = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern
+                                in protected_spans._SPANS), re.S)
+    start = time.perf_counter()
+    naive_spans = sum(1 for _ in naive.finditer(export))
+    elapsed = time.perf_counter() - start
+    print(f"{'protect scan (every position) ' + format(megabytes, '.0f') + 'MB':<40} "
+          f"{elapsed * 1000:8.1f}ms {megabytes / elapsed:7.1f}MB/s")
+
+    scans, restores = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        masked = protect(export)
+        scans.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        restored = masked.restore(masked.text)
+        restores.append(time.perf_counter() - start)
+    scan, restore = min(scans), min(restores)
+    print(f"{'protect scan ' + format(megabytes, '.0f') + 'MB':<40} {scan * 1000:8.1f}ms "
+          f"{megabytes / scan:7.1f}MB/s")
+    print(f"{'protect restore ' + format(megabytes, '.0f') + 'MB':<40} {restore * 1000:8.1f}ms "
+          f"{megabytes / restore:7.1f}MB/s")
+
+    # 逐条消息：实际使用时每次翻译一条
+    samples = []
+    sent = skipped = 0
+    sample = lines[:20000]
+    for line in sample:
+        message = line.split(": ", 1)[1]
+        start = time.perf_counter()
+        masked = protect(message)
+        translatable = masked.translatable
+        samples.append(time.perf_counter() - start)
+        if translatable:
+            sent += len(masked.text)
+        else:
+            skipped += 1
+    report("protect per message", samples)
+    original = sum(len(line.split(": ", 1)[1]) for line in sample)
+    print(f"{'protect chars sent':<40} {sent / original * 100:7.1f}% of {original}, "
+          f"engine calls skipped {skipped}/{len(sample)}")
+    spans = sum(1 for match in protected_spans._PATTERN.finditer(export) if match.lastgroup != "plain")
+    # 表情名称以外的方括号标签照常翻译
+    tags_ok = not protect("[通知] 明天下午三点开会 [紧急]").spans
+    return restored == export and spans == naive_spans and tags_ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    parser.add_argument("names", nargs="*", help=f"要运行的基准（{', '.join(BENCHMARKS)}）")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="基线结果文件")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果写入基线文件")
+    parser.add_argument("--metric", choices=("p50", "p95", "p99"), default="p50",
+                        help="与基线比较的统计量")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="相对基线允许的增幅（0.5 表示 50%%）")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="允许的绝对增量（毫秒）")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"未知的基准: {', '.join(unknown)}；可用: {', '.join(BENCHMARKS)}")
+        return 2
+    failed = False
+    for name in names:
+        print(f"== {name} ==")
+        if BENCHMARKS[name]() is False:
+            failed = True
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline.update(RESULTS)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"基线已保存到 {args.baseline}（{len(RESULTS)} 项）")
+    elif baseline:
+        regressions = check_regressions(baseline, args.threshold, args.slack_ms, args.metric)
+        for line in regressions:
+            print(f"✗ 性能回退 {line}")
+        if regressions:
+            failed = True
+        else:
+            print(f"✓ 与基线相比无性能回退（{len(RESULTS)} 项）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""事件驱动的剪贴板复制/粘贴
+
+复制时等待剪贴板序列号变化（或 WM_CLIPBOARDUPDATE 通知），
+粘贴时使用延迟渲染，目标程序真正读取剪贴板时才算粘贴完成，
+因此不再需要固定的 time.sleep。
+"""
+import threading
+import time
+from typing import Optional
+
+from metrics import metrics
+
+
+class ClipboardBackend:
+    """剪贴板与按键注入的后端接口"""
+
+    def sequence_number(self) -> int:
+        """剪贴板序列号，内容每变化一次加一"""
+        raise NotImplementedError
+
+    def get_text(self) -> Optional[str]:
+        raise NotImplementedError
+
+    def set_text(self, text: Optional[str]):
+        """设置剪贴板文本，None表示清空"""
+        raise NotImplementedError
+
+    def offer_text(self, text: str):
+        """提供待粘贴文本；支持延迟渲染的后端在目标读取时才写入"""
+        self.set_text(text)
+
+    def activate(self, hwnd: int, timeout: float) -> bool:
+        """激活目标窗口并等待其成为前台窗口"""
+        raise NotImplementedError
+
+    def send_chord(self, key: str):
+        """发送 Ctrl+key"""
+        raise NotImplementedError
+
+    def wait_for_update(self, since: int, timeout: float) -> bool:
+        """等待剪贴板序列号变化（默认轮询实现）"""
+        deadline = time.perf_counter() + timeout
+        while self.sequence_number() == since:
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def wait_for_paste(self, timeout: float) -> Optional[bool]:
+        """等待目标程序读取剪贴板；后端不支持时返回None"""
+        return None
+
+
+class Win32ClipboardBackend(ClipboardBackend):
+    """Windows实现：隐藏窗口监听 WM_CLIPBOARDUPDATE 并处理延迟渲染"""
+    def __init__(self):
+        import win32api
+        import win32clipboard
+        import win32con
+        import win32gui
+        self.win32api = win32api
+        self.win32clipboard = win32clipboard
+        self.win32con = win32con
+        self.win32gui = win32gui
+        self.owner_hwnd = None
+        self._pending_text = None
+        self._updated = threading.Event()
+        self._rendered = threading.Event()
+        self._ready = threading.Event()
+        threading.Thread(target=self._owner_loop, name="clipboard-owner", daemon=True).start()
+        self._ready.wait(1.0)
+
+    def _owner_loop(self):
+        """剪贴板所有者窗口的消息循环"""
+        from ctypes import windll
+        try:
+            wc = self.win32gui.WNDCLASS()
+            wc.lpfnWndProc = self._wndproc
+            wc.lpszClassName = "PotTranslatorClipboardOwner"
+            wc.hInstance = self.win32api.GetModuleHandle(None)
+            atom = self.win32gui.RegisterClass(wc)
+            self.owner_hwnd = self.win32gui.CreateWindow(
+                atom, "", 0, 0, 0, 0, 0, self.win32con.HWND_MESSAGE, 0, wc.hInstance, None
+            )
+            windll.user32.AddClipboardFormatListener(self.owner_hwnd)
+        except Exception as e:
+            print(f"创建剪贴板监听窗口失败，改用轮询: {e}")
+            self.owner_hwnd = None
+            return
+        finally:
+            self._ready.set()
+        self.win32gui.PumpMessages()
+
+    def _wndproc(self, hwnd, msg, wparam, lparam):
+        if msg == 0x031D:  # WM_CLIPBOARDUPDATE
+            self._updated.set()
+            return 0
+        if msg == self.win32con.WM_RENDERFORMAT:
+            # 目标程序正在读取剪贴板，此时不需要也不能打开剪贴板
+            if wparam == self.win32con.CF_UNICODETEXT and self._pending_text is not None:
+                self.win32clipboard.SetClipboardData(self.win32con.CF_UNICODETEXT,
+                                                     self._pending_text)
+            self._rendered.set()
+            return 0
+        if msg == self.win32con.WM_RENDERALLFORMATS:
+            # 程序退出前把延迟渲染的数据实际写入
+            if self._pending_text is not None:
+                self.win32clipboard.OpenClipboard(hwnd)
+                self.win32clipboard.SetClipboardData(self.win32con.CF_UNICODETEXT,
+                                                     self._pending_text)
+                self.win32clipboard.CloseClipboard()
+            return 0
+        return self.win32gui.DefWindowProc(hwnd, msg, wparam, lparam)
+
+    def sequence_number(self) -> int:
+        return self.win32clipboard.GetClipboardSequenceNumber()
+
+    def get_text(self) -> Optional[str]:
+        self.win32clipboard.OpenClipboard()
+        try:
+            return self.win32clipboard.GetClipboardData(self.win32con.CF_UNICODETEXT)
+        except Exception:
+            return None
+        finally:
+            self.win32clipboard.CloseClipboard()
+
+    def set_text(self, text: Optional[str]):
+        self._pending_text = None
+        self.win32clipboard.OpenClipboard()
+        try:
+            self.win32clipboard.EmptyClipboard()
+            if text:
+                self.win32clipboard.SetClipboardText(text, self.win32con.CF_UNICODETEXT)
+        finally:
+            self.win32clipboard.CloseClipboard()
+
+    def offer_text(self, text: str):
+        if self.owner_hwnd is None:
+            self.set_text(text)
+            return
+        from ctypes import windll
+        self._pending_text = text
+        self._rendered.clear()
+        self.win32clipboard.OpenClipboard(self.owner_hwnd)
+        try:
+            self.win32clipboard.EmptyClipboard()
+            # 数据句柄为NULL：延迟渲染，目标读取时收到 WM_RENDERFORMAT
+            windll.user32.SetClipboardData(self.win32con.CF_UNICODETEXT, None)
+        finally:
+            self.win32clipboard.CloseClipboard()
+
+    def activate(self, hwnd: int, timeout: float) -> bool:
+        if self.win32gui.GetForegroundWindow() == hwnd:
+            return True
+        self.win32gui.SetForegroundWindow(hwnd)
+        deadline = time.perf_counter() + timeout
+        while self.win32gui.GetForegroundWindow() != hwnd:
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.002)
+        return True
+
+    def send_chord(self, key: str):
+        vk = ord(key.upper())
+        keybd_event = self.win32api.keybd_event
+        keybd_event(self.win32con.VK_CONTROL, 0, 0, 0)
+        keybd_event(vk, 0, 0, 0)
+        keybd_event(vk, 0, self.win32con.KEYEVENTF_KEYUP, 0)
+        keybd_event(self.win32con.VK_CONTROL, 0, self.win32con.KEYEVENTF_KEYUP, 0)
+
+    def wait_for_update(self, since: int, timeout: float) -> bool:
+        if self.owner_hwnd is None:
+            return super().wait_for_update(since, timeout)
+        deadline = time.perf_counter() + timeout
+        while self.sequence_number() == since:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self._updated.wait(remaining)
+            self._updated.clear()
+        return True
+
+    def wait_for_paste(self, timeout: float) -> Optional[bool]:
+        if self.owner_hwnd is None:
+            return None
+        return self._rendered.wait(timeout)
+
+
+class SimulatedClipboard(ClipboardBackend):
+    """模拟剪贴板和目标程序，用于在非Windows平台测试和基准测试
+
+    copy_delay/paste_delay 为目标程序响应 Ctrl+C/Ctrl+V 的耗时，
+    设为None表示目标程序无响应。
+    """
+    def __init__(self, content: str = "", copy_delay: Optional[float] = 0.01,
+                 paste_delay: Optional[float] = 0.01, activate_delay: float = 0.0):
+        self.content = content  # 目标输入框中的文本
+        self.copy_delay = copy_delay
+        self.paste_delay = paste_delay
+        self.activate_delay = activate_delay
+        self.foreground = None
+        self.selected = False
+        self._text: Optional[str] = None
+        self._sequence = 1
+        self._offered: Optional[str] = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._rendered = threading.Event()
+
+    def sequence_number(self) -> int:
+        with self._lock:
+            return self._sequence
+
+    def get_text(self) -> Optional[str]:
+        with self._lock:
+            return self._text
+
+    def set_text(self, text: Optional[str]):
+        with self._lock:
+            self._text = text
+            self._offered = None
+            self._sequence += 1
+            self._changed.notify_all()
+
+    def offer_text(self, text: str):
+        with self._lock:
+            self._text = None
+            self._offered = text
+            self._sequence += 1
+            self._rendered.clear()
+            self._changed.notify_all()
+
+    def activate(self, hwnd: int, timeout: float) -> bool:
+        if self.activate_delay > timeout:
+            time.sleep(timeout)
+            return False
+        time.sleep(self.activate_delay)
+        self.foreground = hwnd
+        return True
+
+    def send_chord(self, key: str):
+        key = key.upper()
+        if key == "A":
+            self.selected = True
+        elif key == "C" and self.copy_delay is not None:
+            self._later(self.copy_delay, self._app_copy)
+        elif key == "V" and self.paste_delay is not None:
+            self._later(self.paste_delay, self._app_paste)
+
+    def _later(self, delay: float, action):
+        timer = threading.Timer(delay, action)
+        timer.daemon = True
+        timer.start()
+
+    def _app_copy(self):
+        self.set_text(self.content if self.selected else "")
+
+    def _app_paste(self):
+        with self._lock:
+            pasted = self._offered if self._offered is not None else self._text
+            if self._offered is not None:
+                self._text, self._offered = self._offered, None
+                self._rendered.set()
+        if pasted is not None:
+            self.content = pasted if self.selected else self.content + pasted
+
+    def wait_for_update(self, since: int, timeout: float) -> bool:
+        with self._lock:
+            return self._changed.wait_for(lambda: self._sequence != since, timeout)
+
+    def wait_for_paste(self, timeout: float) -> Optional[bool]:
+        return self._rendered.wait(timeout)
+
+
+class ClipboardTransfer:
+    """通过剪贴板读取/替换输入框全部文本，并恢复原剪贴板内容"""
+    def __init__(self, backend: Optional[ClipboardBackend] = None, timeout: float = 0.5,
+                 paste_grace: float = 0.1):
+        self.backend = backend
+        self.timeout = timeout
+        self.paste_grace = paste_grace  # 无法确认粘贴时，恢复剪贴板前的等待
+        self.timeouts = 0
+
+    def _backend(self) -> ClipboardBackend:
+        if self.backend is None:
+            self.backend = Win32ClipboardBackend()
+        return self.backend
+
+    def _restore(self, original: Optional[str]):
+        try:
+            self._backend().set_text(original)
+        except Exception as e:
+            print(f"恢复剪贴板错误: {e}")
+
+    def copy_all(self, hwnd: int) -> str:
+        """Ctrl+A、Ctrl+C 读取目标输入框的全部文本"""
+        with metrics.span("clipboard", op="copy"):
+            return self._copy_all(hwnd)
+
+    def _copy_all(self, hwnd: int) -> str:
+        backend = self._backend()
+        original = None
+        try:
+            original = backend.get_text()
+            if not backend.activate(hwnd, self.timeout):
+                print("激活窗口超时")
+                return ""
+            since = backend.sequence_number()
+            backend.send_chord("A")
+            backend.send_chord("C")
+            if not backend.wait_for_update(since, self.timeout):
+                self.timeouts += 1
+                metrics.inc("clipboard_timeouts", op="copy")
+                print("等待复制超时")
+                return ""
+            return backend.get_text() or ""
+        except Exception as e:
+            print(f"剪贴板操作错误: {e}")
+            return ""
+        finally:
+            self._restore(original)
+
+    def paste_all(self, hwnd: int, text: str) -> bool:
+        """Ctrl+A、Ctrl+V 用text替换目标输入框的全部文本
+
+        未能确认目标程序已粘贴时返回False（译文留在剪贴板中），调用方按替换失败处理。
+        """
+        with metrics.span("clipboard", op="paste"):
+            return self._paste_all(hwnd, text)
+
+    def _paste_all(self, hwnd: int, text: str) -> bool:
+        backend = self._backend()
+        try:
+            original = backend.get_text()
+            backend.offer_text(text)
+            if not backend.activate(hwnd, self.timeout):
+                print("激活窗口超时")
+                self._restore(original)
+                return False
+            backend.send_chord("A")
+            backend.send_chord("V")
+            landed = backend.wait_for_paste(self.timeout)
+            if landed is None:
+                time.sleep(self.paste_grace)
+                landed = True
+            if landed:
+                self._restore(original)
+            else:
+                # 无法确认目标已粘贴：保留译文在剪贴板中，避免粘贴成原剪贴板内容
+                self.timeouts += 1
+                metrics.inc("clipboard_timeouts", op="paste")
+                print("未确认粘贴完成，译文保留在剪贴板中")
+            return landed
+        except Exception as e:
+            print(f"剪贴板设置文本错误: {e}")
+            return False
+
+
+_default_transfer = None
+
+
+def get_clipboard_transfer() -> ClipboardTransfer:
+    """获取共享的剪贴板传输对象"""
+    global _default_transfer
+    if _default_transfer is None:
+        _default_transfer = ClipboardTransfer()
+    return _default_transfer
@@ -0,0 +1,344 @@
+"""本地离线词典（基于ECDICT）
+
+一两个词的查询不必请求网络引擎。先把ECDICT的CSV转换为只读的索引文件:
+
+    python dictionary.py build ecdict.csv ecdict.idx
+    python dictionary.py lookup ecdict.idx 苹果
+
+然后在 translator_config.json 中配置 "dictionary": "ecdict.idx"，短文本会先查词典，
+未命中时再交给网络引擎。
+
+索引文件以mmap只读映射，打开时不读取内容，多个进程共享操作系统的页缓存。
+文件布局（小端）:
+    头部: 魔数(8字节) 英汉条目数 汉英条目数 英汉偏移表位置 汉英偏移表位置（各u32）
+    条目: 键(UTF-8) \\t 值(UTF-8) \\n，按键的字节序排列
+    偏移表: 每个条目的起始位置（u32）
+查找时在偏移表上二分查找，每次比较只切出一个键。
+"""
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from engines import EngineError, TranslationEngine
+from metrics import metrics
+
+MAGIC = b"ECDIDX\x01\x00"
+_HEADER = struct.Struct("<8s4I")
+_OFFSET = struct.Struct("<I")
+
+# 查询前去掉的首尾标点；中文句末标点在英文译文中换成对应的英文标点
+_STRIP = " \t\r\n.,!?;:。，！？；：、\"'“”‘’()（）《》"
+_SUFFIX_MAP = {"。": ".", "！": "!", "？": "?", "!": "!", "?": "?", ".": "."}
+
+_POS_PREFIX = re.compile(r"^(?:[a-z]+\.\s*)+")
+_NOTES = re.compile(r"[（(][^）)]*[）)]|<[^>]*>")
+_TERM_SEPARATORS = re.compile(r"[,;，；、]")
+_CHINESE_TERM = re.compile(r"^[一-鿿]{1,8}$")
+_ENGLISH_WORD = re.compile(r"^[A-Za-z][A-Za-z' .-]*$")
+_UNKNOWN_RANK = 10 ** 7
+
+
+def _primary(code: Optional[str]) -> str:
+    return (code or "auto").strip().lower().replace("_", "-").split("-")[0]
+
+
+def normalize(text: str, language: str) -> str:
+    """查询键：去掉首尾标点，英文转小写并合并空白"""
+    text = text.strip(_STRIP)
+    if language == "en":
+        return " ".join(text.lower().split())
+    return text
+
+
+class DictionaryIndex:
+    """只读的词典索引（mmap）"""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, en_count, zh_count, en_table, zh_table = _HEADER.unpack_from(self._mm, 0)
+        except (ValueError, struct.error) as e:
+            self._file.close()
+            raise ValueError(f"无效的词典索引: {path}") from e
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"无效的词典索引: {path}")
+        self._sections = {"en": (en_count, en_table), "zh": (zh_count, zh_table)}
+
+    def __len__(self) -> int:
+        return sum(count for count, _ in self._sections.values())
+
+    def get(self, section: str, key: str) -> Optional[str]:
+        """按键查找（section 为 "en" 英汉 或 "zh" 汉英），没有时返回None"""
+        count, table = self._sections[section]
+        target = key.encode("utf-8")
+        mm = self._mm
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = _OFFSET.unpack_from(mm, table + 4 * mid)[0]
+            if mm[offset:mm.find(b"\t", offset)] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == count:
+            return None
+        offset = _OFFSET.unpack_from(mm, table + 4 * lo)[0]
+        separator = mm.find(b"\t", offset)
+        if mm[offset:separator] != target:
+            return None
+        return mm[separator + 1:mm.find(b"\n", separator)].decode("utf-8")
+
+    def close(self):
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+        self._file.close()
+
+
+def _rank(row: dict) -> int:
+    """词频排名（越小越常用），没有词频信息时为 _UNKNOWN_RANK"""
+    ranks = []
+    for column in ("frq", "bnc"):
+        try:
+            value = int(row.get(column) or 0)
+        except ValueError:
+            value = 0
+        if value > 0:
+            ranks.append(value)
+    return min(ranks) if ranks else _UNKNOWN_RANK
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except ValueError:
+        return 0
+
+
+def _translation_terms(translation: str) -> Iterator[Tuple[int, int, str]]:
+    """拆分ECDICT的translation字段，产出 (义项序号, 词序号, 中文词)"""
+    lines = translation.replace("\\n", "\n").split("\n")
+    for line_index, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith("["):
+            continue  # 跳过 [医] [计] 之类的专业义项
+        line = _NOTES.sub("", _POS_PREFIX.sub("", line))
+        for term_index, term in enumerate(_TERM_SEPARATORS.split(line)):
+            term = term.strip()
+            if term:
+                yield line_index, term_index, term
+
+
+def build_index(csv_path: str, index_path: str) -> Tuple[int, int]:
+    """由ECDICT的CSV生成索引文件，返回 (英汉条目数, 汉英条目数)
+
+    英汉取第一个义项的第一个中文词（并为词形变化添加条目）；
+    汉英为每个中文词选出最合适的英文词：优先是该英文词的首要释义，其次按柯林斯星级、
+    牛津核心词和词频排序。
+    """
+    english: Dict[str, Tuple[tuple, str]] = {}
+    chinese: Dict[str, Tuple[tuple, str]] = {}
+    forms = []
+
+    def offer(table: dict, key: str, score: tuple, value: str):
+        current = table.get(key)
+        if current is None or score < current[0]:
+            table[key] = (score, value)
+
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            word = (row.get("word") or "").strip()
+            if not _ENGLISH_WORD.match(word):
+                continue
+            rank = _rank(row)
+            collins = _int(row.get("collins"))
+            oxford = _int(row.get("oxford"))
+            first = None
+            for line_index, term_index, term in _translation_terms(row.get("translation") or ""):
+                if first is None:
+                    first = term
+                if not _CHINESE_TERM.match(term):
+                    continue
+                if rank == _UNKNOWN_RANK and not collins and not oxford:
+                    continue  # 生僻词不作为汉英结果
+                position = 0 if line_index == 0 and term_index == 0 else (1 if line_index == 0 else 2)
+                offer(chinese, term, (position, -collins, -oxford, rank, len(word)), word)
+            if first is None:
+                continue
+            key = normalize(word, "en")
+            offer(english, key, (0, rank), first)
+            # 词形变化（复数、过去式等），例如 "s:apples/p:went"
+            for item in (row.get("exchange") or "").split("/"):
+                kind, _, form = item.partition(":")
+                if form and kind in "pdi3sr" and _ENGLISH_WORD.match(form):
+                    forms.append((normalize(form, "en"), (1, rank), first))
+
+    for key, score, value in forms:
+        offer(english, key, score, value)
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(b"\0" * _HEADER.size)
+        tables = []
+        for table in (english, chinese):
+            offsets = []
+            for key in sorted(table, key=lambda k: k.encode("utf-8")):
+                value = table[key][1].replace("\t", " ").replace("\n", " ")
+                offsets.append(out.tell())
+                out.write(key.encode("utf-8") + b"\t" + value.encode("utf-8") + b"\n")
+            tables.append(offsets)
+        positions = []
+        for offsets in tables:
+            positions.append(out.tell())
+            out.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+        if out.tell() >= 2 ** 32:
+            raise ValueError("词典索引超过4GB")
+        out.seek(0)
+        out.write(_HEADER.pack(MAGIC, len(tables[0]), len(tables[1]), *positions))
+    os.replace(tmp_path, index_path)
+    return len(english), len(chinese)
+
+
+class DictionaryEngine(TranslationEngine):
+    """离线词典引擎：英汉、汉英的单词和短语查询，未收录时抛出EngineError"""
+    name = "ecdict"
+    max_chars = 64
+
+    def __init__(self, index: DictionaryIndex):
+        self.index = index
+
+    def lookup(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """查词典，未收录或语言方向不支持时返回None"""
+        source, target = _primary(source_lang), _primary(target_lang)
+        if target == "zh" and source in ("auto", "en"):
+            key = normalize(text, "en")
+            return self.index.get("en", key) if key else None
+        if target == "en" and source in ("auto", "zh"):
+            key = normalize(text, "zh")
+            if not key:
+                return None
+            translated = self.index.get("zh", key)
+            suffix = _SUFFIX_MAP.get(text.rstrip()[-1:])
+            if translated and suffix:
+                translated += suffix
+            return translated
+        return None
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        translated = self.lookup(text, source_lang, target_lang)
+        if translated is None:
+            raise EngineError("词典中没有该词条", reason="miss")
+        return translated
+
+
+class LocalFirstEngine(TranslationEngine):
+    """短文本先查本地词典，未命中时交给网络引擎"""
+    def __init__(self, dictionary: DictionaryEngine, engine: TranslationEngine,
+                 max_words: int = 2, short_chars: int = 24):
+        self.dictionary = dictionary
+        self.engine = engine
+        self.name = engine.name
+        self.max_chars = engine.max_chars
+        self.max_batch = engine.max_batch
+        self.max_words = max_words
+        self.short_chars = short_chars
+
+    @property
+    def available(self) -> bool:
+        return getattr(self.engine, "available", True)
+
+    def is_short(self, text: str) -> bool:
+        """不超过max_words个词的单行短文本"""
+        text = text.strip()
+        return (0 < len(text) <= self.short_chars and "\n" not in text
+                and len(text.split()) <= self.max_words)
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  timeout: float = 5.0) -> Optional[str]:
+        if self.is_short(text):
+            translated = self.dictionary.lookup(text, source_lang, target_lang)
+            metrics.inc("dictionary_lookups", result="hit" if translated else "miss")
+            if translated:
+                return translated
+        return self.engine.translate(text, source_lang, target_lang, timeout)
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                        timeout: float = 5.0) -> List[Optional[str]]:
+        """词典命中的短文本不进入批量请求，其余交给网络引擎"""
+        results: List[Optional[str]] = [None] * len(texts)
+        remaining = []
+        for index, text in enumerate(texts):
+            translated = None
+            if self.is_short(text):
+                translated = self.dictionary.lookup(text, source_lang, target_lang)
+                metrics.inc("dictionary_lookups", result="hit" if translated else "miss")
+            if translated:
+                results[index] = translated
+            else:
+                remaining.append(index)
+        if remaining:
+            translations = self.engine.translate_batch(
+                [texts[index] for index in remaining], source_lang, target_lang, timeout)
+            for index, translated in zip(remaining, translations):
+                results[index] = translated
+        return results
+
+    def warm_up(self):
+        self.engine.warm_up()
+
+
+def with_dictionary(engine: TranslationEngine, config: dict) -> TranslationEngine:
+    """按配置在引擎前加上本地词典；词典无法打开时返回原引擎
+
+    相关配置项:
+        dictionary: 索引文件路径（python dictionary.py build 生成）
+        dictionary_max_words: 不超过多少个词的文本先查词典，默认2
+    """
+    path = config.get("dictionary")
+    if not path:
+        return engine
+    try:
+        index = DictionaryIndex(path)
+    except (OSError, ValueError) as e:
+        print(f"加载词典失败: {e}")
+        return engine
+    print(f"✓ 已加载本地词典: {path}（{len(index)} 条）")
+    return LocalFirstEngine(DictionaryEngine(index), engine,
+                            max_words=config.get("dictionary_max_words", 2))
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地离线词典")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="由ECDICT的CSV生成索引")
+    build.add_argument("csv")
+    build.add_argument("index")
+    lookup = commands.add_parser("lookup", help="查询单词或短语")
+    lookup.add_argument("index")
+    lookup.add_argument("text")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        english, chinese = build_index(args.csv, args.index)
+        print(f"已生成 {args.index}: 英汉 {english} 条，汉英 {chinese} 条")
+        return 0
+
+    engine = DictionaryEngine(DictionaryIndex(args.index))
+    from language_detect import detect
+    target = "en" if detect(args.text).language != "en" else "zh-CN"
+    translated = engine.lookup(args.text, "auto", target)
+    print(translated if translated is not None else "未收录")
+    return 0 if translated is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
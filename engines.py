@@ -0,0 +1,506 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from http_pool import get_pool, warm_up_engine
+from metrics import metrics
+
+
+class EngineError(Exception):
+    """引擎请求失败
+
+    retryable: 是否值得重试（429、5xx、网络错误）
+    retry_after: 服务端要求的等待时间（秒）
+    """
+    def __init__(self, message: str, status: Optional[int] = None, reason: Optional[str] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason or (str(status) if status else "error")
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class Cancellation:
+    """可取消的请求句柄：对冲模式中落选的请求通过它中止
+
+    请求在 cancelling(handle) 中执行时，current_cancellation() 返回该句柄；
+    ResilientEngine 在重试和退避前检查它，异步引擎的同步外观在取消时中止协程。
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """等待timeout秒，期间被取消时立即返回True"""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """登记取消时调用的回调；已经取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"取消请求错误: {e}")
+
+    def check(self):
+        """已取消时抛出不可重试的EngineError"""
+        if self._event.is_set():
+            raise EngineError("请求已取消", reason="cancelled")
+
+
+_cancellation: "contextvars.ContextVar[Optional[Cancellation]]" = contextvars.ContextVar(
+    "cancellation", default=None)
+
+
+def current_cancellation() -> Optional[Cancellation]:
+    """当前线程中正在执行的请求的取消句柄（没有时为None）"""
+    return _cancellation.get()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（只支持秒数）"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def check_response(response):
+    """非200响应转换为EngineError"""
+    status = response.status_code
+    if status != 200:
+        raise EngineError(
+            f"翻译请求失败: {status}", status=status,
+            retryable=status == 429 or 500 <= status < 600,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+
+class TranslationEngine:
+    """翻译引擎基类
+
+    具体引擎实现 request()（失败时抛出EngineError），
+    translate() 在此基础上把失败转换为返回None。
+    """
+    name = "base"
+    max_chars = 2000  # 单次请求的最大字符数（批量请求时为所有片段之和）
+    max_batch = 1     # 单次请求可携带的片段数
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        """发出一次翻译请求，失败抛出EngineError"""
+        raise NotImplementedError
+
+    def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> List[str]:
+        """在一次请求中翻译多个片段，结果按位置对应；不支持批量的引擎逐个请求"""
+        return [self.request(text, source_lang, target_lang, timeout) for text in texts]
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  timeout: float = 5.0) -> Optional[str]:
+        """翻译文本，失败返回None"""
+        try:
+            return self.request(text, source_lang, target_lang, timeout)
+        except EngineError as e:
+            print(f"[{self.name}] {e}")
+            metrics.inc("engine_errors", engine=self.name, reason=e.reason)
+            return None
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                        timeout: float = 5.0) -> List[Optional[str]]:
+        """批量翻译（最多max_batch个片段、共max_chars个字符），失败的片段为None"""
+        if self.max_batch <= 1 or len(texts) <= 1:
+            return [self.translate(text, source_lang, target_lang, timeout) for text in texts]
+        try:
+            translations = self.request_batch(texts, source_lang, target_lang, timeout)
+        except EngineError as e:
+            print(f"[{self.name}] 批量请求（{len(texts)} 段）: {e}")
+            metrics.inc("engine_errors", engine=self.name, reason=e.reason)
+            return [None] * len(texts)
+        metrics.inc("batched_segments", len(texts), engine=self.name)
+        return translations
+
+    def warm_up(self):
+        """预热连接"""
+        pass
+
+
+def _json(response):
+    """检查状态码并解析JSON（requests 与 httpx 的响应都适用）"""
+    check_response(response)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise EngineError("翻译结果格式错误", reason="format") from e
+
+
+def parse_gtx(response) -> str:
+    """解析 translate_a/single 的结果"""
+    result = _json(response)
+    if not result or not result[0]:
+        raise EngineError("翻译结果格式错误", reason="format")
+    return ''.join([item[0] for item in result[0] if item[0]])
+
+
+def gtx_params(text: str, source_lang: str, target_lang: str) -> dict:
+    """translate_a/single 的查询参数"""
+    return {"client": "gtx", "sl": source_lang, "tl": target_lang, "dt": "t", "q": text}
+
+
+def gtx_batch_params(texts: List[str], source_lang: str, target_lang: str) -> list:
+    """translate_a/t 的查询参数：每段一个 q"""
+    params = [("client", "gtx"), ("sl", source_lang), ("tl", target_lang)]
+    params.extend(("q", text) for text in texts)
+    return params
+
+
+def parse_gtx_batch(response, count: int) -> List[str]:
+    """解析 translate_a/t 的结果：源语言为auto时每项为 [译文, 检测到的语言]，否则为译文字符串"""
+    result = _json(response)
+    if not isinstance(result, list) or len(result) != count:
+        raise EngineError("批量翻译结果数量不符", reason="format")
+    translations = []
+    for item in result:
+        if isinstance(item, list) and item:
+            item = item[0]
+        if not isinstance(item, str):
+            raise EngineError("翻译结果格式错误", reason="format")
+        translations.append(item)
+    return translations
+
+
+class GoogleEngine(TranslationEngine):
+    """Google Translate (gtx) 引擎"""
+    name = "google"
+    max_chars = 1000  # GET请求的URL长度有限
+    max_batch = 128   # 批量请求的大小实际由 max_chars 限制
+
+    def __init__(self, base_url: str = "https://translate.googleapis.com", http2: bool = False):
+        self.base_url = base_url.rstrip("/")
+        self.http = get_pool(self.name, base_url=self.base_url + "/", http2=http2)
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        try:
+            with metrics.span("engine_request", engine=self.name):
+                response = self.http.get(
+                    f"{self.base_url}/translate_a/single",
+                    params=gtx_params(text, source_lang, target_lang),
+                    timeout=timeout
+                )
+        except Exception as e:
+            raise EngineError(f"翻译错误: {e}", reason=type(e).__name__, retryable=True) from e
+        return parse_gtx(response)
+
+    def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> List[str]:
+        """translate_a/t 接受多个 q 参数，按顺序返回每段的译文"""
+        if len(texts) == 1:
+            return [self.request(texts[0], source_lang, target_lang, timeout)]
+        try:
+            with metrics.span("engine_request", engine=self.name):
+                response = self.http.get(f"{self.base_url}/translate_a/t",
+                                         params=gtx_batch_params(texts, source_lang, target_lang),
+                                         timeout=timeout)
+        except Exception as e:
+            raise EngineError(f"翻译错误: {e}", reason=type(e).__name__, retryable=True) from e
+        return parse_gtx_batch(response, len(texts))
+
+    def warm_up(self):
+        warm_up_engine(self.name)
+
+
+def deepl_lang(code: str) -> str:
+    """转换为DeepL的语言代码（zh-CN -> ZH）"""
+    code = code.upper()
+    if code.startswith("ZH"):
+        return "ZH"
+    return code
+
+
+def deepl_base_url(api_key: str) -> str:
+    """免费版密钥以 :fx 结尾，使用 api-free 域名"""
+    return ("https://api-free.deepl.com" if not api_key or api_key.endswith(":fx")
+            else "https://api.deepl.com")
+
+
+def deepl_form(texts: List[str], source_lang: str, target_lang: str) -> dict:
+    """/v2/translate 的表单：每段一个 text 字段"""
+    data = {"text": list(texts), "target_lang": deepl_lang(target_lang)}
+    if source_lang and source_lang.lower() != "auto":
+        data["source_lang"] = deepl_lang(source_lang)
+    return data
+
+
+def parse_deepl(response, count: int) -> List[str]:
+    """解析 /v2/translate 的结果，translations 按顺序对应"""
+    result = _json(response)
+    try:
+        translations = [item["text"] for item in result["translations"]]
+    except (KeyError, IndexError, TypeError) as e:
+        raise EngineError("翻译结果格式错误", reason="format") from e
+    if len(translations) != count:
+        raise EngineError("批量翻译结果数量不符", reason="format")
+    return translations
+
+
+class DeepLEngine(TranslationEngine):
+    """DeepL API 引擎"""
+    name = "deepl"
+    max_chars = 5000
+    max_batch = 50  # /v2/translate 每次最多50个 text
+
+    def __init__(self, api_key: str = "", base_url: Optional[str] = None, http2: bool = False):
+        self.api_key = api_key
+        self.base_url = (base_url or deepl_base_url(api_key)).rstrip("/")
+        self.http = get_pool(self.name, base_url=self.base_url + "/", http2=http2)
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        return self.request_batch([text], source_lang, target_lang, timeout)[0]
+
+    def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> List[str]:
+        """/v2/translate 接受多个 text 字段，translations 按顺序对应"""
+        try:
+            with metrics.span("engine_request", engine=self.name):
+                response = self.http.post(
+                    f"{self.base_url}/v2/translate",
+                    headers={"Authorization": f"DeepL-Auth-Key {self.api_key}"},
+                    data=deepl_form(texts, source_lang, target_lang),
+                    timeout=timeout
+                )
+        except Exception as e:
+            raise EngineError(f"翻译错误: {e}", reason=type(e).__name__, retryable=True) from e
+        return parse_deepl(response, len(texts))
+
+    def warm_up(self):
+        warm_up_engine(self.name)
+
+
+class HedgedEngine(TranslationEngine):
+    """多引擎对冲：并行或延迟发出请求，在截止时间内返回第一个有效结果
+
+    若配置了质量优先引擎，且它在截止时间内返回，则优先使用它的结果。
+    选出结果后取消落选的请求（Cancellation）：不再重试或退避等待，异步引擎的请求立即中止；
+    同步HTTP请求无法从外部中断，最多持续到截止时间。
+    """
+    _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+    def __init__(self, engines: List[TranslationEngine], deadline: float = 3.0,
+                 hedge_delay: float = 0.0, quality_engine: Optional[str] = None):
+        self.engines = engines
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.quality_engine = quality_engine
+        self.name = "+".join(engine.name for engine in engines)
+        self.max_chars = min(engine.max_chars for engine in engines)
+        self.wins: Dict[str, int] = {engine.name: 0 for engine in engines}
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  timeout: float = 5.0) -> Optional[str]:
+        deadline = time.monotonic() + min(timeout, self.deadline)
+        pending = {}
+        handles: Dict[object, Cancellation] = {}
+        results: Dict[str, str] = {}
+        waiting = list(self.engines)
+        next_launch = time.monotonic()
+
+        while True:
+            now = time.monotonic()
+            # 按对冲延迟依次发出请求
+            while waiting and now >= next_launch:
+                engine = waiting.pop(0)
+                if not getattr(engine, "available", True):
+                    continue  # 熔断中的引擎直接跳过
+                handle = Cancellation()
+                future = self._executor.submit(
+                    self._run, engine, handle, text, source_lang, target_lang,
+                    max(0.1, deadline - now)
+                )
+                pending[future] = engine.name
+                handles[future] = handle
+                next_launch = now + self.hedge_delay
+
+            winner = self._pick(results, pending, waiting)
+            if winner is not None:
+                break
+            if not pending and not waiting:
+                break
+            if now >= deadline:
+                break
+
+            wake_at = deadline if not waiting else min(deadline, next_launch)
+            done, _ = wait(list(pending), timeout=max(0.0, wake_at - now),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                translated = future.result()
+                if translated and translated.strip():
+                    results[name] = translated
+                    # 有了有效结果后只保留尚未发出的质量优先引擎
+                    if name == self.quality_engine:
+                        waiting = []
+                    else:
+                        waiting = [engine for engine in waiting
+                                   if engine.name == self.quality_engine]
+                else:
+                    # 失败时不再等待对冲延迟，立即发出下一个引擎的请求
+                    next_launch = time.monotonic()
+
+        # 取消落选的请求：尚未开始的不再执行，已经发出的尽快中止
+        for future in pending:
+            future.cancel()
+            handles[future].cancel()
+
+        if winner is None and results:
+            winner = next(iter(results))
+        if winner is None:
+            with self._lock:
+                self.timeouts += 1
+            print(f"[{self.name}] 截止时间内没有可用结果")
+            metrics.inc("engine_errors", engine=self.name, reason="deadline")
+            return None
+        with self._lock:
+            self.wins[winner] += 1
+        metrics.inc("hedge_wins", engine=winner)
+        return results[winner]
+
+    @staticmethod
+    def _run(engine: TranslationEngine, handle: Cancellation, *args) -> Optional[str]:
+        token = _cancellation.set(handle)
+        try:
+            return engine.translate(*args)
+        finally:
+            _cancellation.reset(token)
+
+    def _pick(self, results: Dict[str, str], pending: dict, waiting: list) -> Optional[str]:
+        """选出可以立即返回的结果"""
+        if not results:
+            return None
+        if self.quality_engine:
+            if self.quality_engine in results:
+                return self.quality_engine
+            quality_alive = (self.quality_engine in pending.values()
+                             or any(engine.name == self.quality_engine for engine in waiting))
+            if quality_alive:
+                return None  # 质量优先引擎尚有机会，继续等待
+        return next(iter(results))
+
+    def warm_up(self):
+        for engine in self.engines:
+            engine.warm_up()
+
+
+def load_engine_config(path: str = "translator_config.json") -> dict:
+    """读取引擎配置，文件不存在时返回空配置"""
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"加载配置失败: {e}")
+    return {}
+
+
+def create_engine(name: str, config: dict) -> TranslationEngine:
+    """按名称创建单个引擎；配置 async_engines 时（以及 pot 引擎）使用异步引擎的同步外观"""
+    if name == "pot" or config.get("async_engines"):
+        from async_engines import SyncEngine, configure_client, create_async_engine, httpx
+        if httpx is not None:
+            configure_client(max_connections=config.get("async_max_connections", 100),
+                             http2=config.get("http2", False))
+            return SyncEngine(create_async_engine(name, config))
+        if name == "pot":
+            raise ValueError("pot 引擎需要安装httpx")
+        print("未安装httpx，异步引擎不可用，使用同步引擎")
+    http2 = config.get("http2", False)
+    if name == "google":
+        return GoogleEngine(http2=http2)
+    if name == "deepl":
+        return DeepLEngine(config.get("deepl_api_key") or config.get("api_key", ""), http2=http2)
+    raise ValueError(f"未知的翻译引擎: {name}")
+
+
+# 不需要API密钥的引擎；api_type 为其他已知引擎时必须配置了密钥才生效
+_KEYLESS_ENGINES = ("google", "pot")
+_KEYED_ENGINES = ("deepl",)
+_ignored_api_types = set()
+
+
+def engine_names(config: dict, default: str = "google") -> List[str]:
+    """配置使用的引擎名称：engines 列表，其次 api_type，最后取调用方的默认引擎
+
+    旧版配置模板写入的是 "api_type": "deepl" 和空的 api_key；没有密钥（或是未知引擎）的
+    api_type 不生效，避免前端从无需密钥的默认引擎悄悄换成每次都返回403的引擎。
+    """
+    if config.get("engines"):
+        return list(config["engines"])
+    api_type = config.get("api_type")
+    if api_type and api_type != default and api_type not in _KEYLESS_ENGINES:
+        has_key = bool(config.get("deepl_api_key") or config.get("api_key"))
+        if api_type not in _KEYED_ENGINES or not has_key:
+            if (api_type, default) not in _ignored_api_types:
+                _ignored_api_types.add((api_type, default))
+                reason = "未配置API密钥" if api_type in _KEYED_ENGINES else "未知的引擎"
+                print(f"api_type \"{api_type}\" {reason}，使用默认引擎 {default}")
+            api_type = None
+    return [api_type or default]
+
+
+def build_engine(config: dict, default: str = "google") -> TranslationEngine:
+    """根据配置构建引擎；配置多个引擎时启用对冲模式
+
+    相关配置项:
+        engines: 引擎列表，如 ["google", "deepl", "pot"]
+        api_type: 未配置 engines 时使用的单个引擎（需要密钥的引擎须配置 api_key）
+        async_engines/async_max_connections: 见 async_engines
+        deadline: 对冲模式的截止时间（秒）
+        hedge_delay: 发出下一个引擎请求前的等待时间（秒），0为全部并行
+        quality_engine: 截止时间内优先采用其结果的引擎
+        segment_max_chars: 长文本分段大小，默认取引擎的单次请求上限
+        rate_limits/max_attempts/breaker_threshold/breaker_reset: 见 resilience.make_resilient
+        dictionary/dictionary_max_words: 见 dictionary.with_dictionary
+    """
+    from dictionary import with_dictionary
+    from resilience import make_resilient
+    from segmenter import SegmentingEngine
+
+    names = engine_names(config, default)
+    engines = [make_resilient(create_engine(name, config), config) for name in names]
+    if len(engines) == 1:
+        engine = engines[0]
+    else:
+        engine = HedgedEngine(
+            engines,
+            deadline=config.get("deadline", 3.0),
+            hedge_delay=config.get("hedge_delay", 0.0),
+            quality_engine=config.get("quality_engine"),
+        )
+    # 短文本先查本地词典（在分段之内，增量翻译的单句也能命中）
+    engine = with_dictionary(engine, config)
+    return SegmentingEngine(engine, config.get("segment_max_chars"))
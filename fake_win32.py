@@ -0,0 +1,494 @@
+"""进程内的 Win32 替身层，用于在非Windows平台运行端到端基准测试
+
+FakeDesktop 模拟顶层窗口、子窗口（输入框）、前台窗口和剪贴板，
+hang()/resume() 模拟程序卡死（发给它的消息和 UI Automation 调用一直阻塞）；
+install() 把 win32gui/win32con/win32api/pynput/uiautomation/comtypes
+替换为基于该桌面的模块，必须在导入 simple_translator 之前调用。
+"""
+import ctypes
+import enum
+import re
+import struct
+import sys
+import threading
+import types
+from typing import Dict, List, Optional
+
+from clipboard_sync import SimulatedClipboard
+
+# 与 win32con 中同名常量的取值一致
+WIN32CON = {
+    "WM_SETTEXT": 0x000C,
+    "WM_GETTEXT": 0x000D,
+    "WM_GETTEXTLENGTH": 0x000E,
+    "EM_GETLINECOUNT": 0x00BA,
+    "EM_LINEINDEX": 0x00BB,
+    "EM_LINELENGTH": 0x00C1,
+    "EM_GETLINE": 0x00C4,
+    "EM_SETSEL": 0x00B1,
+    "EM_REPLACESEL": 0x00C2,
+    "EM_GETLIMITTEXT": 0x00D5,
+    "WM_RENDERFORMAT": 0x0305,
+    "WM_RENDERALLFORMATS": 0x0306,
+    "GWL_STYLE": -16,
+    "GWL_EXSTYLE": -20,
+    "WS_POPUP": 0x80000000,
+    "WS_EX_TOOLWINDOW": 0x00000080,
+    "KEYEVENTF_KEYUP": 0x0002,
+    "VK_CONTROL": 0x11,
+    "CF_UNICODETEXT": 13,
+    "HWND_MESSAGE": -3,
+    "SMTO_BLOCK": 0x0001,
+    "SMTO_ABORTIFHUNG": 0x0002,
+}
+
+
+class FakeWindow:
+    """模拟窗口：text 即 WM_GETTEXT/GetWindowText 返回的内容"""
+    def __init__(self, hwnd: int, class_name: str, text: str = "", parent: int = 0,
+                 editable: bool = False, control_type: Optional[str] = None):
+        self.hwnd = hwnd
+        self.class_name = class_name
+        self._pieces = [text]  # EM_REPLACESEL 在末尾追加时先分段保存，读取时再合并
+        self._length = len(text)
+        self.selection = (0, 0)
+        self.text_limit = 30000  # 编辑框的默认长度上限（只限制 EM_REPLACESEL）
+        self.parent = parent
+        self.editable = editable          # 是否为接收键盘输入的输入框
+        self.control_type = control_type  # UI Automation 控件类型
+        self.children: List[int] = []
+        self.visible = True
+        self.iconic = False
+        self.style = 0
+        self.ex_style = 0
+        self.responsive = threading.Event()  # 清除时模拟程序卡死
+        self.responsive.set()
+        self._lines = (None, [])
+
+    @property
+    def text(self) -> str:
+        if len(self._pieces) > 1:
+            self._pieces = ["".join(self._pieces)]
+        return self._pieces[0]
+
+    @text.setter
+    def text(self, value: str):
+        self._pieces = [value]
+        self._length = len(value)
+        self.selection = (0, 0)
+
+    def resident_bytes(self, exclude=()) -> int:
+        """替身程序持有的文本占用的内存（真实的编辑框在目标进程中，基准测试中应扣除）"""
+        return sum(sys.getsizeof(piece) for piece in self._pieces
+                   if not any(piece is other for other in exclude))
+
+    def replace_selection(self, value: str):
+        """EM_REPLACESEL：替换选中的文本，光标移到插入的文本之后"""
+        start, end = self.selection
+        end = self._length if end < 0 else min(end, self._length)
+        if start == 0 and end == self._length:
+            self._pieces = [value]
+        elif start == end == self._length:
+            self._pieces.append(value)
+        else:
+            text = self.text
+            self._pieces = [text[:start] + value + text[end:]]
+        self._length += len(value) - (end - start)
+        self.selection = (start + len(value),) * 2
+
+    def lines(self) -> List[tuple]:
+        """编辑框的行：(起始位置, 长度)，不含换行符；文本不变时复用"""
+        text, lines = self._lines
+        if text is not self.text:
+            lines = []
+            start = 0
+            for match in re.finditer(r"\r\n|\r|\n", self.text):
+                lines.append((start, match.start() - start))
+                start = match.end()
+            lines.append((start, len(self.text) - start))
+            self._lines = (self.text, lines)
+        return lines
+
+
+class FakeDesktop:
+    """模拟桌面：窗口树、前台窗口和剪贴板"""
+    def __init__(self):
+        self.windows: Dict[int, FakeWindow] = {}
+        self.foreground = 0
+        self._next_hwnd = 0x10000
+        self._lock = threading.Lock()
+        self.clipboard = DesktopClipboard(self)
+
+    def create_window(self, class_name: str, text: str = "", parent: int = 0,
+                      editable: bool = False, control_type: Optional[str] = None) -> FakeWindow:
+        with self._lock:
+            self._next_hwnd += 4
+            window = FakeWindow(self._next_hwnd, class_name, text, parent, editable, control_type)
+            self.windows[window.hwnd] = window
+            if parent:
+                self.windows[parent].children.append(window.hwnd)
+        return window
+
+    def create_app(self, class_name: str, title: str = "", edit_class: Optional[str] = None,
+                   control_type: Optional[str] = None) -> FakeWindow:
+        """创建顶层窗口；指定edit_class时创建一个输入框子窗口"""
+        window = self.create_window(class_name, title, editable=edit_class is None)
+        if edit_class:
+            self.create_window(edit_class, parent=window.hwnd, editable=True,
+                               control_type=control_type)
+        elif control_type:
+            window.control_type = control_type
+        return window
+
+    def destroy(self, hwnd: int):
+        with self._lock:
+            window = self.windows.pop(hwnd, None)
+            if window is None:
+                return
+            if window.parent in self.windows:
+                self.windows[window.parent].children.remove(hwnd)
+            children = list(window.children)
+        for child in children:
+            self.destroy(child)
+        if self.foreground == hwnd:
+            self.foreground = 0
+
+    def root(self, hwnd: int) -> FakeWindow:
+        """窗口所属的顶层窗口"""
+        window = self.window(hwnd)
+        while window.parent in self.windows:
+            window = self.windows[window.parent]
+        return window
+
+    def hang(self, hwnd: int):
+        """模拟窗口所属的程序卡死"""
+        self.root(hwnd).responsive.clear()
+
+    def resume(self, hwnd: int):
+        self.root(hwnd).responsive.set()
+
+    def wait_responsive(self, hwnd: int, timeout: Optional[float] = None) -> bool:
+        """像目标程序处理消息一样等待它恢复响应，超时返回False"""
+        return self.root(hwnd).responsive.wait(timeout)
+
+    def window(self, hwnd: int) -> FakeWindow:
+        window = self.windows.get(hwnd)
+        if window is None:
+            raise FakeWin32Error(1400, "GetWindow", "无效的窗口句柄")
+        return window
+
+    def descendants(self, hwnd: int) -> List[FakeWindow]:
+        result = []
+        for child in self.window(hwnd).children:
+            result.append(self.windows[child])
+            result.extend(self.descendants(child))
+        return result
+
+    def input_window(self, hwnd: int) -> Optional[FakeWindow]:
+        """窗口中接收键盘输入的控件（本身或第一个可编辑的子窗口）"""
+        window = self.windows.get(hwnd)
+        if window is None:
+            return None
+        if window.editable:
+            return window
+        for child in self.descendants(hwnd):
+            if child.editable:
+                return child
+        return None
+
+    def input_text(self, hwnd: int) -> str:
+        window = self.input_window(hwnd)
+        return window.text if window else ""
+
+
+class DesktopClipboard(SimulatedClipboard):
+    """剪贴板与按键注入作用于桌面前台窗口的输入框"""
+    def __init__(self, desktop: FakeDesktop, copy_delay: Optional[float] = 0.002,
+                 paste_delay: Optional[float] = 0.002):
+        self.desktop = desktop
+        super().__init__("", copy_delay=copy_delay, paste_delay=paste_delay)
+
+    @property
+    def content(self) -> str:
+        return self.desktop.input_text(self.desktop.foreground)
+
+    @content.setter
+    def content(self, text: str):
+        window = self.desktop.input_window(self.desktop.foreground)
+        if window is not None:
+            window.text = text
+
+    def activate(self, hwnd: int, timeout: float) -> bool:
+        if hwnd not in self.desktop.windows:
+            return False
+        self.desktop.foreground = hwnd
+        return super().activate(hwnd, timeout)
+
+
+class FakeWin32Error(Exception):
+    """对应 pywintypes.error"""
+
+
+class FakeControl:
+    """模拟 uiautomation 控件"""
+    def __init__(self, desktop: FakeDesktop, hwnd: int):
+        self.desktop = desktop
+        self.hwnd = hwnd
+        self.Element = self  # 存活检查访问 control.Element.CurrentProcessId
+
+    @property
+    def CurrentProcessId(self) -> int:
+        self.desktop.window(self.hwnd)
+        return 1
+
+    @property
+    def ControlTypeName(self) -> str:
+        return self.desktop.window(self.hwnd).control_type or "PaneControl"
+
+    def GetChildren(self) -> list:
+        return [FakeControl(self.desktop, child) for child in self.desktop.window(self.hwnd).children]
+
+    def GetSelectionText(self) -> str:
+        # 替身中文档没有选区，调用方会改用剪贴板
+        self.desktop.wait_responsive(self.hwnd)
+        return ""
+
+    def GetValuePattern(self):
+        self.desktop.wait_responsive(self.hwnd)
+        return types.SimpleNamespace(Value=self.desktop.window(self.hwnd).text)
+
+
+def _make_win32gui(desktop: FakeDesktop) -> types.ModuleType:
+    module = types.ModuleType("win32gui")
+    module.error = FakeWin32Error
+    con = WIN32CON
+
+    module.GetForegroundWindow = lambda: desktop.foreground
+    module.GetClassName = lambda hwnd: desktop.window(hwnd).class_name
+    module.GetWindowText = lambda hwnd: desktop.windows[hwnd].text if hwnd in desktop.windows else ""
+    module.IsWindow = lambda hwnd: hwnd in desktop.windows
+    module.IsWindowVisible = lambda hwnd: hwnd in desktop.windows and desktop.windows[hwnd].visible
+    module.IsIconic = lambda hwnd: desktop.window(hwnd).iconic
+    module.GetFocus = lambda: 0  # 跨线程调用时返回NULL
+    module.PyMakeBuffer = lambda size: memoryview(bytearray(size))
+
+    def IsChild(parent, hwnd):
+        window = desktop.windows.get(hwnd)
+        while window is not None and window.parent:
+            if window.parent == parent:
+                return True
+            window = desktop.windows.get(window.parent)
+        return False
+
+    def GetWindowLong(hwnd, index):
+        window = desktop.window(hwnd)
+        return window.ex_style if index == con["GWL_EXSTYLE"] else window.style
+
+    def SetForegroundWindow(hwnd):
+        desktop.window(hwnd)
+        desktop.foreground = hwnd
+
+    def FindWindowEx(parent, after, class_name, title):
+        for child in desktop.window(parent).children:
+            window = desktop.windows[child]
+            if child > after and (class_name is None or window.class_name == class_name) \
+                    and (title is None or window.text == title):
+                return child
+        return 0
+
+    def EnumChildWindows(hwnd, callback, param):
+        for child in desktop.descendants(hwnd):
+            if callback(child.hwnd, param) is False:
+                # 与pywin32一致：回调中止枚举时报告错误
+                raise FakeWin32Error(0, "EnumChildWindows", "枚举被中止")
+
+    def GetAncestor(hwnd, flags):
+        return desktop.root(hwnd).hwnd
+
+    def SendMessage(hwnd, msg, wparam=0, lparam=0):
+        window = desktop.window(hwnd)
+        desktop.wait_responsive(hwnd)
+        if msg == con["WM_GETTEXTLENGTH"]:
+            return len(window.text.encode("utf-16-le")) // 2
+        if msg == con["WM_GETTEXT"]:
+            # 最多写入 wparam-1 个字符（不超过缓冲区字节数），返回写入的字符数
+            data = window.text.encode("utf-16-le")[:max(0, wparam - 1) * 2]
+            data = data[:len(lparam) - (len(lparam) % 2)]
+            lparam[:len(data)] = data
+            return len(data) // 2
+        if msg == con["WM_SETTEXT"]:
+            window.text = lparam
+            return 1
+        if msg == con["EM_SETSEL"]:
+            window.selection = (wparam, lparam)
+            return 1
+        if msg == con["EM_REPLACESEL"]:
+            window.replace_selection(lparam)
+            return 0
+        if msg == con["EM_GETLIMITTEXT"]:
+            return window.text_limit
+        if msg == con["EM_GETLINECOUNT"]:
+            return len(window.lines()) if window.editable else 0
+        if msg == con["EM_LINEINDEX"]:
+            lines = window.lines()
+            return lines[wparam][0] if 0 <= wparam < len(lines) else -1
+        if msg == con["EM_LINELENGTH"]:
+            for start, length in window.lines():
+                if start <= wparam <= start + length:
+                    return length
+            return 0
+        if msg == con["EM_GETLINE"]:
+            # 缓冲区的第一个WORD是最多复制的字符数，返回复制的字符数（不含换行）
+            start, length = window.lines()[wparam]
+            count = min(length, struct.unpack_from("<H", lparam, 0)[0], len(lparam) // 2)
+            lparam[:count * 2] = window.text[start:start + count].encode("utf-16-le")
+            return count
+        return 0
+
+    module.IsChild = IsChild
+    module.GetWindowLong = GetWindowLong
+    module.SetForegroundWindow = SetForegroundWindow
+    module.FindWindowEx = FindWindowEx
+    module.EnumChildWindows = EnumChildWindows
+    def SendMessageTimeout(hwnd, msg, wparam, lparam, flags, timeout):
+        # SMTO_ABORTIFHUNG：替身中卡死的程序直到超时才报告失败
+        if not desktop.wait_responsive(hwnd, timeout / 1000):
+            raise FakeWin32Error(1460, "SendMessageTimeout", "超时")
+        return 1, SendMessage(hwnd, msg, wparam, lparam)
+
+    module.GetAncestor = GetAncestor
+    module.SendMessage = SendMessage
+    module.SendMessageTimeout = SendMessageTimeout
+    return module
+
+
+def _make_win32api(desktop: FakeDesktop) -> types.ModuleType:
+    module = types.ModuleType("win32api")
+    module.keybd_event = lambda vk, scan, flags, extra: None
+    module.GetModuleHandle = lambda name: 0
+    return module
+
+
+def _make_pynput() -> Dict[str, types.ModuleType]:
+    pynput = types.ModuleType("pynput")
+    keyboard = types.ModuleType("pynput.keyboard")
+
+    class Key(enum.Enum):
+        shift = "shift"
+        space = "space"
+        f11 = "f11"
+        f12 = "f12"
+
+    class KeyCode:
+        def __init__(self, char: Optional[str] = None):
+            self.char = char
+
+        @classmethod
+        def from_char(cls, char: str) -> "KeyCode":
+            return cls(char)
+
+    class Controller:
+        def press(self, key):
+            pass
+
+        def release(self, key):
+            pass
+
+    class Listener:
+        def __init__(self, on_press=None, on_release=None):
+            self.on_press = on_press
+            self.on_release = on_release
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def stop(self):
+            pass
+
+        def join(self):
+            pass
+
+    keyboard.Key = Key
+    keyboard.KeyCode = KeyCode
+    keyboard.Controller = Controller
+    keyboard.Listener = Listener
+    pynput.keyboard = keyboard
+    return {"pynput": pynput, "pynput.keyboard": keyboard}
+
+
+def _make_uiautomation(desktop: FakeDesktop) -> types.ModuleType:
+    module = types.ModuleType("uiautomation")
+
+    class UIAutomationInitializerInThread:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    def GetFocusedControl():
+        window = desktop.input_window(desktop.foreground)
+        return FakeControl(desktop, window.hwnd) if window else None
+
+    def WalkControl(root, includeTop=False, maxDepth=0xFFFFFFFF):
+        stack = [(child, 1) for child in reversed(root.GetChildren())]
+        if includeTop:
+            yield root, 0
+        while stack:
+            control, depth = stack.pop()
+            yield control, depth
+            if depth < maxDepth:
+                stack.extend((child, depth + 1) for child in reversed(control.GetChildren()))
+
+    module.UIAutomationInitializerInThread = UIAutomationInitializerInThread
+    module.InitializeUIAutomationInCurrentThread = lambda: None
+    module.GetRootControl = lambda: None
+    module.ControlFromHandle = lambda hwnd: FakeControl(desktop, hwnd)
+    module.GetFocusedControl = GetFocusedControl
+    module.WalkControl = WalkControl
+    return module
+
+
+def _make_comtypes() -> Dict[str, types.ModuleType]:
+    comtypes = types.ModuleType("comtypes")
+    client = types.ModuleType("comtypes.client")
+    client.GetFocusedObject = lambda: None
+    comtypes.client = client
+    return {"comtypes": comtypes, "comtypes.client": client}
+
+
+_installed: Optional[FakeDesktop] = None
+
+
+def install(desktop: Optional[FakeDesktop] = None) -> FakeDesktop:
+    """用替身模块替换 Win32 相关依赖，并让剪贴板传输使用桌面剪贴板（已安装时返回原桌面）"""
+    global _installed
+    if _installed is not None and desktop is None:
+        return _installed
+    if "simple_translator" in sys.modules:
+        raise RuntimeError("必须在导入 simple_translator 之前安装替身层")
+    desktop = desktop or FakeDesktop()
+    _installed = desktop
+    win32con = types.ModuleType("win32con")
+    win32con.__dict__.update(WIN32CON)
+    sys.modules.update({
+        "win32gui": _make_win32gui(desktop),
+        "win32con": win32con,
+        "win32api": _make_win32api(desktop),
+        "uiautomation": _make_uiautomation(desktop),
+        **_make_pynput(),
+        **_make_comtypes(),
+    })
+    if not hasattr(ctypes, "windll"):
+        ctypes.windll = types.SimpleNamespace(user32=types.SimpleNamespace(
+            SendMessageW=lambda *args: 0, SetClipboardData=lambda *args: 0,
+            AddClipboardFormatListener=lambda *args: 1,
+        ))
+
+    import clipboard_sync
+    from clipboard_sync import ClipboardTransfer
+    clipboard_sync._default_transfer = ClipboardTransfer(desktop.clipboard)
+    return desktop
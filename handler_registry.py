@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+class HandlerRegistry:
+    """窗口类名 -> 处理器链的索引
+
+    处理器通过 class_names（精确匹配）和 class_prefixes（前缀匹配）声明
+    能处理的窗口类；两者都未声明的处理器按原方式调用 can_handle 判断。
+    解析结果按类名缓存，同一类窗口再次触发时不再做任何匹配。
+    """
+    def __init__(self, handlers: list, cache_size: int = 256):
+        self.handlers = handlers
+        self.cache_size = cache_size
+        self._exact: Dict[str, List[int]] = {}
+        self._prefixes: Dict[int, Dict[str, List[int]]] = {}
+        self._custom: List[int] = []
+        self._resolved: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self):
+        for priority, handler in enumerate(self.handlers):
+            names = getattr(handler, "class_names", ())
+            prefixes = getattr(handler, "class_prefixes", ())
+            if not names and not prefixes:
+                self._custom.append(priority)
+                continue
+            for name in names:
+                self._exact.setdefault(name, []).append(priority)
+            for prefix in prefixes:
+                self._prefixes.setdefault(len(prefix), {}).setdefault(prefix, []).append(priority)
+
+    def resolve(self, class_name: str, hwnd: int = 0) -> list:
+        """返回能处理该窗口类的处理器（按注册优先级排序）"""
+        with self._lock:
+            handlers = self._resolved.get(class_name)
+            if handlers is not None:
+                self._resolved.move_to_end(class_name)
+                return handlers
+
+        matched = set(self._exact.get(class_name, ()))
+        for length, prefixes in self._prefixes.items():
+            matched.update(prefixes.get(class_name[:length], ()))
+        for priority in self._custom:
+            if self.handlers[priority].can_handle(hwnd, class_name):
+                matched.add(priority)
+        handlers = [self.handlers[priority] for priority in sorted(matched)]
+
+        with self._lock:
+            self._resolved[class_name] = handlers
+            while len(self._resolved) > self.cache_size:
+                self._resolved.popitem(last=False)
+        return handlers
+
+
+class EditHandleCache:
+    """按顶层窗口缓存已找到的输入框句柄（有容量上限）
+
+    每次取用时校验：顶层窗口仍然存在且输入框仍是它的子窗口，
+    窗口销毁（或句柄被复用）后缓存项自动失效。
+    """
+    def __init__(self, max_entries: int = 64,
+                 validate: Optional[Callable[[int, int], bool]] = None):
+        self.max_entries = max_entries
+        self.validate = validate or self._validate_win32
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, int]" = OrderedDict()  # (窗口句柄, 类型) -> 输入框句柄
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _validate_win32(hwnd: int, child: int) -> bool:
+        import win32gui
+        return bool(win32gui.IsWindow(hwnd) and win32gui.IsWindow(child)
+                    and win32gui.IsChild(hwnd, child))
+
+    def get_or_find(self, hwnd: int, kind: str, finder: Callable[[int], Optional[int]]) -> Optional[int]:
+        """返回缓存的输入框句柄，没有或已失效时调用finder查找"""
+        key = (hwnd, kind)
+        with self._lock:
+            child = self._entries.get(key)
+        if child is not None:
+            try:
+                valid = self.validate(hwnd, child)
+            except Exception:
+                valid = False
+            if valid:
+                with self._lock:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                return child
+            self.invalidate(hwnd)
+
+        self.misses += 1
+        child = finder(hwnd)
+        if child:
+            with self._lock:
+                self._entries[key] = child
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return child
+
+    def invalidate(self, hwnd: int):
+        """移除顶层窗口的所有缓存项"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == hwnd]:
+                del self._entries[key]
+
+
+edit_handles = EditHandleCache()
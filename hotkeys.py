@@ -0,0 +1,272 @@
+"""快捷键匹配
+
+把配置中的组合键和按键序列预先编译为按键编号、位掩码和分发表，
+键盘钩子的每个事件只做一次字典查找和几次整数运算，不格式化字符串。
+
+配置示例（translator_config.json）:
+    "hotkeys": {"translate": ["ctrl+win+t", "space space space"], "quit": "shift+f12"},
+    "sequence_timeout_ms": 400
+
+- "ctrl+win+t": 组合键，按下最后一个键时修饰键（ctrl/shift/alt/win）必须恰好是这些
+- "space space space": 按键序列，在 sequence_timeout_ms 内依次按下（中间不能有其他按键）
+
+默认只有组合键；按键序列需要在配置中自行加上（默认关闭）：序列由普通按键组成，
+在任何输入框中正常打字也可能触发，触发后会替换输入框中的文本。
+
+按住时的自动重复不会重复触发。丢失的释放事件（锁屏、切换到管理员窗口等）会让按键
+一直处于按下状态：再次按下时如果距上次事件超过 stale_after 秒，按新的按下处理；
+组合键匹配时，多出来的修饰键如果已经过期（或 key_state 报告并未按下）则清除。
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+MODIFIERS = ("ctrl", "shift", "alt", "win")
+# 配置中的按键名 -> pynput Key 的成员名
+KEY_ALIASES = {
+    "ctrl": ("ctrl", "ctrl_l", "ctrl_r"),
+    "shift": ("shift", "shift_l", "shift_r"),
+    "alt": ("alt", "alt_l", "alt_r", "alt_gr"),
+    "win": ("cmd", "cmd_l", "cmd_r"),
+    "enter": ("enter",),
+    "esc": ("esc",),
+}
+NAME_ALIASES = {"control": "ctrl", "cmd": "win", "super": "win", "return": "enter", "escape": "esc"}
+# Windows 虚拟键码，用于 key_state 查询修饰键的真实状态
+MODIFIER_VK = {"ctrl": (0x11,), "shift": (0x10,), "alt": (0x12,), "win": (0x5B, 0x5C)}
+# 标点键的虚拟键码（VK_OEM_*，美式键盘布局）；按住Ctrl时这些键的char可能为空
+_OEM_VK = {";": 0xBA, "=": 0xBB, ",": 0xBC, "-": 0xBD, ".": 0xBE, "/": 0xBF, "`": 0xC0,
+           "[": 0xDB, "\\": 0xDC, "]": 0xDD, "'": 0xDE}
+
+Binding = Union[str, List[str]]
+
+
+class HotkeyMatcher:
+    """组合键与按键序列的状态机
+
+    bindings: 动作名 -> 按键描述（或描述列表）
+    actions: 动作名 -> 回调（在键盘钩子线程中调用，应尽快返回）
+    key_class: pynput.keyboard.Key，用于识别特殊键
+    key_state: 可选，key_state(修饰键名) 返回该键当前是否真的按下
+    """
+    def __init__(self, bindings: Dict[str, Binding], actions: Dict[str, Callable[[], None]],
+                 key_class, sequence_timeout: float = 0.4, stale_after: float = 1.0,
+                 key_state: Optional[Callable[[str], bool]] = None):
+        self.sequence_timeout = sequence_timeout
+        self.stale_after = stale_after
+        self.key_state = key_state
+        self._key_class = key_class
+        self._names: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._special: Dict[int, int] = {}  # id(Key成员) -> 编号
+        self._vk: Dict[int, int] = {}
+        self._char: Dict[str, int] = {}
+        for name in MODIFIERS:
+            self._register(name)
+        self._modifier_mask = (1 << len(MODIFIERS)) - 1
+
+        chords: Dict[int, list] = {}
+        self._sequences = []
+        self._specs: Dict[str, List[str]] = {}
+        for action, specs in bindings.items():
+            if action not in actions:
+                raise ValueError(f"未知的快捷键动作: {action}")
+            callback = actions[action]
+            self._specs[action] = [specs] if isinstance(specs, str) else list(specs)
+            for spec in self._specs[action]:
+                steps = spec.lower().split()
+                if len(steps) > 1:
+                    codes = tuple(self._register(_canonical(step)) for step in steps)
+                    self._sequences.append((codes, callback, spec))
+                    continue
+                names = [_canonical(part) for part in spec.lower().split("+") if part.strip()]
+                if not names:
+                    raise ValueError(f"无效的快捷键: {spec!r}")
+                trigger = self._register(names[-1])
+                modifiers = 0
+                for name in names[:-1]:
+                    if name not in MODIFIERS:
+                        raise ValueError(f"组合键中只有最后一个键可以不是修饰键: {spec!r}")
+                    modifiers |= 1 << self._codes[name]
+                chords.setdefault(trigger, []).append((modifiers, callback, spec))
+
+        self._chords = [tuple(chords.get(code, ())) for code in range(len(self._names))]
+        self._down = 0
+        self._last_seen = [0.0] * len(self._names)
+        self._progress = [0] * len(self._sequences)
+        self._started = [0.0] * len(self._sequences)
+        self._in_sequence = False
+
+    def _register(self, name: str) -> int:
+        """为按键分配编号，并登记识别它的方式"""
+        code = self._codes.get(name)
+        if code is not None:
+            return code
+        members = [getattr(self._key_class, member, None) for member in KEY_ALIASES.get(name, (name,))]
+        members = [member for member in members if member is not None]
+        if not members and len(name) != 1 and name not in MODIFIERS:
+            raise ValueError(f"未知的按键: {name}")
+        code = len(self._names)
+        self._names.append(name)
+        self._codes[name] = code
+        for member in members:
+            self._special[id(member)] = code
+        if len(name) == 1:
+            # 字母和数字的虚拟键码就是其大写ASCII码；按住Ctrl时字母的char是控制字符
+            if name.isascii() and name.isalnum():
+                self._vk[ord(name.upper())] = code
+            elif name in _OEM_VK:
+                self._vk[_OEM_VK[name]] = code
+            for char in {name, name.upper()}:
+                self._char[char] = code
+            if name.isascii() and name.isalpha():
+                self._char[chr(ord(name) & 0x1F)] = code
+        return code
+
+    def _code(self, key) -> Optional[int]:
+        """事件中的按键 -> 编号，不关心的按键返回None"""
+        if key.__class__ is self._key_class:
+            return self._special.get(id(key))
+        code = self._vk.get(getattr(key, "vk", None))
+        if code is None:
+            # 没有登记虚拟键码的按键（Windows上每个KeyCode都带vk）按字符识别
+            code = self._char.get(getattr(key, "char", None))
+        return code
+
+    def on_press(self, key):
+        code = self._code(key)
+        if code is None:
+            # 其他按键打断正在进行的序列
+            if self._in_sequence:
+                self._reset_sequences()
+            return
+        bit = 1 << code
+        now = time.monotonic()
+        last_seen = self._last_seen[code]
+        self._last_seen[code] = now
+        if self._down & bit and now - last_seen < self.stale_after:
+            return  # 按住时的自动重复
+        self._down |= bit
+
+        for modifiers, callback, _ in self._chords[code]:
+            if self._modifiers_match(modifiers, now):
+                self._reset_sequences()
+                callback()
+                return
+        if self._sequences and not bit & self._modifier_mask:
+            self._advance_sequences(code, now)
+
+    def on_release(self, key):
+        code = self._code(key)
+        if code is not None:
+            self._down &= ~(1 << code)
+
+    def _modifiers_match(self, modifiers: int, now: float) -> bool:
+        """当前按下的修饰键是否恰好是modifiers；多出的修饰键已过期或实际未按下时清除"""
+        down = self._down & self._modifier_mask
+        if down == modifiers:
+            return True
+        if down & modifiers != modifiers:
+            return False
+        for code in range(len(MODIFIERS)):
+            bit = 1 << code
+            if down & bit and not modifiers & bit:
+                if self.key_state is not None:
+                    stuck = not self.key_state(MODIFIERS[code])
+                else:
+                    stuck = now - self._last_seen[code] >= self.stale_after
+                if not stuck:
+                    return False
+                self._down &= ~bit
+        return True
+
+    def _advance_sequences(self, code: int, now: float):
+        if self._down & self._modifier_mask:
+            self._reset_sequences()
+            return
+        for index, (codes, callback, _) in enumerate(self._sequences):
+            position = self._progress[index]
+            if position and now - self._started[index] > self.sequence_timeout:
+                position = 0
+            if codes[position] != code:
+                position = 0
+            if codes[position] == code:
+                if position == 0:
+                    self._started[index] = now
+                position += 1
+            if position == len(codes):
+                self._reset_sequences()
+                callback()
+                return
+            self._progress[index] = position
+        self._in_sequence = any(self._progress)
+
+    def _reset_sequences(self):
+        for index in range(len(self._progress)):
+            self._progress[index] = 0
+        self._in_sequence = False
+
+    def reset(self):
+        """清除全部按键状态"""
+        self._down = 0
+        self._reset_sequences()
+
+    def describe(self, action: Optional[str] = None) -> str:
+        """已配置的快捷键（用于启动提示），如 Ctrl+Win+T / Space Space Space"""
+        specs = self._specs.get(action, []) if action else [
+            spec for specs in self._specs.values() for spec in specs]
+        return " / ".join(spec.title() for spec in specs) or "未设置"
+
+
+def _canonical(name: str) -> str:
+    name = name.strip()
+    return NAME_ALIASES.get(name, name)
+
+
+def windows_key_state() -> Optional[Callable[[str], bool]]:
+    """返回用 GetAsyncKeyState 查询修饰键真实状态的函数，不可用时返回None"""
+    try:
+        import win32api
+        get_state = win32api.GetAsyncKeyState
+    except (ImportError, AttributeError):
+        return None
+
+    def key_state(name: str) -> bool:
+        return any(get_state(vk) & 0x8000 for vk in MODIFIER_VK[name])
+    return key_state
+
+
+def load_frontend_config(path: str = "translator_config.json") -> dict:
+    """读取前端使用的配置（快捷键、预翻译等）；不导入engines，避免启动时加载HTTP库"""
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"加载配置失败: {e}")
+    return {}
+
+
+def build_matcher(config: Optional[dict], defaults: Dict[str, Binding],
+                  actions: Dict[str, Callable[[], None]], key_class) -> HotkeyMatcher:
+    """按配置的 hotkeys / sequence_timeout_ms 创建匹配器；配置无效时使用defaults
+
+    config 为None时读取 translator_config.json。配置只覆盖其中出现的动作；
+    几个前端共用一份配置，本前端没有的动作忽略。
+    """
+    if config is None:
+        config = load_frontend_config()
+    bindings = dict(defaults)
+    bindings.update((action, specs) for action, specs in (config.get("hotkeys") or {}).items()
+                    if action in actions)
+    try:
+        timeout = float(config.get("sequence_timeout_ms", 400)) / 1000
+    except (TypeError, ValueError):
+        timeout = 0.4
+    key_state = windows_key_state()
+    try:
+        return HotkeyMatcher(bindings, actions, key_class, timeout, key_state=key_state)
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"快捷键配置无效（{e}），使用默认快捷键")
+        return HotkeyMatcher(defaults, actions, key_class, timeout, key_state=key_state)
@@ -0,0 +1,129 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # 可选依赖，用于HTTP/2
+except ImportError:
+    httpx = None
+
+# 各翻译引擎的服务地址，用于预热和保活
+ENGINE_ENDPOINTS = {
+    "google": "https://translate.googleapis.com/",
+    "deepl": "https://api-free.deepl.com/",
+    "pot": "http://127.0.0.1:60828/",
+}
+
+
+class SessionPool:
+    """单个翻译引擎的长连接会话池"""
+    def __init__(self, engine: str, base_url: Optional[str] = None, pool_size: int = 4,
+                 http2: bool = False, keepalive_interval: float = 45.0, verify=True):
+        self.engine = engine
+        self.base_url = base_url or ENGINE_ENDPOINTS.get(engine, "")
+        self.pool_size = pool_size
+        self.keepalive_interval = keepalive_interval
+        self.verify = verify
+        self.last_used = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+        self.http2 = bool(http2 and httpx is not None)
+        if http2 and httpx is None:
+            print("未安装httpx，HTTP/2不可用，回退到HTTP/1.1")
+        self.client = self._create_client()
+
+    def _create_client(self):
+        """创建底层客户端（requests.Session或httpx.Client）"""
+        if self.http2:
+            limits = httpx.Limits(max_connections=self.pool_size,
+                                  max_keepalive_connections=self.pool_size)
+            return httpx.Client(http2=True, limits=limits, verify=self.verify)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = self.verify
+        session.headers["Connection"] = "keep-alive"
+        return session
+
+    def request(self, method: str, url: str, **kwargs):
+        """发送请求"""
+        self.last_used = time.time()
+        if not self.http2:
+            # requests会用环境变量中的CA覆盖Session.verify，这里显式传入
+            kwargs.setdefault("verify", self.verify)
+        return self.client.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        """发送GET请求"""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """发送POST请求"""
+        return self.request("POST", url, **kwargs)
+
+    def warm_up(self, timeout: float = 3.0) -> bool:
+        """预先完成DNS、TCP和TLS握手"""
+        if not self.base_url:
+            return False
+        try:
+            self.request("HEAD", self.base_url, timeout=timeout)
+            return True
+        except Exception as e:
+            print(f"预热{self.engine}连接失败: {e}")
+            return False
+
+    def warm_up_async(self):
+        """在后台线程中预热"""
+        threading.Thread(target=self.warm_up, name=f"warmup-{self.engine}", daemon=True).start()
+
+    def start_keepalive(self):
+        """启动保活线程：空闲超过间隔后重新预热连接"""
+        with self._lock:
+            if self._keepalive_thread is not None or self.keepalive_interval <= 0:
+                return
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive_loop, name=f"keepalive-{self.engine}", daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        """保活循环"""
+        while not self._stop.wait(self.keepalive_interval / 3):
+            if time.time() - self.last_used >= self.keepalive_interval:
+                self.warm_up()
+
+    def close(self):
+        """关闭会话池"""
+        self._stop.set()
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(engine: str, **kwargs) -> SessionPool:
+    """获取（或创建）引擎对应的共享会话池"""
+    with _pools_lock:
+        pool = _pools.get(engine)
+        if pool is None:
+            pool = SessionPool(engine, **kwargs)
+            _pools[engine] = pool
+        return pool
+
+
+def warm_up_engine(engine: str, **kwargs) -> SessionPool:
+    """获取会话池并在后台预热、启动保活"""
+    pool = get_pool(engine, **kwargs)
+    pool.warm_up_async()
+    pool.start_keepalive()
+    return pool
@@ -0,0 +1,121 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from segmenter import SegmentingEngine, reassemble, segment_text, sentence_segments
+
+
+def _segment_hash(text: str, source_lang: str, target_lang: str) -> bytes:
+    raw = f"{source_lang.lower()}\x1f{target_lang.lower()}\x1f{text}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).digest()
+
+
+class IncrementalTranslator:
+    """增量翻译：按窗口记录段落原文哈希到译文的映射，再次触发时只发送新增或修改的段落
+
+    已替换进窗口的译文段落也会被记录（映射到自身），
+    因此在译文中插入一句中文再次触发时，只有这一句会被发送。
+    """
+    def __init__(self, engine: SegmentingEngine, max_windows: int = 32,
+                 max_segments: int = 2000):
+        self.engine = engine
+        self.max_windows = max_windows
+        self.max_segments = max_segments
+        self.chars_sent = 0
+        self.chars_reused = 0
+        self.last_sent = 0
+        self.last_reused = 0
+        self._windows: "OrderedDict[Hashable, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _window_state(self, window_key: Hashable) -> OrderedDict:
+        """获取窗口的段落状态（调用方持有锁）"""
+        state = self._windows.get(window_key)
+        if state is None:
+            state = OrderedDict()
+            self._windows[window_key] = state
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(window_key)
+        return state
+
+    def _remember(self, state: OrderedDict, key: bytes, translated: str):
+        """记录段落译文（调用方持有锁）"""
+        state[key] = translated
+        state.move_to_end(key)
+        while len(state) > self.max_segments:
+            state.popitem(last=False)
+
+    def translate(self, window_key: Hashable, text: str, source_lang: str,
+                  target_lang: str, timeout: float = 5.0) -> Optional[str]:
+        """翻译窗口文本，复用该窗口中未变化段落（或句子）的译文"""
+        segments = segment_text(text, self.engine.max_chars)
+        units = [segment.text for segment in segments if segment.translate]
+
+        def key(source: str) -> bytes:
+            return _segment_hash(source, source_lang, target_lang)
+
+        # 每个段落: (段落译文或None, 句子片段, 句子译文列表)
+        plans = []
+        requests: List[str] = []
+        with self._lock:
+            state = self._window_state(window_key)
+            for unit in units:
+                translated = state.get(key(unit))
+                if translated is not None:
+                    plans.append((translated, None, None))
+                    continue
+                # 段落有变化：若其中部分句子已知，只发送未知的句子
+                sentences = sentence_segments(unit)
+                known = [state.get(key(segment.text)) if segment.translate else None
+                         for segment in sentences]
+                if len(sentences) > 1 and any(known):
+                    plans.append((None, sentences, known))
+                    requests.extend(segment.text for segment, hit in zip(sentences, known)
+                                    if segment.translate and hit is None)
+                else:
+                    plans.append((None, None, None))
+                    requests.append(unit)
+
+        self.last_sent = sum(len(request) for request in requests)
+        self.last_reused = sum(len(unit) for unit in units) - self.last_sent
+        results = iter(())
+        if requests:
+            translated_requests = self.engine.translate_segments(
+                requests, source_lang, target_lang, timeout
+            )
+            if any(not result for result in translated_requests):
+                print(f"[{self.engine.name}] 增量翻译失败")
+                return None
+            results = iter(translated_requests)
+
+        translations = []
+        for unit, (translated, sentences, known) in zip(units, plans):
+            if translated is None and sentences is None:
+                translated = next(results)
+            elif translated is None:
+                parts = [hit if hit is not None else next(results)
+                         for segment, hit in zip(sentences, known) if segment.translate]
+                translated = reassemble(sentences, parts)
+            translations.append(translated)
+
+        with self._lock:
+            state = self._window_state(window_key)
+            for unit, translated in zip(units, translations):
+                self._remember(state, key(unit), translated)
+                # 译文已经是目标语言，下次原样保留（整段和逐句）
+                self._remember(state, key(translated.strip()), translated)
+                for segment in sentence_segments(translated):
+                    if segment.translate:
+                        self._remember(state, key(segment.text), segment.text)
+            self.chars_sent += self.last_sent
+            self.chars_reused += self.last_reused
+
+        return reassemble(segments, translations)
+
+    def forget(self, window_key: Hashable):
+        """清除窗口状态"""
+        with self._lock:
+            self._windows.pop(window_key, None)
@@ -0,0 +1,235 @@
+"""基于Unicode区块的文字与语言检测
+
+启动时预先生成一张 码位 -> 字符类别 的查找表，检测时只需逐字符查表计数，
+常见聊天消息（几百字符以内）耗时在几十微秒量级。批量检测时如果安装了NumPy，
+会把整批文本一次性转换为码位数组，用向量化查表和 bincount 统计。
+
+只能区分文字（汉字、假名、谚文、西里尔字母……），同一文字的不同语言只靠少数标志字母区分:
+- 拉丁字母不判断语言：没有重音字母的也可能是西班牙语、印尼语、他加禄语等
+- 汉字中假名占比超过 KANA_RATIO 时为日文，否则为中文
+- 西里尔字母中出现乌克兰语特有字母时为乌克兰语，否则为俄语
+"""
+from typing import Iterable, List, NamedTuple, Optional
+
+# 字符类别对应的文字，同一文字可以有多个类别（用于区分语言的标志字母）
+_CLASSES = (
+    "common",       # 0 数字、空白、标点、符号、表情
+    "latin",        # 1 ASCII字母
+    "latin",        # 2 非ASCII拉丁字母（重音字母等）
+    "han",          # 3
+    "kana",         # 4 平假名、片假名
+    "hangul",       # 5
+    "cyrillic",     # 6
+    "cyrillic",     # 7 乌克兰语特有字母
+    "greek",        # 8
+    "arabic",       # 9
+    "hebrew",       # 10
+    "thai",         # 11
+    "devanagari",   # 12
+    "other",        # 13 其他文字
+)
+COMMON, LATIN, LATIN_EXT, HAN, KANA, HANGUL, CYRILLIC, CYRILLIC_UK = range(8)
+GREEK, ARABIC, HEBREW, THAI, DEVANAGARI, OTHER = range(8, 14)
+_NUM_CLASSES = len(_CLASSES)
+
+# 表意文字和音节文字一个字大致相当于几个拉丁字母，按权重折算后再比较占比
+_WEIGHTS = (0, 1, 1, 3, 3, 3, 1, 1, 1, 1, 1, 1, 1, 1)
+
+# 各文字默认对应的语言（None 表示同一文字的语言太多，无法判断）
+_SCRIPT_LANGUAGES = {
+    "latin": None, "han": "zh-CN", "kana": "ja", "hangul": "ko", "cyrillic": "ru",
+    "greek": "el", "arabic": "ar", "hebrew": "he", "thai": "th", "devanagari": None,
+    "other": None,
+}
+KANA_RATIO = 0.25  # 中文偶尔夹杂“の”之类的假名，日文中假名通常占一半左右
+
+# (起始码位, 结束码位（含）, 类别)，按顺序写入，后面的区间覆盖前面的
+_RANGES = (
+    (0x0000, 0x00FF, COMMON),
+    (0x0041, 0x005A, LATIN), (0x0061, 0x007A, LATIN),
+    (0x00C0, 0x00FF, LATIN_EXT), (0x00D7, 0x00D7, COMMON), (0x00F7, 0x00F7, COMMON),
+    (0x0100, 0x02AF, LATIN_EXT),
+    (0x02B0, 0x036F, COMMON),                   # 修饰符号、组合附加符号
+    (0x0370, 0x03FF, GREEK), (0x1F00, 0x1FFF, GREEK),
+    (0x0400, 0x052F, CYRILLIC), (0x1C80, 0x1C8F, CYRILLIC),
+    (0x2DE0, 0x2DFF, CYRILLIC), (0xA640, 0xA69F, CYRILLIC),
+    (0x0404, 0x0404, CYRILLIC_UK), (0x0406, 0x0407, CYRILLIC_UK),
+    (0x0454, 0x0454, CYRILLIC_UK), (0x0456, 0x0457, CYRILLIC_UK),
+    (0x0490, 0x0491, CYRILLIC_UK),
+    (0x0590, 0x05FF, HEBREW), (0xFB1D, 0xFB4F, HEBREW),
+    (0x0600, 0x06FF, ARABIC), (0x0750, 0x077F, ARABIC), (0x08A0, 0x08FF, ARABIC),
+    (0xFB50, 0xFDFF, ARABIC), (0xFE70, 0xFEFE, ARABIC),
+    (0x0660, 0x0669, COMMON), (0x06F0, 0x06F9, COMMON),  # 阿拉伯数字
+    (0x0900, 0x097F, DEVANAGARI), (0x0966, 0x096F, COMMON),
+    (0x0E00, 0x0E7F, THAI), (0x0E50, 0x0E59, COMMON),
+    (0x1100, 0x11FF, HANGUL), (0x3130, 0x318F, HANGUL), (0xA960, 0xA97F, HANGUL),
+    (0xAC00, 0xD7FF, HANGUL),
+    (0x1E00, 0x1EFF, LATIN_EXT), (0x2C60, 0x2C7F, LATIN_EXT), (0xA720, 0xA7FF, LATIN_EXT),
+    (0x2000, 0x2BFF, COMMON),                   # 标点、货币、箭头、数学符号、制表符
+    (0x2E00, 0x2E7F, COMMON),
+    (0x2E80, 0x2FDF, HAN), (0x3400, 0x4DBF, HAN), (0x4E00, 0x9FFF, HAN),
+    (0xF900, 0xFAFF, HAN), (0x20000, 0x323AF, HAN),
+    (0x3000, 0x303F, COMMON),                   # 中日韩标点
+    (0x3040, 0x30FF, KANA), (0x31F0, 0x31FF, KANA), (0x30FB, 0x30FB, COMMON),
+    (0xFE00, 0xFE4F, COMMON),                   # 变体选择符、竖排标点
+    (0xFF00, 0xFFEF, COMMON),                   # 全角符号
+    (0xFF21, 0xFF3A, LATIN), (0xFF41, 0xFF5A, LATIN),
+    (0xFF66, 0xFF9F, KANA), (0xFFA0, 0xFFDC, HANGUL),
+    (0xFEFF, 0xFEFF, COMMON), (0xFFF0, 0xFFFF, COMMON),
+    (0x1F000, 0x1FAFF, COMMON),                 # 表情、扑克、麻将等
+    (0xE0000, 0xE007F, COMMON),                 # 标签字符（旗帜表情）
+)
+
+
+def _build_table() -> bytearray:
+    table = bytearray([OTHER]) * 0x110000
+    for start, end, category in _RANGES:
+        table[start:end + 1] = bytes([category]) * (end - start + 1)
+    return table
+
+
+_TABLE = _build_table()
+_SCRIPTS = tuple(dict.fromkeys(_CLASSES[1:]))  # 不含common，顺序与类别一致
+_np_tables = None
+
+
+class Detection(NamedTuple):
+    """检测结果"""
+    script: str                 # 主要文字，没有字母时为 "common"
+    language: Optional[str]     # 推测的语言代码，无法判断时为None
+    confidence: float           # 主要文字在全部字母中的（加权）占比
+
+    @property
+    def has_letters(self) -> bool:
+        return self.script != "common"
+
+
+_EMPTY = Detection("common", None, 0.0)
+
+
+def _from_counts(counts) -> Detection:
+    """由各类别的字符数得出检测结果"""
+    scripts = {}
+    total = 0
+    for category in range(1, _NUM_CLASSES):
+        count = counts[category]
+        if count:
+            weighted = count * _WEIGHTS[category]
+            name = _CLASSES[category]
+            scripts[name] = scripts.get(name, 0) + weighted
+            total += weighted
+    if not total:
+        return _EMPTY
+
+    # 日文混用汉字和假名，一起计算占比
+    kana = scripts.get("kana", 0)
+    han = scripts.get("han", 0)
+    if kana and kana >= KANA_RATIO * (han + kana):
+        return Detection("kana", "ja", (han + kana) / total)
+
+    script = max(scripts, key=scripts.get)
+    language = _SCRIPT_LANGUAGES[script]
+    if script == "cyrillic" and counts[CYRILLIC_UK]:
+        language = "uk"
+    return Detection(script, language, scripts[script] / total)
+
+
+def detect(text: str) -> Detection:
+    """检测单段文本的主要文字和语言"""
+    if not text:
+        return _EMPTY
+    categories = bytes(map(_TABLE.__getitem__, map(ord, text)))
+    return _from_counts([categories.count(category) for category in range(_NUM_CLASSES)])
+
+
+def _numpy():
+    """NumPy可用时返回 (numpy, 查找表数组, 类别->文字的加权投影矩阵)，否则返回None"""
+    global _np_tables
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    if _np_tables is None:
+        projection = np.zeros((_NUM_CLASSES, len(_SCRIPTS)), dtype=np.int64)
+        for category in range(1, _NUM_CLASSES):
+            projection[category, _SCRIPTS.index(_CLASSES[category])] = _WEIGHTS[category]
+        _np_tables = np.frombuffer(_TABLE, dtype=np.uint8), projection
+    return (np,) + _np_tables
+
+
+def _from_count_matrix(np, counts, projection) -> List[Detection]:
+    """_from_counts 的向量化版本，counts 每行为一段文本的各类别字符数"""
+    scores = counts @ projection
+    totals = scores.sum(axis=1)
+    han = scores[:, _SCRIPTS.index("han")]
+    kana = scores[:, _SCRIPTS.index("kana")]
+    japanese = (kana > 0) & (kana >= KANA_RATIO * (han + kana))
+    best = scores.argmax(axis=1)
+    best_scores = np.where(japanese, han + kana, scores[np.arange(len(scores)), best])
+    confidences = best_scores / np.maximum(totals, 1)
+
+    results = []
+    for total, is_japanese, index, confidence, uk in zip(
+            totals.tolist(), japanese.tolist(), best.tolist(), confidences.tolist(),
+            counts[:, CYRILLIC_UK].tolist()):
+        if not total:
+            results.append(_EMPTY)
+            continue
+        if is_japanese:
+            results.append(Detection("kana", "ja", confidence))
+            continue
+        script = _SCRIPTS[index]
+        language = _SCRIPT_LANGUAGES[script]
+        if script == "cyrillic" and uk:
+            language = "uk"
+        results.append(Detection(script, language, confidence))
+    return results
+
+
+def detect_batch(texts: Iterable[str], min_chars: int = 4096) -> List[Detection]:
+    """批量检测
+
+    总字符数达到min_chars且安装了NumPy时，整批文本一次性向量化查表和统计；
+    否则逐条检测（小批量时转换数组的固定开销反而更大）。
+    """
+    texts = list(texts)
+    lengths = [len(text) for text in texts]
+    vectorized = _numpy() if sum(lengths) >= min_chars else None
+    if vectorized is None:
+        return [detect(text) for text in texts]
+
+    np, table, projection = vectorized
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype="<u4")
+    categories = table[codepoints].astype(np.intp)
+    owners = np.repeat(np.arange(len(texts), dtype=np.intp), lengths)
+    counts = np.bincount(owners * _NUM_CLASSES + categories,
+                         minlength=len(texts) * _NUM_CLASSES).reshape(len(texts), _NUM_CLASSES)
+    return _from_count_matrix(np, counts, projection)
+
+
+def _split_code(code: str):
+    parts = code.strip().lower().replace("_", "-").split("-", 1)
+    return parts[0], parts[1] if len(parts) > 1 else None
+
+
+def same_language(a: str, b: str) -> bool:
+    """语言代码是否指同一语言（zh-CN 与 zh 相同，zh-CN 与 zh-TW 不同）"""
+    language_a, region_a = _split_code(a)
+    language_b, region_b = _split_code(b)
+    if language_a != language_b:
+        return False
+    return region_a is None or region_b is None or region_a == region_b
+
+
+def is_target_language(detection: Detection, target_lang: str, threshold: float = 0.9) -> bool:
+    """文本是否已经是目标语言（主要文字占比达到threshold）"""
+    return (detection.language is not None and detection.confidence >= threshold
+            and same_language(detection.language, target_lang))
+
+
+def choose_source_lang(detection: Detection, default: str = "auto",
+                       threshold: float = 0.6) -> str:
+    """检测结果足够可信时返回检测到的语言，否则返回default"""
+    if detection.language is not None and detection.confidence >= threshold:
+        return detection.language
+    return default
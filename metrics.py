@@ -0,0 +1,212 @@
+"""轻量的耗时统计与计数器，导出为 Prometheus 文本格式
+
+默认关闭，关闭时 span()/inc()/observe() 只判断一个布尔值，几乎没有开销。
+通过环境变量启用:
+    TRANSLATOR_METRICS_FILE=metrics.prom  定期写入文本文件（可交给 node_exporter 的 textfile 收集器）
+    TRANSLATOR_METRICS_PORT=9464          在 127.0.0.1 上提供 /metrics
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+PREFIX = "translator_"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """固定桶的耗时直方图（秒）"""
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Span:
+    """计时区间，退出时记录到 <name>_seconds 直方图"""
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc(f"{self.name}_errors", **self.labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """计数器与直方图的集合"""
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, Histogram] = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加value，导出为 <name>_total"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """记录一次耗时，导出为 <name>_seconds 直方图"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def span(self, name: str, **labels):
+        """计时区间: with metrics.span("stage", stage="read"): ..."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()),
+                key=lambda item: item[0]
+            )
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f"{metric}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """原子地写入文本文件（先写临时文件再替换）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_textfile_writer(self, path: str, interval: float = 10.0):
+        """后台定期写入文本文件"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_textfile(path)
+                except OSError as e:
+                    print(f"写入指标文件错误: {e}")
+        threading.Thread(target=loop, name="metrics-writer", daemon=True).start()
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """在本地端口提供 /metrics"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server
+
+
+metrics = Metrics()
+
+
+def configure_from_env() -> bool:
+    """根据环境变量启用指标导出，返回是否已启用"""
+    path = os.environ.get("TRANSLATOR_METRICS_FILE")
+    port = os.environ.get("TRANSLATOR_METRICS_PORT")
+    if not path and not port:
+        return False
+    metrics.enabled = True
+    if path:
+        metrics.start_textfile_writer(path)
+        print(f"指标写入: {path}")
+    if port:
+        try:
+            metrics.serve(int(port))
+            print(f"指标地址: http://127.0.0.1:{port}/metrics")
+        except (OSError, ValueError) as e:
+            print(f"启动指标服务失败: {e}")
+    return True
@@ -0,0 +1,212 @@
+"""打字停顿时的后台预翻译
+
+键盘监听本来就能看到每次按键。开启预翻译后，用户停止输入 pause 秒时，读取当前
+前台输入框的内容并在后台翻译，结果按文本的哈希保存；随后按下快捷键时，如果读到的
+文本与预翻译时一致，直接使用结果，不必再等待翻译引擎。
+
+配置（translator_config.json，默认关闭）:
+    "pretranslate": true,
+    "pretranslate_pause_ms": 800,           # 停止输入多久后开始预翻译
+    "pretranslate_max_concurrent": 1,       # 同时进行的预翻译请求数
+    "pretranslate_chars_per_minute": 2000,  # 每分钟最多预翻译的字符数
+    "pretranslate_max_chars": 1000          # 超过该长度的文本不预翻译
+
+只有能够不打扰用户地读取文本（不用剪贴板、不发送按键）的输入框才会预翻译，
+由前端提供的 peek_text 决定；读不到文本的窗口不预翻译。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import metrics
+
+Key = Tuple[int, str]
+
+
+def text_key(hwnd: int, text: str) -> Key:
+    """结果的键：窗口句柄 + 去掉首尾空白后的文本哈希"""
+    return hwnd, hashlib.blake2b(text.strip().encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PreTranslator:
+    """检测打字停顿并在后台预先翻译当前输入框
+
+    foreground: 返回当前前台窗口句柄
+    peek_text: peek_text(hwnd) 不打扰用户地读取输入框文本，不支持时返回空字符串
+    translate: translate(hwnd, text) 返回译文；不需要翻译（已是目标语言等）时返回None
+    """
+    def __init__(self, foreground: Callable[[], int], peek_text: Callable[[int], str],
+                 translate: Callable[[int, str], Optional[str]], pause: float = 0.8,
+                 max_concurrent: int = 1, chars_per_minute: int = 2000,
+                 max_chars: int = 1000, max_results: int = 16, ttl: float = 300.0):
+        self.foreground = foreground
+        self.peek_text = peek_text
+        self.translate = translate
+        self.pause = pause
+        self.max_concurrent = max_concurrent
+        self.chars_per_minute = chars_per_minute
+        self.max_chars = max_chars
+        self.max_results = max_results
+        self.ttl = ttl
+        self._budget = None
+        self._results: "OrderedDict[Key, Tuple[str, float]]" = OrderedDict()
+        self._pending: Dict[Key, Future] = {}
+        self._lock = threading.Lock()
+        self._last_key = 0.0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent,
+                                            thread_name_prefix="pretranslate")
+        self._thread = threading.Thread(target=self._run, name="pretranslate", daemon=True)
+
+    def start(self):
+        """启动停顿检测线程"""
+        self._thread.start()
+        return self
+
+    def on_keystroke(self):
+        """记录一次按键（在键盘钩子线程中调用，必须立即返回）"""
+        self._last_key = time.monotonic()
+        self._wakeup.set()
+
+    def take(self, hwnd: int, text: str, timeout: float = 5.0) -> Optional[str]:
+        """取出与text对应的预翻译结果；翻译仍在进行时最多等待timeout秒，没有时返回None"""
+        translated, _ = self._take(hwnd, text, timeout)
+        return translated
+
+    def take_or_translate(self, hwnd: int, text: str,
+                          translate: Callable[[float], Optional[str]],
+                          timeout: float = 5.0) -> Optional[str]:
+        """快捷键路径：优先使用预翻译结果，否则在剩余时间内调用translate(剩余秒数)
+
+        预翻译请求仍在进行时只等待到timeout，不再重复发出同样的请求；超时后该请求
+        继续在后台完成并保存结果，下次按快捷键时直接使用。
+        """
+        start = time.monotonic()
+        translated, in_flight = self._take(hwnd, text, timeout)
+        if translated:
+            print("使用预翻译结果")
+            return translated
+        if in_flight:
+            print("预翻译未在时限内完成，结果将保留供下次使用")
+            return None
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return None
+        return translate(remaining)
+
+    def _take(self, hwnd: int, text: str, timeout: float) -> Tuple[Optional[str], bool]:
+        """返回 (预翻译结果, 请求是否仍在进行)"""
+        key = text_key(hwnd, text)
+        with self._lock:
+            entry = self._results.pop(key, None)
+            future = self._pending.get(key)
+        if entry is not None:
+            translated, created = entry
+            if time.monotonic() - created <= self.ttl:
+                metrics.inc("pretranslations", result="hit")
+                return translated, False
+        if future is not None:
+            try:
+                translated = future.result(max(0.0, timeout))
+            except FutureTimeout:
+                # 不取消：完成后由_finish保存到_results
+                metrics.inc("pretranslations", result="late")
+                return None, True
+            except Exception:
+                translated = None
+            if translated:
+                with self._lock:
+                    self._results.pop(key, None)
+                metrics.inc("pretranslations", result="joined")
+                return translated, False
+        metrics.inc("pretranslations", result="miss")
+        return None, False
+
+    def _run(self):
+        # 在后台线程中导入，避免启动时加载HTTP相关模块
+        from resilience import TokenBucket
+        self._budget = TokenBucket(self.chars_per_minute / 60, self.chars_per_minute)
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # 等到最后一次按键之后pause秒；期间又有按键则继续等待
+            while not self._stop.is_set():
+                remaining = self._last_key + self.pause - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(remaining)
+            if self._stop.is_set():
+                break
+            try:
+                self._speculate()
+            except Exception as e:
+                print(f"预翻译错误: {e}")
+
+    def _speculate(self):
+        """停顿时读取前台输入框，条件满足时提交后台翻译"""
+        hwnd = self.foreground()
+        if not hwnd:
+            return
+        text = self.peek_text(hwnd)
+        if not text or not text.strip() or len(text) > self.max_chars:
+            return
+        key = text_key(hwnd, text)
+        with self._lock:
+            if key in self._results or key in self._pending:
+                return
+            if len(self._pending) >= self.max_concurrent:
+                metrics.inc("pretranslations", result="busy")
+                return
+            if not self._budget.try_acquire(len(text)):
+                metrics.inc("pretranslations", result="budget")
+                return
+            future = self._executor.submit(self.translate, hwnd, text)
+            self._pending[key] = future
+        metrics.inc("pretranslations", result="started")
+        future.add_done_callback(lambda f: self._finish(key, f))
+
+    def _finish(self, key: Key, future: Future):
+        try:
+            translated = future.result()
+        except Exception as e:
+            print(f"预翻译失败: {e}")
+            translated = None
+        with self._lock:
+            self._pending.pop(key, None)
+            if translated:
+                self._results[key] = (translated, time.monotonic())
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+
+    def stop(self, timeout: float = 1.0):
+        """停止停顿检测线程"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+
+def build_pretranslator(config: dict, foreground: Callable[[], int],
+                        peek_text: Callable[[int], str],
+                        translate: Callable[[int, str], Optional[str]]) -> Optional[PreTranslator]:
+    """按配置创建并启动预翻译；未开启时返回None"""
+    if not config.get("pretranslate"):
+        return None
+    try:
+        pretranslator = PreTranslator(
+            foreground, peek_text, translate,
+            pause=float(config.get("pretranslate_pause_ms", 800)) / 1000,
+            max_concurrent=max(1, int(config.get("pretranslate_max_concurrent", 1))),
+            chars_per_minute=int(config.get("pretranslate_chars_per_minute", 2000)),
+            max_chars=int(config.get("pretranslate_max_chars", 1000)))
+    except (TypeError, ValueError) as e:
+        print(f"预翻译配置无效: {e}")
+        return None
+    print("✓ 已开启打字停顿时的预翻译")
+    return pretranslator.start()
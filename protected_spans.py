@@ -0,0 +1,117 @@
+"""受保护片段：URL、代码、@提及、文件路径和表情不发送给翻译引擎
+
+聊天文本里的这些内容不需要翻译，交给引擎只会增加请求大小，还可能被改坏。
+protect() 一次正则扫描把它们换成紧凑的占位符 ⟦0⟧ ⟦1⟧ ...（相同的片段共用一个），
+翻译后 restore() 换回原文；去掉受保护片段后没有可翻译的文字时不必请求引擎。
+
+    >>> masked = protect("看下 https://example.com/a?b=1 @张三\u2005谢谢😂")
+    >>> masked.text
+    '看下 ⟦0⟧ ⟦1⟧\u2005谢谢⟦2⟧'
+    >>> masked.restore("Look at ⟦0⟧ ⟦1⟧ thanks⟦2⟧")
+    'Look at https://example.com/a?b=1 @张三 thanks😂'
+"""
+import re
+from typing import NamedTuple, Tuple
+
+OPEN, CLOSE = "⟦", "⟧"
+
+_EMOJI_CHAR = ("\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2300-\u23FF"
+               "\u3030\u303D\u3297\u3299")
+_EMOJI_MODIFIER = "\uFE0F\u20E3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F"
+# 微信/QQ的文字表情名称（[捂脸] 等）；只认这些名称，[通知]、[紧急] 之类的标签照常翻译
+_STICKERS = frozenset((
+    "微笑", "撇嘴", "色", "发呆", "得意", "流泪", "害羞", "闭嘴", "睡", "大哭", "尴尬", "发怒",
+    "调皮", "呲牙", "惊讶", "难过", "酷", "冷汗", "抓狂", "吐", "偷笑", "愉快", "可爱", "白眼",
+    "傲慢", "饥饿", "困", "惊恐", "流汗", "憨笑", "悠闲", "大兵", "奋斗", "咒骂", "疑问", "嘘",
+    "晕", "疯了", "折磨", "衰", "骷髅", "敲打", "再见", "擦汗", "抠鼻", "鼓掌", "糗大了", "坏笑",
+    "左哼哼", "右哼哼", "哈欠", "鄙视", "委屈", "快哭了", "阴险", "亲亲", "吓", "可怜", "菜刀",
+    "西瓜", "啤酒", "篮球", "乒乓", "咖啡", "饭", "猪头", "玫瑰", "凋谢", "嘴唇", "爱心", "心碎",
+    "蛋糕", "闪电", "炸弹", "刀", "足球", "瓢虫", "便便", "月亮", "太阳", "礼物", "拥抱", "强",
+    "弱", "握手", "胜利", "抱拳", "勾引", "拳头", "差劲", "爱你", "NO", "OK", "爱情", "飞吻",
+    "跳跳", "发抖", "怄火", "转圈", "磕头", "回头", "跳绳", "投降", "激动", "乱舞", "献吻",
+    "左太极", "右太极", "嘿哈", "捂脸", "奸笑", "机智", "皱眉", "耶", "吃瓜", "加油", "汗",
+    "天啊", "Emm", "社会社会", "旺柴", "好的", "打脸", "哇", "翻白眼", "666", "让我看看", "叹气",
+    "苦涩", "裂开", "红包", "發", "福", "烟花", "爆竹", "庆祝", "斜眼笑", "笑哭", "doge", "泪奔",
+    "无奈", "卖萌", "小纠结", "喷血", "点赞", "托腮", "敬礼", "狂笑", "面无表情", "摸鱼", "睁眼",
+    "哦哟", "吃糖", "生气", "惊喜", "暗中观察", "拜托", "无语", "尊嘟假嘟",
+))
+# URL 末尾的标点属于句子而不是链接
+_URL_TAIL = "\\s<>\"'`.,;:!?)\\]}，。！？、；：（）【】《》「」“”‘’"
+
+_SPANS = (
+    ("fence", r"```.*?```"),
+    ("code", r"`[^`\n]+`"),
+    ("url", rf"(?:https?://|ftp://|www\.)[^\s<>\"]*[^{_URL_TAIL}]"),
+    ("email", r"(?<![A-Za-z0-9._+-])[A-Za-z0-9._+-]+@[\w-]+(?:\.[\w-]+)+"),
+    # 微信的@提及以 U+2005 结尾，QQ 以空格结尾；没有结尾的不算（避免吞掉后面的正文）
+    ("mention", r"@[^\s@\u2005]{1,32}(?=[\s\u2005])"),
+    ("path", r"[A-Za-z]:\\[^\s<>\"|?*，。！？、；：]+|\\\\[^\s\\]+\\[^\s<>\"|?*，。]+"
+             r"|(?<![\w/.])(?:~|\.{1,2})?/(?:[\w.-]+/)+[\w.-]*"),
+    ("emoji", rf"(?:[{_EMOJI_CHAR}][{_EMOJI_MODIFIER}]*(?:\u200D[{_EMOJI_CHAR}][{_EMOJI_MODIFIER}]*)*)+"
+              r"|(?P<sticker>\[\w{1,6}\])"),  # 是否为表情名称在 protect() 中查 _STICKERS
+    ("bracket", f"[{OPEN}{CLOSE}]"),  # 原文中的占位符括号本身也保护起来，还原时不会混淆
+)
+# 不可能是受保护片段开头的字符，以及后面不接 @ / . :/ 等的英文单词，整段一次匹配掉，
+# 不必在每个字符处逐一尝试上面的模式（见 benchmarks.py protect）
+_SPECIAL = f"`@\\\\/~.\\[{OPEN}{CLOSE}{_EMOJI_CHAR}A-Za-z0-9_+\\-"
+_PLAIN = (f"(?:[^{_SPECIAL}]+|[A-Za-z0-9]+(?:-[A-Za-z0-9]+)*"
+          r"(?![A-Za-z0-9_+@/\\-]|\.\S|:[/\\]))+")
+_PATTERN = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern
+                               in (("plain", _PLAIN),) + _SPANS), re.S)
+_PLACEHOLDER = re.compile(f"{OPEN}\\s*(\\d+)\\s*{CLOSE}")
+_LETTER = re.compile(r"[^\W\d_]")
+
+
+class Protected(NamedTuple):
+    """protect() 的结果：text 为替换后的文本，spans[i] 为占位符 ⟦i⟧ 对应的原文"""
+    text: str
+    spans: Tuple[str, ...] = ()
+
+    @property
+    def translatable(self) -> bool:
+        """去掉受保护片段后是否还有需要翻译的文字"""
+        return _LETTER.search(self.text) is not None
+
+    def restore(self, translated: str) -> str:
+        """把译文中的占位符换回原文；引擎丢掉的片段附加在末尾"""
+        if not self.spans:
+            return translated
+        used = set()
+
+        def replace(match):
+            index = int(match.group(1))
+            if index >= len(self.spans):
+                return match.group(0)
+            used.add(index)
+            return self.spans[index]
+        restored = _PLACEHOLDER.sub(replace, translated)
+        missing = [span for index, span in enumerate(self.spans) if index not in used]
+        if missing:
+            restored = " ".join([restored.rstrip(), *missing])
+        return restored
+
+
+def protect(text: str) -> Protected:
+    """把受保护的片段换成占位符（单次扫描）"""
+    parts = []
+    spans = []
+    numbers = {}
+    position = 0
+    for match in _PATTERN.finditer(text):
+        if match.lastgroup == "plain":
+            continue
+        sticker = match.group("sticker")
+        if sticker is not None and sticker[1:-1] not in _STICKERS:
+            continue  # [通知] 之类的普通标签
+        span = match.group(0)
+        number = numbers.get(span)
+        if number is None:
+            number = numbers[span] = len(spans)
+            spans.append(span)
+        parts.append(text[position:match.start()])
+        parts.append(f"{OPEN}{number}{CLOSE}")
+        position = match.end()
+    if not spans:
+        return Protected(text)
+    parts.append(text[position:])
+    return Protected("".join(parts), tuple(spans))
@@ -0,0 +1,235 @@
+"""引擎调用的限流、重试与熔断
+
+- TokenBucket: 按引擎限制请求速率，突发请求在截止时间内排队等待
+- CircuitBreaker: 连续失败达到阈值后熔断，冷却期内直接失败，之后放行一个探测请求
+- backoff_delay: 带随机抖动的指数退避
+- ResilientEngine: 组合以上三者包装单个引擎，重试不会超出调用方给出的超时
+"""
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from engines import EngineError, TranslationEngine, current_cancellation
+from metrics import metrics
+
+# 默认的 (每秒请求数, 突发容量)
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "google": (10.0, 20.0),
+    "deepl": (10.0, 20.0),
+}
+# 不可重试，但说明引擎当前不可用的状态码（认证失败、DeepL额度用尽）
+UNAVAILABLE_STATUSES = (401, 403, 456)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """按经过的时间补充令牌（调用方持有锁）"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self) -> float:
+        """尝试取一个令牌，成功返回0，否则返回需要等待的秒数（调用方持有锁）"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """不等待地取tokens个令牌（例如按字符数计的预算），不够时返回False"""
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """获取一个令牌，在timeout秒内无法获得时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = self._take()
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器：closed -> (连续失败) -> open -> (冷却) -> half_open -> closed/open"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允许发出请求；半开状态只放行一个探测请求"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def release(self):
+        """放行的请求最终没有发出（例如被限流），归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回是否因此进入熔断"""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+    @property
+    def is_open(self) -> bool:
+        """处于熔断冷却期内"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 2.0) -> float:
+    """第attempt次重试前的等待时间（full jitter 指数退避）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class ResilientEngine(TranslationEngine):
+    """为单个引擎加上限流、有限次重试和熔断
+
+    熔断期间直接返回None（不发请求），对冲引擎会立即改用下一个引擎。
+    请求本身有误（其他4xx、结果格式错误）不重试，也不计入熔断。
+    """
+    def __init__(self, engine: TranslationEngine, rate: float = 10.0, burst: float = 20.0,
+                 max_attempts: int = 3, backoff_base: float = 0.2, backoff_cap: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.engine = engine
+        self.name = engine.name
+        self.max_chars = engine.max_chars
+        self.max_batch = engine.max_batch
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    @property
+    def available(self) -> bool:
+        """熔断器未打开"""
+        return not self.breaker.is_open
+
+    def request(self, text: str, source_lang: str, target_lang: str,
+                timeout: float = 5.0) -> str:
+        return self._call(lambda remaining: self.engine.request(
+            text, source_lang, target_lang, remaining), timeout)
+
+    def request_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                      timeout: float = 5.0) -> List[str]:
+        # 一次批量请求只占用一个令牌
+        return self._call(lambda remaining: self.engine.request_batch(
+            texts, source_lang, target_lang, remaining), timeout)
+
+    def _call(self, send: Callable[[float], T], timeout: float) -> T:
+        """send(剩余时间) 发出一次请求；按限流、重试和熔断规则执行"""
+        deadline = time.monotonic() + timeout
+        cancellation = current_cancellation()
+        attempt = 0
+        while True:
+            if cancellation is not None:
+                cancellation.check()
+            if not self.breaker.allow():
+                metrics.inc("breaker_rejections", engine=self.name)
+                raise EngineError("熔断中，跳过请求", reason="breaker_open")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.bucket.acquire(remaining):
+                self.breaker.release()
+                raise EngineError("请求过于频繁，超时前无法发出", reason="rate_limited")
+            try:
+                translated = send(max(0.1, deadline - time.monotonic()))
+            except EngineError as e:
+                if e.retryable or e.status in UNAVAILABLE_STATUSES:
+                    if self.breaker.record_failure():
+                        metrics.inc("breaker_opened", engine=self.name)
+                        print(f"[{self.name}] 连续失败，熔断 {self.breaker.reset_timeout:g} 秒")
+                        raise
+                else:
+                    self.breaker.release()
+                attempt += 1
+                if not e.retryable or attempt >= self.max_attempts:
+                    raise
+                delay = backoff_delay(attempt - 1, self.backoff_base, self.backoff_cap)
+                if e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"[{self.name}] {e}，{delay:.2f} 秒后重试")
+                metrics.inc("engine_retries", engine=self.name)
+                if cancellation is not None:
+                    cancellation.wait(delay)  # 取消时提前结束，下一轮开头抛出
+                else:
+                    time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return translated
+
+    def warm_up(self):
+        self.engine.warm_up()
+
+
+def make_resilient(engine: TranslationEngine, config: dict) -> ResilientEngine:
+    """按配置包装引擎
+
+    相关配置项:
+        rate_limits: 每个引擎的 [每秒请求数, 突发容量]，如 {"google": [10, 20]}
+        max_attempts: 可重试错误（429、5xx、网络错误）的最多尝试次数
+        breaker_threshold: 连续失败多少次后熔断
+        breaker_reset: 熔断冷却时间（秒）
+    """
+    rate, burst = (config.get("rate_limits") or {}).get(
+        engine.name, DEFAULT_RATE_LIMITS.get(engine.name, (10.0, 20.0))
+    )
+    return ResilientEngine(
+        engine, rate=rate, burst=burst,
+        max_attempts=config.get("max_attempts", 3),
+        failure_threshold=config.get("breaker_threshold", 5),
+        reset_timeout=config.get("breaker_reset", 30.0),
+    )
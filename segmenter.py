@@ -0,0 +1,251 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from engines import TranslationEngine
+
+# 段落分隔：包含换行的空白
+_PARAGRAPH_BREAK = re.compile(r"[^\S\n]*\n\s*")
+# 句末标点（含中日文标点及其后的右引号/括号）；英文句号等需后接空白
+_SENTENCE_END = re.compile(
+    r"[。！？；…]+[”’」』）》\"')\]]*"
+    r"|[.!?;]+[”’\"')\]]*(?=\s)"
+)
+# 超长句子的次级切分点
+_SOFT_BREAK = re.compile(r"[，,、：:]\s*|\s+")
+_EDGES = re.compile(r"^(\s*)(.*?)(\s*)$", re.S)
+
+
+class Segment(NamedTuple):
+    """文本片段：translate为False时原样保留（空白、换行）"""
+    text: str
+    translate: bool
+
+
+def _split_sentences(paragraph: str) -> List[str]:
+    """按句末标点切分段落，切分结果拼接后等于原段落"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(paragraph):
+        end = match.end()
+        # 句后的空白归入上一句，便于之后去除首尾空白
+        while end < len(paragraph) and paragraph[end] in " \t　":
+            end += 1
+        sentences.append(paragraph[start:end])
+        start = end
+    if start < len(paragraph):
+        sentences.append(paragraph[start:])
+    return sentences
+
+
+def _hard_split(sentence: str, max_chars: int) -> List[str]:
+    """切分超过长度限制的单个句子，优先在逗号或空白处切分"""
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = 0
+        for match in _SOFT_BREAK.finditer(sentence, 0, max_chars):
+            if match.end() > 0:
+                cut = match.end()
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def _pack(paragraph: str, max_chars: int) -> List[str]:
+    """将段落内的句子合并为不超过max_chars的块"""
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    chunks = []
+    current = ""
+    for sentence in _split_sentences(paragraph):
+        for piece in _hard_split(sentence, max_chars):
+            if current and len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _emit(segments: List[Segment], chunk: str):
+    """将块拆为首尾空白和可翻译内容"""
+    lead, core, trail = _EDGES.match(chunk).groups()
+    if lead:
+        segments.append(Segment(lead, False))
+    if core:
+        segments.append(Segment(core, True))
+    if trail:
+        segments.append(Segment(trail, False))
+
+
+def sentence_segments(paragraph: str) -> List[Segment]:
+    """将单个段落按句子切分为片段"""
+    segments: List[Segment] = []
+    for sentence in _split_sentences(paragraph):
+        _emit(segments, sentence)
+    return segments
+
+
+def segment_text(text: str, max_chars: int = 1000) -> List[Segment]:
+    """将文本切分为引擎可接受大小的片段
+
+    段落（换行）边界总是切分点，段落内按句子合并为块；
+    所有空白和换行作为不翻译的片段保留，拼接全部片段即得到原文。
+    """
+    segments: List[Segment] = []
+
+    start = 0
+    for match in _PARAGRAPH_BREAK.finditer(text):
+        for chunk in _pack(text[start:match.start()], max_chars):
+            _emit(segments, chunk)
+        segments.append(Segment(match.group(), False))
+        start = match.end()
+    for chunk in _pack(text[start:], max_chars):
+        _emit(segments, chunk)
+    return segments
+
+
+def reassemble(segments: List[Segment], translations: List[str]) -> str:
+    """用译文替换可翻译片段，保留原有空白和换行
+
+    translations按顺序对应segments中translate为True的片段。
+    """
+    parts = []
+    translated = iter(translations)
+    previous_translated = False
+    for segment in segments:
+        if not segment.translate:
+            parts.append(segment.text)
+            previous_translated = False
+            continue
+        text = next(translated)
+        # 原文中相邻的句子没有空白（如中文），译为西文时补一个空格
+        if (previous_translated and parts and parts[-1][-1:] in ".!?;:,"
+                and text[:1].isalnum()):
+            parts.append(" ")
+        parts.append(text)
+        previous_translated = True
+    return "".join(parts)
+
+
+# 每个引擎同时进行的请求数上限
+ENGINE_CONCURRENCY = {"google": 4, "deepl": 2}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="segment")
+
+
+def _engine_semaphore(name: str) -> threading.BoundedSemaphore:
+    with _semaphores_lock:
+        semaphore = _semaphores.get(name)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(ENGINE_CONCURRENCY.get(name, 4))
+            _semaphores[name] = semaphore
+        return semaphore
+
+
+def group_segments(sources: List[str], max_chars: int,
+                   max_count: Optional[int] = None) -> List[List[int]]:
+    """将相邻的短片段合并为一次请求（以换行连接，或作为批量请求的多个片段），返回每组片段的下标"""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for index, source in enumerate(sources):
+        extra = len(source) + (1 if current else 0)
+        if current and (size + extra > max_chars or len(current) == max_count):
+            groups.append(current)
+            current, size = [], 0
+            extra = len(source)
+        current.append(index)
+        size += extra
+    if current:
+        groups.append(current)
+    return groups
+
+
+class SegmentingEngine(TranslationEngine):
+    """长文本分段引擎：超过引擎长度限制时分段并发翻译，再按原格式拼接"""
+    def __init__(self, engine: TranslationEngine, max_chars: Optional[int] = None):
+        self.engine = engine
+        self.name = engine.name
+        self.max_chars = max_chars or engine.max_chars
+        self.segmented_requests = 0
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  timeout: float = 5.0) -> Optional[str]:
+        if len(text) <= self.max_chars:
+            return self.engine.translate(text, source_lang, target_lang, timeout)
+
+        segments = segment_text(text, self.max_chars)
+        sources = [segment.text for segment in segments if segment.translate]
+        self.segmented_requests += 1
+        translations = self.translate_segments(sources, source_lang, target_lang, timeout)
+        failed = sum(1 for translated in translations if not translated)
+        if failed:
+            print(f"[{self.name}] 分段翻译失败: {failed}/{len(sources)} 段没有结果")
+            return None
+        return reassemble(segments, translations)
+
+    def translate_segments(self, sources: List[str], source_lang: str, target_lang: str,
+                           timeout: float = 5.0) -> List[Optional[str]]:
+        """并发翻译多个片段（不含换行），结果与sources一一对应，失败的为None
+
+        引擎支持批量请求时，相邻片段打包为一次请求并按位置取回译文；
+        否则以换行连接为一段文本，按行拆回。
+        """
+        semaphore = _engine_semaphore(self.engine.name)
+        max_batch = getattr(self.engine, "max_batch", 1)
+
+        def translate_one(chunk: str) -> Optional[str]:
+            with semaphore:
+                return self.engine.translate(chunk, source_lang, target_lang, timeout)
+
+        def translate_group(indexes: List[int]) -> List[Optional[str]]:
+            if len(indexes) == 1:
+                return [translate_one(sources[indexes[0]])]
+            if max_batch > 1:
+                with semaphore:
+                    return self.engine.translate_batch(
+                        [sources[i] for i in indexes], source_lang, target_lang, timeout)
+            translated = translate_one("\n".join(sources[i] for i in indexes))
+            lines = translated.split("\n") if translated else []
+            if len(lines) == len(indexes):
+                return lines
+            # 引擎没有保留换行，无法对应回原片段，逐段重新翻译
+            return [translate_one(sources[i]) for i in indexes]
+
+        translations: List[Optional[str]] = []
+        if max_batch > 1:
+            groups = group_segments(sources, min(self.max_chars, self.engine.max_chars), max_batch)
+        else:
+            groups = group_segments(sources, self.max_chars)
+        if len(groups) == 1:
+            return translate_group(groups[0])
+        for group_result in _executor.map(translate_group, groups):
+            translations.extend(group_result)
+        return translations
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                        timeout: float = 5.0) -> List[Optional[str]]:
+        """翻译多条互相独立的文本，短的单行文本打包请求，其余逐条分段翻译"""
+        results: List[Optional[str]] = [None] * len(texts)
+        packed, others = [], []
+        for index, text in enumerate(texts):
+            (packed if len(text) <= self.max_chars and "\n" not in text else others).append(index)
+        if packed:
+            translations = self.translate_segments([texts[index] for index in packed],
+                                                   source_lang, target_lang, timeout)
+            for index, translated in zip(packed, translations):
+                results[index] = translated
+        for index in others:
+            results[index] = self.translate(texts[index], source_lang, target_lang, timeout)
+        return results
+
+    def warm_up(self):
+        self.engine.warm_up()
@@ -1,25 +1,43 @@
 import win32gui
 import win32con
 import win32api
-import requests
 from pynput import keyboard
-import time
 from typing import Optional
+from translation_worker import TranslationJob, TranslationWorker
+from startup import BackgroundInit, mark_listening
+from metrics import configure_from_env, metrics
+import win32_calls
+from language_detect import choose_source_lang, detect, is_target_language
+from hotkeys import build_matcher
 
 class PotTranslator:
     def __init__(self):
         """初始化翻译器"""
-        self.ctrl_pressed = False
-        self.win_pressed = False
-        self.t_pressed = False
-        self.last_translation_time = 0
         self.pot_port = 60828
         self.pot_url = f"http://127.0.0.1:{self.pot_port}"
+        # 引擎、缓存在后台加载，Pot连接检测也不阻塞启动
+        self.services = BackgroundInit("翻译引擎", self.load_services)
+        BackgroundInit("Pot连接检测", self.check_pot)
+        self.worker = TranslationWorker(self.handle_translation).start()
+        # 快捷键在 translator_config.json 的 hotkeys 中设置
+        self.hotkeys = build_matcher(None, {"translate": "ctrl+win+t"},
+                                     {"translate": self.trigger_translation}, keyboard.Key)
         
         # 保存原始剪贴板内容
         self.original_clipboard = self.get_clipboard_text()
+        print("初始化完成，等待快捷键触发...")
+
+    def load_services(self):
+        """连接翻译服务（在后台线程中执行）"""
+        from translation_daemon import connect_or_local
         
-        # 测试Pot连接
+        # 常驻的本地翻译服务持有引擎连接、缓存和限流状态；
+        # 无法连接时在进程内翻译（默认使用DeepL）
+        self.translator = connect_or_local(default="deepl")
+
+    def check_pot(self):
+        """测试Pot连接"""
+        import requests
         try:
             response = requests.post(f"{self.pot_url}/translate", 
                 json={"text": "test", "from": "auto", "to": "en"},
@@ -32,7 +50,6 @@ class PotTranslator:
         except Exception as e:
             print("✗ 连接Pot失败:", e)
             print("请确保Pot程序已启动")
-        print("初始化完成，等待快捷键触发...")
 
     def get_clipboard_text(self) -> str:
         """获取剪贴板文本"""
@@ -60,19 +77,10 @@ class PotTranslator:
     def get_window_text(self, hwnd) -> str:
         """获取窗口文本"""
         try:
-            # 获取文本长度
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            if length == 0:
+            # 限时读取，目标程序卡死时不会阻塞
+            text = win32_calls.get_text(hwnd)
+            if not text:
                 return ""
-                
-            # 分配缓冲区
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            
-            # 获取文本
-            win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            
-            # 转换为字符串
-            text = buffer[:length].tobytes().decode('utf-16')
             print(f"获取到文本: {text}")
             return text
             
@@ -83,73 +91,71 @@ class PotTranslator:
     def set_window_text(self, hwnd, text: str) -> bool:
         """设置窗口文本"""
         try:
-            # 直接发送文本设置消息
-            result = win32gui.SendMessage(hwnd, win32con.WM_SETTEXT, 0, text)
-            return result != 0
+            # 直接发送文本设置消息（限时）
+            return win32_calls.set_text(hwnd, text)
         except Exception as e:
             print(f"设置文本错误: {e}")
             return False
 
-    def translate_text(self, text: str) -> Optional[str]:
+    def translate_text(self, text: str, window_key=None,
+                       source_lang: Optional[str] = None) -> Optional[str]:
         """使用翻译API"""
-        try:
-            # 这里可以选择：
-            # 1. Google Translate API
-            # 2. DeepL API
-            # 3. Microsoft Translator API
-            # 具体使用哪个API，我们可以根据您的需求来选择
-            
-            # 示例：使用DeepL API
-            response = requests.post(
-                "https://api-free.deepl.com/v2/translate",
-                headers={"Authorization": f"DeepL-Auth-Key {self.api_key}"},
-                data={
-                    "text": text,
-                    "source_lang": "auto",
-                    "target_lang": "EN"
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["translations"][0]["text"]
-            
-            return None
-        except Exception as e:
-            print(f"翻译错误: {e}")
+        if not self.services.wait(10):
+            print("翻译引擎未就绪")
             return None
+            
+        # 指定window_key时按窗口增量翻译，只发送新增或修改的段落
+        return self.translator.translate(text, source_lang or "auto", "EN", window_key)
 
-    def handle_translation(self):
+    def handle_translation(self, job: Optional[TranslationJob] = None):
         """处理翻译"""
-        current_time = time.time()
-        if current_time - self.last_translation_time < 1.0:
-            return
-        self.last_translation_time = current_time
-
         try:
-            # 获取当前窗口句柄
-            hwnd = win32gui.GetForegroundWindow()
+            # 使用触发时的窗口，没有则取当前窗口
+            hwnd = job.hwnd if job and job.hwnd else win32gui.GetForegroundWindow()
             window_title = win32gui.GetWindowText(hwnd)
             print(f"\n当前窗口: {window_title}")
 
             # 获取文本
-            text = self.get_window_text(hwnd)
+            with metrics.span("stage", stage="read"):
+                text = self.get_window_text(hwnd)
             if not text:
                 print("未获取到文本")
                 return
 
             print(f"原文: {text}")
+
+            # 检查是否已是目标语言，并按检测结果确定源语言
+            detection = detect(text)
+            if not detection.has_letters or is_target_language(detection, "EN"):
+                print("文本已是目标语言，跳过翻译")
+                return
             
             # 翻译
-            translated = self.translate_text(text)
+            with metrics.span("stage", stage="translate"):
+                translated = self.translate_text(text, hwnd, choose_source_lang(detection))
             if not translated:
                 print("翻译失败")
                 return
 
             print(f"译文: {translated}")
             
+            if job and job.cancelled:
+                print("任务已被新的触发取代，放弃替换")
+                return
+            
+            # 窗口或文本已变化时放弃本次结果
+            with metrics.span("stage", stage="inspect"):
+                if win32gui.GetForegroundWindow() != hwnd:
+                    print("窗口已改变，放弃替换")
+                    return
+                if self.get_window_text(hwnd) != text:
+                    print("文本已变化，放弃替换")
+                    return
+            
             # 替换文本
-            if self.set_window_text(hwnd, translated):
+            with metrics.span("stage", stage="replace"):
+                replaced = self.set_window_text(hwnd, translated)
+            if replaced:
                 print("✓ 文本替换成功")
             else:
                 print("✗ 文本替换失败")
@@ -157,44 +163,31 @@ class PotTranslator:
         except Exception as e:
             print(f"翻译处理错误: {e}")
 
+    def trigger_translation(self):
+        """快捷键回调（在键盘钩子线程中执行，只投递任务）"""
+        print("检测到快捷键，开始翻译...")
+        self.worker.submit(win32gui.GetForegroundWindow())
+
     def on_press(self, key):
         """按键按下事件"""
-        try:
-            if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                self.ctrl_pressed = True
-            elif key == keyboard.Key.cmd:
-                self.win_pressed = True
-            elif str(key) == "'t'" or str(key) == "'\\x14'":
-                self.t_pressed = True
-
-            if self.ctrl_pressed and self.win_pressed and self.t_pressed:
-                print("检测到快捷键，开始翻译...")
-                self.handle_translation()
-
-        except AttributeError:
-            pass
+        self.hotkeys.on_press(key)
 
     def on_release(self, key):
         """按键释放事件"""
-        try:
-            if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                self.ctrl_pressed = False
-            elif key == keyboard.Key.cmd:
-                self.win_pressed = False
-            elif str(key) == "'t'" or str(key) == "'\\x14'":
-                self.t_pressed = False
-        except AttributeError:
-            pass
+        self.hotkeys.on_release(key)
 
     def run(self):
         """运行翻译器"""
-        print("Silent Translator is running... Press Ctrl+Win+T to translate")
+        print(f"Silent Translator is running... Press {self.hotkeys.describe()} to translate")
         with keyboard.Listener(
             on_press=self.on_press,
             on_release=self.on_release) as listener:
+            if mark_listening(listener):
+                return
             listener.join()
 
 def main():
+    configure_from_env()
     translator = PotTranslator()
     translator.run()
 
@@ -1,37 +1,60 @@
 import win32gui
 import win32con
-import win32clipboard
 import win32api
-import win32ui
-from ctypes import windll
-import requests
 from pynput import keyboard
 from pynput.keyboard import Key, Controller
-import time
+import itertools
 from typing import Optional
+from translation_worker import TranslationJob, TranslationWorker
+from clipboard_sync import get_clipboard_transfer
+from handler_registry import HandlerRegistry, edit_handles
+import uia_cache
+import win32_calls
+from startup import BackgroundInit, mark_listening
+from metrics import configure_from_env, metrics
+from language_detect import choose_source_lang, detect, is_target_language
+from hotkeys import build_matcher, load_frontend_config
+from pretranslate import build_pretranslator
+
+# 快捷键触发时翻译（含等待预翻译）的总时限（秒）
+TRANSLATE_TIMEOUT = 5.0
 
 class WindowHandler:
     """窗口处理器基类"""
+    class_names = ()     # 精确匹配的窗口类名
+    class_prefixes = ()  # 前缀匹配的窗口类名
+    
     def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return False
+        return class_name in self.class_names or class_name.startswith(self.class_prefixes)
+        
+    def find_child(self, hwnd: int, child_class: str) -> int:
+        """查找指定类名的子窗口（按窗口缓存）"""
+        return edit_handles.get_or_find(
+            hwnd, child_class,
+            lambda parent: win32gui.FindWindowEx(parent, 0, child_class, None)
+        ) or 0
         
     def get_text(self, hwnd: int) -> str:
         """获取文本的默认实现"""
         try:
-            # 直接使用Windows API获取文本
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            if length > 0:
-                buffer = win32gui.PyMakeBuffer(length + 1)
-                win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-                return buffer[:length].tobytes().decode('utf-16')
+            # 直接使用Windows API获取文本（限时，目标程序卡死时不会阻塞）
+            return win32_calls.get_text(hwnd)
         except:
             pass
         return ""
 
+    def peek_text(self, hwnd: int) -> str:
+        """不打扰用户地读取文本（不用剪贴板、不发送按键），用于预翻译；不支持时返回空"""
+        return ""
+
+    def text_window(self, hwnd: int) -> Optional[int]:
+        """可以用编辑框消息分块读取文本的控件（超大文本用），不支持时返回None"""
+        return None
+
     def set_text(self, hwnd: int, text: str) -> bool:
         """设置文本的默认实现"""
         try:
-            return bool(win32gui.SendMessage(hwnd, win32con.WM_SETTEXT, 0, text))
+            return win32_calls.set_text(hwnd, text)
         except:
             return False
 
@@ -49,118 +72,25 @@ class WindowHandler:
             return ""
             
     def get_text_by_clipboard(self, hwnd: int) -> str:
-        """通过剪贴板获取文本"""
-        original = None
-        try:
-            # 保存并清空剪贴板
-            win32clipboard.OpenClipboard()
-            try:
-                original = win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
-            except:
-                pass
-            win32clipboard.EmptyClipboard()
-            win32clipboard.CloseClipboard()
-            
-            # 激活窗口
-            win32gui.SetForegroundWindow(hwnd)
-            time.sleep(0.3)  # 增加延时
-            
-            # 模拟Ctrl+A
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('A'), 0, 0, 0)
-            time.sleep(0.2)  # 增加延时
-            win32api.keybd_event(ord('A'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            
-            # 模拟Ctrl+C
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('C'), 0, 0, 0)
-            time.sleep(0.2)  # 增加延时
-            win32api.keybd_event(ord('C'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            time.sleep(0.3)  # 增加延时
-            
-            # 获取文本
-            text = ""
-            win32clipboard.OpenClipboard()
-            try:
-                text = win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
-            finally:
-                win32clipboard.EmptyClipboard()
-                if original:
-                    try:
-                        win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                    except:
-                        pass
-                win32clipboard.CloseClipboard()
-            
-            return text
-            
-        except Exception as e:
-            print(f"剪贴板操作错误: {e}")
-            if original:
-                try:
-                    win32clipboard.OpenClipboard()
-                    win32clipboard.EmptyClipboard()
-                    win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                    win32clipboard.CloseClipboard()
-                except:
-                    pass
+        """通过剪贴板获取文本（等待剪贴板实际变化，不使用固定延时）"""
+        if win32_calls.hung_windows.is_hung(hwnd):
             return ""
+        metrics.inc("clipboard_fallbacks", handler=type(self).__name__, op="copy")
+        return get_clipboard_transfer().copy_all(hwnd)
 
     def set_text_by_clipboard(self, hwnd: int, text: str) -> bool:
-        """通过剪贴板设置文本的基础实现"""
-        try:
-            # 保存原始剪贴板内容
-            win32clipboard.OpenClipboard()
-            try:
-                original = win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
-            except:
-                original = None
-            win32clipboard.EmptyClipboard()
-            win32clipboard.CloseClipboard()
-            
-            # 设置新文本到剪贴板
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardText(text, win32con.CF_UNICODETEXT)
-            win32clipboard.CloseClipboard()
-            
-            # 激活窗口
-            win32gui.SetForegroundWindow(hwnd)
-            time.sleep(0.2)
-            
-            # 模拟Ctrl+A和Ctrl+V
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('A'), 0, 0, 0)
-            time.sleep(0.1)
-            win32api.keybd_event(ord('A'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            time.sleep(0.1)
-            
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('V'), 0, 0, 0)
-            time.sleep(0.1)
-            win32api.keybd_event(ord('V'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            
-            # 恢复原始剪贴板
-            if original:
-                win32clipboard.OpenClipboard()
-                win32clipboard.EmptyClipboard()
-                win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                win32clipboard.CloseClipboard()
-                
-            return True
-            
-        except Exception as e:
-            print(f"剪贴板设置文本错误: {e}")
+        """通过剪贴板设置文本的基础实现（等待目标程序读取剪贴板后再恢复）
+
+        未确认目标程序已粘贴时返回False，调用方继续尝试其他方式。
+        """
+        if win32_calls.hung_windows.is_hung(hwnd):
             return False
+        metrics.inc("clipboard_fallbacks", handler=type(self).__name__, op="paste")
+        return get_clipboard_transfer().paste_all(hwnd, text)
 
 class NotepadHandler(WindowHandler):
     """记事本处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return class_name == "Notepad"
+    class_names = ("Notepad",)
         
     def get_text(self, hwnd: int) -> str:
         try:
@@ -171,38 +101,18 @@ class NotepadHandler(WindowHandler):
                 return text
                 
             # 如果剪贴板方法失败，尝试直接获取
-            edit_hwnd = win32gui.FindWindowEx(hwnd, 0, "Edit", None)
+            edit_hwnd = self.find_child(hwnd, "Edit")
             if not edit_hwnd:
                 print("未找到记事本编辑框")
                 return ""
                 
-            # 获取文本长度
-            length = win32gui.SendMessage(edit_hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            if length == 0:
+            # 获取文本（限时）
+            text = win32_calls.get_text(edit_hwnd)
+            if not text:
                 print("记事本内容为空")
                 return ""
-                
-            # 获取文本
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            result = win32gui.SendMessage(edit_hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            if result:
-                try:
-                    # 先尝试UTF-16
-                    text = buffer[:length].tobytes().decode('utf-16-le')
-                    print(f"使用UTF-16-LE解码成功: {text}")
-                    return text
-                except:
-                    try:
-                        # 再尝试系统默认编码
-                        text = buffer[:length].tobytes().decode()
-                        print(f"使用系统默认编码解码成功: {text}")
-                        return text
-                    except:
-                        print("所有解码方法都失败")
-            else:
-                print("获取记事本文本失败")
-                
-            return ""
+            print(f"直接获取到文本: {text}")
+            return text
             
         except Exception as e:
             print(f"获取记事本文本错误: {e}")
@@ -216,14 +126,13 @@ class NotepadHandler(WindowHandler):
                 return True
                 
             # 如果剪贴板方法失败，尝试直接设置
-            edit_hwnd = win32gui.FindWindowEx(hwnd, 0, "Edit", None)
+            edit_hwnd = self.find_child(hwnd, "Edit")
             if not edit_hwnd:
                 print("未找到记事本编辑框")
                 return False
                 
-            # 设置文本
-            result = win32gui.SendMessage(edit_hwnd, win32con.WM_SETTEXT, 0, text)
-            if result:
+            # 设置文本（限时）
+            if win32_calls.set_text(edit_hwnd, text):
                 print("直接设置文本成功")
                 return True
             else:
@@ -234,82 +143,68 @@ class NotepadHandler(WindowHandler):
             print(f"设置记事本文本错误: {e}")
             return False
 
+    def peek_text(self, hwnd: int) -> str:
+        edit_hwnd = self.find_child(hwnd, "Edit")
+        return WindowHandler.get_text(self, edit_hwnd) if edit_hwnd else ""
+
+    def text_window(self, hwnd: int) -> Optional[int]:
+        return self.find_child(hwnd, "Edit") or None
+
 class QQHandler(WindowHandler):
     """QQ窗口处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return "TXGuiFoundation" in class_name
+    class_prefixes = ("TXGuiFoundation",)
         
     def get_text(self, hwnd: int) -> str:
         try:
             # 查找QQ输入框
-            edit_hwnd = win32gui.FindWindowEx(hwnd, 0, "QQEdit", None)
+            edit_hwnd = self.find_child(hwnd, "QQEdit")
             if edit_hwnd:
-                # 使用EM_GETTEXT消息
-                length = win32gui.SendMessage(edit_hwnd, win32con.EM_GETTEXTLENGTH, 0, 0)
-                buffer = win32gui.PyMakeBuffer(length + 1)
-                win32gui.SendMessage(edit_hwnd, win32con.EM_GETTEXT, length + 1, buffer)
-                return buffer[:length].tobytes().decode('utf-16')
+                # EM_ 系列没有读取整段文本的消息，使用 WM_GETTEXTLENGTH + WM_GETTEXT
+                return win32_calls.get_text(edit_hwnd)
         except:
             pass
         return super().get_text(hwnd)
 
     def set_text(self, hwnd: int, text: str) -> bool:
         try:
-            edit_hwnd = win32gui.FindWindowEx(hwnd, 0, "QQEdit", None)
+            edit_hwnd = self.find_child(hwnd, "QQEdit")
             if edit_hwnd:
-                # 使用EM_SETTEXT消息
-                return bool(win32gui.SendMessage(edit_hwnd, win32con.EM_SETTEXT, 0, text))
+                return win32_calls.set_text(edit_hwnd, text)
         except:
             pass
         return super().set_text(hwnd, text)
 
+    def peek_text(self, hwnd: int) -> str:
+        return self.get_text(hwnd)
+
 class DingTalkHandler(WindowHandler):
     """钉钉窗口处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return "StandardFrame" in class_name or "DingTalk" in class_name
+    class_prefixes = ("StandardFrame", "DingTalk")
         
     def get_text(self, hwnd: int) -> str:
         # 钉钉使用标准Windows消息
         try:
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            return buffer[:length].tobytes().decode('utf-16')
+            return win32_calls.get_text(hwnd)
         except:
             return ""
 
+    def peek_text(self, hwnd: int) -> str:
+        return self.get_text(hwnd)
+
+    def text_window(self, hwnd: int) -> Optional[int]:
+        return hwnd
+
 class WeChatHandler(WindowHandler):
     """微信窗口处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return "WeChatMainWndForPC" in class_name or "ChatWnd" in class_name
+    class_prefixes = ("WeChatMainWndForPC", "ChatWnd")
         
     def get_text(self, hwnd: int) -> str:
         try:
-            # 查找微信编辑框
-            edit_hwnd = None
-            def find_edit(child_hwnd, param):
-                nonlocal edit_hwnd
-                class_name = win32gui.GetClassName(child_hwnd)
-                if "RICHEDIT50W" in class_name or "Edit" in class_name:
-                    edit_hwnd = child_hwnd
-                    return False
-                return True
-                
-            win32gui.EnumChildWindows(hwnd, find_edit, None)
-            
-            if edit_hwnd:
-                # 先尝试直接获取文本
-                try:
-                    length = win32gui.SendMessage(edit_hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-                    if length > 0:
-                        buffer = win32gui.PyMakeBuffer(length + 1)
-                        win32gui.SendMessage(edit_hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-                        text = buffer[:length].tobytes().decode('utf-16')
-                        if text and text.strip():
-                            print(f"直接获取到文本: {text}")
-                            return text
-                except:
-                    pass
+            # 先尝试直接获取文本
+            text = self.peek_text(hwnd)
+            if text and text.strip():
+                print(f"直接获取到文本: {text}")
+                return text
                     
             # 如果直接获取失败，使用剪贴板方法
             print("直接获取失败，尝试剪贴板方法")
@@ -319,85 +214,46 @@ class WeChatHandler(WindowHandler):
             print(f"微信获取文本错误: {e}")
             return self.get_text_by_clipboard(hwnd)
 
-    def set_text(self, hwnd: int, text: str) -> bool:
-        try:
-            # 先保存剪贴板内容
-            original = None
-            win32clipboard.OpenClipboard()
-            try:
-                original = win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
-            except:
-                pass
-            win32clipboard.EmptyClipboard()
-            win32clipboard.CloseClipboard()
-            
-            # 设置新文本到剪贴板
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardText(text, win32con.CF_UNICODETEXT)
-            win32clipboard.CloseClipboard()
-            
-            # 激活窗口
-            win32gui.SetForegroundWindow(hwnd)
-            time.sleep(0.3)
-            
-            # 模拟Ctrl+A
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('A'), 0, 0, 0)
-            time.sleep(0.2)
-            win32api.keybd_event(ord('A'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            
-            # 模拟Ctrl+V
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('V'), 0, 0, 0)
-            time.sleep(0.2)
-            win32api.keybd_event(ord('V'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            
-            # 恢复原始剪贴板
-            if original:
-                time.sleep(0.2)
-                win32clipboard.OpenClipboard()
-                win32clipboard.EmptyClipboard()
-                win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                win32clipboard.CloseClipboard()
-                
+    def peek_text(self, hwnd: int) -> str:
+        # 查找微信编辑框（同一窗口再次触发时使用缓存的句柄）
+        edit_hwnd = self.text_window(hwnd)
+        return WindowHandler.get_text(self, edit_hwnd) if edit_hwnd else ""
+
+    def text_window(self, hwnd: int) -> Optional[int]:
+        return edit_handles.get_or_find(hwnd, "wechat_edit", self.find_edit)
+
+    def find_edit(self, hwnd: int) -> Optional[int]:
+        """遍历子窗口查找微信编辑框"""
+        edit_hwnd = None
+        def find_edit(child_hwnd, param):
+            nonlocal edit_hwnd
+            class_name = win32gui.GetClassName(child_hwnd)
+            if "RICHEDIT50W" in class_name or "Edit" in class_name:
+                edit_hwnd = child_hwnd
+                return False
             return True
             
-        except Exception as e:
-            print(f"微信设置文本错误: {e}")
-            if original:
-                try:
-                    win32clipboard.OpenClipboard()
-                    win32clipboard.EmptyClipboard()
-                    win32clipboard.SetClipboardText(original, win32con.CF_UNICODETEXT)
-                    win32clipboard.CloseClipboard()
-                except:
-                    pass
-            return False
+        try:
+            win32gui.EnumChildWindows(hwnd, find_edit, None)
+        except win32gui.error:
+            # 回调返回False会中止枚举，pywin32可能将其报告为错误
+            pass
+        return edit_hwnd
+
+    def set_text(self, hwnd: int, text: str) -> bool:
+        return self.set_text_by_clipboard(hwnd, text)
 
 class WordHandler(WindowHandler):
     """Microsoft Word 处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return "OpusApp" in class_name
+    class_prefixes = ("OpusApp",)
         
     def get_text(self, hwnd: int) -> str:
         try:
-            # 尝试使用 UI Automation
-            import uiautomation as auto
-            element = auto.ControlFromHandle(hwnd)
-            if element:
-                try:
-                    # 查找文档内容元素
-                    doc = element.DocumentControl()
-                    if doc:
-                        text = doc.GetSelectionText()
-                        if text and text.strip():
-                            print(f"通过UI Automation获取到Word文本: {text}")
-                            return text
-                except:
-                    pass
+            # 尝试使用 UI Automation（后台预加载，文档元素按窗口缓存）
+            text = self.peek_text(hwnd)
+            if text and text.strip():
+                print(f"通过UI Automation获取到Word文本: {text}")
+                return text
                     
             # 如果UI Automation失败，使用剪贴板方法
             return self.get_text_by_clipboard(hwnd)
@@ -406,35 +262,45 @@ class WordHandler(WindowHandler):
             print(f"Word获取文本错误: {e}")
             return self.get_text_by_clipboard(hwnd)
             
+    def peek_text(self, hwnd: int) -> str:
+        if uia_cache.get_automation():
+            try:
+                # UI Automation 调用在受监督的线程中执行，Word卡死时按时放弃
+                return win32_calls.call_uia(hwnd, self.read_selection, hwnd)
+            except:
+                pass
+        return ""
+
+    def read_selection(self, hwnd: int) -> str:
+        # 查找文档内容元素
+        doc = uia_cache.element_cache.find(hwnd, "document", self.find_document)
+        return (doc.GetSelectionText() or "") if doc else ""
+
+    def find_document(self, root):
+        """在有限深度内查找文档元素"""
+        return uia_cache.walk_find(
+            root, lambda control: control.ControlTypeName == "DocumentControl", max_depth=6
+        )
+            
     def set_text(self, hwnd: int, text: str) -> bool:
         return self.set_text_by_clipboard(hwnd, text)
 
 class ChromeHandler(WindowHandler):
     """Chrome/Edge/Vivaldi等基于Chromium的浏览器处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return any(cls in class_name for cls in [
-            "Chrome_WidgetWin_",  # Chrome/Vivaldi
-            "Chrome_RenderWidgetHostHWND",  # Chrome渲染窗口
-            "MozillaWindowClass",  # Firefox
-            "EdgeWindow"  # Edge
-        ])
+    class_prefixes = (
+        "Chrome_WidgetWin_",  # Chrome/Vivaldi
+        "Chrome_RenderWidgetHostHWND",  # Chrome渲染窗口
+        "MozillaWindowClass",  # Firefox
+        "EdgeWindow"  # Edge
+    )
         
     def get_text(self, hwnd: int) -> str:
         try:
-            # 尝试使用 UI Automation
-            import uiautomation as auto
-            element = auto.ControlFromHandle(hwnd)
-            if element:
-                try:
-                    # 查找文本框元素
-                    edit = element.EditControl()
-                    if edit:
-                        text = edit.GetValuePattern().Value
-                        if text and text.strip():
-                            print(f"通过UI Automation获取到浏览器文本: {text}")
-                            return text
-                except:
-                    pass
+            # 尝试使用 UI Automation（后台预加载，文本框元素按窗口缓存）
+            text = self.peek_text(hwnd)
+            if text and text.strip():
+                print(f"通过UI Automation获取到浏览器文本: {text}")
+                return text
                     
             # 如果UI Automation失败，使用剪贴板方法
             return self.get_text_by_clipboard(hwnd)
@@ -443,35 +309,59 @@ class ChromeHandler(WindowHandler):
             print(f"浏览器获取文本错误: {e}")
             return self.get_text_by_clipboard(hwnd)
             
+    def peek_text(self, hwnd: int) -> str:
+        if uia_cache.get_automation():
+            try:
+                # UI Automation 调用在受监督的线程中执行，浏览器卡死时按时放弃
+                return win32_calls.call_uia(hwnd, self.read_value, hwnd)
+            except:
+                pass
+        return ""
+
+    def read_value(self, hwnd: int) -> str:
+        # 优先使用当前焦点所在的文本框，否则在有限深度内查找
+        edit = uia_cache.get_automation().GetFocusedControl()
+        if not edit or edit.ControlTypeName != "EditControl":
+            edit = uia_cache.element_cache.find(hwnd, "edit", self.find_edit)
+        return (edit.GetValuePattern().Value or "") if edit else ""
+
+    def find_edit(self, root):
+        """在有限深度内查找文本框元素"""
+        return uia_cache.walk_find(
+            root, lambda control: control.ControlTypeName == "EditControl", max_depth=12
+        )
+            
     def set_text(self, hwnd: int, text: str) -> bool:
         return self.set_text_by_clipboard(hwnd, text)
 
 class FirefoxHandler(WindowHandler):
     """Firefox窗口处理器"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return "MozillaWindowClass" in class_name
+    class_prefixes = ("MozillaWindowClass",)
         
     def get_text(self, hwnd: int) -> str:
         # Firefox使用自定义消息
         try:
             # 获取实际的编辑框句柄
-            edit_hwnd = win32gui.FindWindowEx(hwnd, 0, "MozillaEditableWindowClass", None)
+            edit_hwnd = self.find_child(hwnd, "MozillaEditableWindowClass")
             if not edit_hwnd:
                 edit_hwnd = hwnd
                 
-            # 使用accessibility API获取文本
+            # 使用accessibility API获取文本（comtypes在启动时后台预加载，限时调用）
             import comtypes.client
-            acc = comtypes.client.GetFocusedObject()
-            if acc:
-                return acc.accValue(0) or ""
+
+            def read_focused():
+                acc = comtypes.client.GetFocusedObject()
+                return (acc.accValue(0) or "") if acc else ""
+            text = win32_calls.call_uia(hwnd, read_focused)
+            if text:
+                return text
         except:
             pass
         return super().get_text(hwnd)
 
 class DefaultHandler(WindowHandler):
     """默认处理器，处理未知类型的窗口"""
-    def can_handle(self, hwnd: int, class_name: str) -> bool:
-        return True  # 作为最后的后备处理器
+    class_prefixes = ("",)  # 匹配任意类名，作为最后的后备处理器
         
     def get_text(self, hwnd: int) -> str:
         # 尝试多种方法获取文本
@@ -501,16 +391,20 @@ class DefaultHandler(WindowHandler):
 class SimpleTranslator:
     def __init__(self):
         """初始化翻译器"""
-        self.shift_pressed = False
-        self.f11_pressed = False
-        self.f12_pressed = False
-        self.last_translation_time = time.time()  # 记录最后一次翻译时间
-        self.min_interval = 1.0  # 最小翻译间隔（秒）
         self.keyboard = Controller()
+        self.source_lang = "auto"   # 源语言按文本自动检测
+        self.target_lang = "en"     # 目标语言为英文
+        # 翻译引擎和缓存在后台加载，不阻塞快捷键监听
+        self.services = BackgroundInit("翻译引擎", self.load_services)
+        # 快捷键在 translator_config.json 的 hotkeys 中设置
+        config = load_frontend_config()
+        self.hotkeys = build_matcher(config, {"translate": "shift+f11", "quit": "shift+f12"},
+                                     {"translate": self.trigger_translation, "quit": self.quit},
+                                     keyboard.Key)
         print("✓ 翻译器初始化完成")
         print("等待快捷键触发:")
-        print("- Shift+F11: 翻译")
-        print("- Shift+F12: 退出程序")
+        print(f"- {self.hotkeys.describe('translate')}: 翻译")
+        print(f"- {self.hotkeys.describe('quit')}: 退出程序")
         
         # 注册窗口处理器（按优先级排序）
         self.handlers = [
@@ -522,6 +416,23 @@ class SimpleTranslator:
             ChromeHandler(),      # 浏览器
             DefaultHandler()      # 默认处理器
         ]
+        self.registry = HandlerRegistry(self.handlers)
+        # 后台加载 uiautomation/comtypes，避免首次触发时导入
+        uia_cache.preload_async()
+        
+        # 翻译在后台线程执行，键盘回调只投递任务
+        self.worker = TranslationWorker(self.handle_translation).start()
+        # 可选：打字停顿时在后台预翻译当前输入框（配置 "pretranslate": true）
+        self.pretranslator = build_pretranslator(
+            config, win32gui.GetForegroundWindow, self.peek_window_text, self.pretranslate)
+
+    def load_services(self):
+        """连接翻译服务（在后台线程中执行）"""
+        from translation_daemon import connect_or_local
+        
+        # 由常驻的本地翻译服务持有引擎连接、缓存和按窗口的增量翻译状态，
+        # 无法连接时在进程内翻译（translator_config.json 中配置引擎）
+        self.translator = connect_or_local()
 
     def get_window_class(self, hwnd) -> str:
         """获取窗口类名"""
@@ -537,11 +448,10 @@ class SimpleTranslator:
             print(f"窗口类名: {class_name}")  # 调试信息
             
             # 查找合适的处理器
-            for handler in self.handlers:
-                if handler.can_handle(hwnd, class_name):
-                    text = handler.get_text(hwnd)
-                    if text:
-                        return text
+            for handler in self.registry.resolve(class_name, hwnd):
+                text = handler.get_text(hwnd)
+                if text:
+                    return text
             
             # 如果所有处理器都失败，使用剪贴板方法
             return self.get_text_by_clipboard(hwnd)
@@ -550,14 +460,29 @@ class SimpleTranslator:
             print(f"获取文本错误: {e}")
             return ""
 
+    def peek_window_text(self, hwnd) -> str:
+        """不打扰用户地读取窗口文本（预翻译用），不支持的窗口返回空"""
+        for handler in self.registry.resolve(self.get_window_class(hwnd), hwnd):
+            text = handler.peek_text(hwnd)
+            if text and text.strip():
+                return text
+        return ""
+
+    def pretranslate(self, hwnd, text: str) -> Optional[str]:
+        """预翻译（在后台线程中执行），不需要翻译或引擎未就绪时返回None"""
+        if not self.services.wait(0):
+            return None
+        detection = detect(text)
+        if not detection.has_letters or is_target_language(detection, self.target_lang):
+            return None
+        source_lang = choose_source_lang(detection, self.source_lang)
+        return self.translator.translate(text, source_lang, self.target_lang, hwnd)
+
     def get_chrome_text(self, hwnd) -> str:
         """获取Chrome浏览器文本"""
         try:
             # 使用Chrome特定的消息
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            return buffer[:length].tobytes().decode('utf-16')
+            return win32_calls.get_text(hwnd)
         except:
             return self.get_text_by_clipboard(hwnd)
 
@@ -565,20 +490,14 @@ class SimpleTranslator:
         """获取Firefox浏览器文本"""
         try:
             # 使用Firefox特定的消息
-            length = windll.user32.SendMessageW(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            windll.user32.SendMessageW(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            return buffer[:length].tobytes().decode('utf-16')
+            return win32_calls.get_text(hwnd)
         except:
             return self.get_text_by_clipboard(hwnd)
 
     def get_edit_text(self, hwnd) -> str:
         """获取编辑框文本"""
         try:
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            return buffer[:length].tobytes().decode('utf-16')
+            return win32_calls.get_text(hwnd)
         except:
             return self.get_text_by_clipboard(hwnd)
 
@@ -586,76 +505,42 @@ class SimpleTranslator:
         """发送按键序列"""
         for vk, up in keys:
             win32api.keybd_event(vk, 0, win32con.KEYEVENTF_KEYUP if up else 0, 0)
-            time.sleep(0.05)
+
+    def get_text_by_clipboard(self, hwnd) -> str:
+        """通过剪贴板获取文本"""
+        if win32_calls.hung_windows.is_hung(hwnd):
+            return ""
+        metrics.inc("clipboard_fallbacks", handler="SimpleTranslator", op="copy")
+        return get_clipboard_transfer().copy_all(hwnd)
 
     def set_window_text(self, hwnd, text: str) -> bool:
         """设置窗口文本"""
-        try:
-            # 清空剪贴板并设置新文本
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardText(text, win32con.CF_UNICODETEXT)
-            win32clipboard.CloseClipboard()
-            
-            # 激活目标窗口
-            win32gui.SetForegroundWindow(hwnd)
-            time.sleep(0.1)
-            
-            # 模拟Ctrl+A
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('A'), 0, 0, 0)
-            time.sleep(0.1)
-            win32api.keybd_event(ord('A'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            time.sleep(0.1)
-            
-            # 模拟Ctrl+V
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('V'), 0, 0, 0)
-            time.sleep(0.1)
-            win32api.keybd_event(ord('V'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            
-            return True
-            
-        except Exception as e:
-            print(f"设置文本错误: {e}")
-            return False
+        return get_clipboard_transfer().paste_all(hwnd, text)
+
+    def translate_text(self, text: str, window_key=None,
+                       source_lang: Optional[str] = None,
+                       timeout: float = TRANSLATE_TIMEOUT) -> Optional[str]:
+        """使用配置的翻译引擎翻译文本（默认Google Translate）
 
-    def translate_text(self, text: str) -> Optional[str]:
-        """使用Google Translate API翻译文本"""
+        指定window_key时按窗口增量翻译，只发送新增或修改的段落。
+        """
         if not text or not text.strip():
             print("文本为空，跳过翻译")
             return None
             
+        if not self.services.wait(10):
+            print("翻译引擎未就绪")
+            return None
+            
         try:
             print(f"正在翻译: {text}")
-            response = requests.get(
-                "https://translate.googleapis.com/translate_a/single",
-                params={
-                    "client": "gtx",
-                    "sl": "zh-CN",  # 指定源语言为中文
-                    "tl": "en",     # 目标语言为英文
-                    "dt": "t",
-                    "q": text.strip()  # 去除首尾空白
-                },
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result and result[0]:
-                    translated = ''.join([item[0] for item in result[0] if item[0]])
-                    if translated and translated.strip():
-                        print(f"翻译结果: {translated}")
-                        return translated
-                    else:
-                        print("翻译结果为空")
-                else:
-                    print("翻译结果格式错误")
+            translated = self.translator.translate(
+                text, source_lang or self.source_lang, self.target_lang, window_key, timeout)
+            if translated and translated.strip():
+                print(f"翻译结果: {translated}")
+                return translated
             else:
-                print(f"翻译请求失败: {response.status_code}")
-                print(f"错误信息: {response.text}")
+                print("翻译结果为空")
                 
             return None
             
@@ -665,109 +550,134 @@ class SimpleTranslator:
             traceback.print_exc()
             return None
 
-    def handle_translation(self):
+    def handle_translation(self, job: Optional[TranslationJob] = None):
         """处理翻译"""
         try:
-            # 获取当前窗口
-            hwnd = win32gui.GetForegroundWindow()
+            # 使用触发时的窗口，没有则取当前窗口
+            hwnd = job.hwnd if job and job.hwnd else win32gui.GetForegroundWindow()
             
             # 检查窗口是否有效
             if not hwnd or hwnd == 0:
                 print("无效的窗口句柄")
                 return
-                
-            # 获取窗口类名和标题
-            class_name = self.get_window_class(hwnd)
-            window_title = win32gui.GetWindowText(hwnd)
-            
-            # 扩展系统窗口检查
-            system_classes = [
-                "Windows.UI.Core",
-                "Shell_",
-                "NotifyIconOverflowWindow",
-                "Windows.UI.Notification",
-                "Windows.UI.Core.CoreWindow",
-                "ApplicationFrameWindow",
-                "Windows.UI.Popups",
-                "TaskManagerWindow",
-                "ForegroundStaging",
-                "SystemTray_Main"
-            ]
             
-            if any(cls in class_name for cls in system_classes):
-                print(f"跳过系统窗口: {class_name}")
+            # 最近没有响应的程序直接跳过，不再等待
+            if win32_calls.hung_windows.is_hung(hwnd):
+                print("窗口无响应，暂时跳过")
                 return
                 
-            # 检查窗口标题是否包含系统相关字符
-            system_titles = [
-                "通知中心",
-                "操作中心",
-                "任务管理器",
-                "系统托盘",
-                "Action Center",
-                "Notification",
-                "Task Manager"
-            ]
-            
-            if any(title in window_title for title in system_titles):
-                print(f"跳过系统窗口: {window_title}")
-                return
+            with metrics.span("stage", stage="inspect"):
+                # 获取窗口类名和标题
+                class_name = self.get_window_class(hwnd)
+                window_title = win32gui.GetWindowText(hwnd)
+            
+                # 扩展系统窗口检查
+                system_classes = [
+                    "Windows.UI.Core",
+                    "Shell_",
+                    "NotifyIconOverflowWindow",
+                    "Windows.UI.Notification",
+                    "Windows.UI.Core.CoreWindow",
+                    "ApplicationFrameWindow",
+                    "Windows.UI.Popups",
+                    "TaskManagerWindow",
+                    "ForegroundStaging",
+                    "SystemTray_Main"
+                ]
+            
+                if any(cls in class_name for cls in system_classes):
+                    print(f"跳过系统窗口: {class_name}")
+                    return
                 
-            # 检查窗口状态
-            if not win32gui.IsWindowVisible(hwnd):
-                print("窗口不可见")
-                return
+                # 检查窗口标题是否包含系统相关字符
+                system_titles = [
+                    "通知中心",
+                    "操作中心",
+                    "任务管理器",
+                    "系统托盘",
+                    "Action Center",
+                    "Notification",
+                    "Task Manager"
+                ]
+            
+                if any(title in window_title for title in system_titles):
+                    print(f"跳过系统窗口: {window_title}")
+                    return
                 
-            if win32gui.IsIconic(hwnd):
-                print("窗口被最小化")
-                return
+                # 检查窗口状态
+                if not win32gui.IsWindowVisible(hwnd):
+                    print("窗口不可见")
+                    return
+                
+                if win32gui.IsIconic(hwnd):
+                    print("窗口被最小化")
+                    return
                 
-            # 检查窗口是否是对话框或弹出窗口
-            style = win32gui.GetWindowLong(hwnd, win32con.GWL_STYLE)
-            ex_style = win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE)
+                # 检查窗口是否是对话框或弹出窗口
+                style = win32gui.GetWindowLong(hwnd, win32con.GWL_STYLE)
+                ex_style = win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE)
             
-            if (style & win32con.WS_POPUP) or (ex_style & win32con.WS_EX_TOOLWINDOW):
-                print("跳过弹出窗口或工具窗口")
-                return
+                if (style & win32con.WS_POPUP) or (ex_style & win32con.WS_EX_TOOLWINDOW):
+                    print("跳过弹出窗口或工具窗口")
+                    return
                 
             print(f"\n当前窗口: {window_title}")
             print(f"窗口类名: {class_name}")
 
+            # 超大的编辑框：分块读取并流水线翻译，不一次性读入整个文档
+            large = self.find_large_text(class_name, hwnd)
+            if large:
+                self.translate_large(job, hwnd, *large)
+                return
+
             # 获取文本
             text = None
-            for handler in self.handlers:
-                if handler.can_handle(hwnd, class_name):
-                    text = handler.get_text(hwnd)
+            with metrics.span("stage", stage="read"):
+                for handler in self.registry.resolve(class_name, hwnd):
+                    with metrics.span("handler", handler=type(handler).__name__, method="get_text"):
+                        text = handler.get_text(hwnd)
                     if text and text.strip():
                         break
                         
             if not text:
                 print("未获取到文本")
                 return
+                
+            if job and job.cancelled:
+                print("任务已被新的触发取代")
+                return
 
             # 检查文本是否与上次相同（考虑窗口类型）
             last_key = f"{class_name}:{text}"
             if hasattr(self, 'last_text') and self.last_text == last_key:
                 print("文本未变化，跳过翻译")
                 return
-                
-            # 更新最后处理的文本（带窗口类型）
-            self.last_text = last_key
 
             print(f"原文: {text}")
             
-            # 检查是否是英文
-            if all(ord(c) < 128 for c in text.strip()):
-                print("检测到英文文本，跳过翻译")
+            # 检查是否已是目标语言，并按检测结果确定源语言
+            detection = detect(text)
+            if not detection.has_letters:
+                print("没有需要翻译的文字，跳过翻译")
+                return
+            if is_target_language(detection, self.target_lang):
+                print(f"检测到目标语言文本（{detection.language}），跳过翻译")
                 return
+            source_lang = choose_source_lang(detection, self.source_lang)
             
             # 翻译前再次检查窗口状态
             if not win32gui.IsWindow(hwnd) or not win32gui.IsWindowVisible(hwnd):
                 print("窗口状态已改变")
                 return
                 
-            # 翻译
-            translated = self.translate_text(text)
+            # 翻译；打字停顿时已预翻译过同样的文本则直接使用结果
+            with metrics.span("stage", stage="translate"):
+                if self.pretranslator:
+                    translated = self.pretranslator.take_or_translate(
+                        hwnd, text, lambda remaining: self.translate_text(
+                            text, hwnd, source_lang, remaining), TRANSLATE_TIMEOUT)
+                else:
+                    translated = self.translate_text(text, hwnd, source_lang)
             if not translated:
                 print("翻译失败，保留原文")
                 return
@@ -779,6 +689,10 @@ class SimpleTranslator:
                 print("翻译结果与原文相同，不做替换")
                 return
                 
+            if job and job.cancelled:
+                print("任务已被新的触发取代，放弃替换")
+                return
+                
             # 最后一次检查窗口状态
             if not win32gui.IsWindow(hwnd):
                 print("窗口已失效")
@@ -791,12 +705,19 @@ class SimpleTranslator:
                 
             # 替换文本
             success = False
-            for handler in self.handlers:
-                if handler.can_handle(hwnd, class_name):
-                    if handler.set_text(hwnd, translated):
+            with metrics.span("stage", stage="replace"):
+                for handler in self.registry.resolve(class_name, hwnd):
+                    with metrics.span("handler", handler=type(handler).__name__, method="set_text"):
+                        replaced = handler.set_text(hwnd, translated)
+                    if replaced:
                         print("✓ 文本替换成功")
                         success = True
                         break
+
+            # 替换成功后才记录已处理的文本（带窗口类型）；被取消或失败的任务不记录，
+            # 否则紧接着的新触发会被当作"文本未变化"跳过
+            if success:
+                self.last_text = last_key
                         
             if not success:
                 print("✗ 文本替换失败")
@@ -806,56 +727,126 @@ class SimpleTranslator:
             import traceback
             traceback.print_exc()
 
+    def find_large_text(self, class_name: str, hwnd: int) -> Optional[tuple]:
+        """文本超过 LARGE_TEXT_CHARS 时返回 (处理器, 编辑框句柄, 字符数)，否则返回None"""
+        for handler in self.registry.resolve(class_name, hwnd):
+            try:
+                target = handler.text_window(hwnd)
+                length = win32_calls.text_length(target) if target else 0
+            except Exception:
+                continue
+            if length > win32_calls.LARGE_TEXT_CHARS:
+                return handler, target, length
+        return None
+
+    def translate_large(self, job: Optional[TranslationJob], hwnd: int, handler,
+                        target: int, length: int):
+        """分块读取超大文本，边读边翻译（有序流水线），译文暂存在临时文件中再分块写回
+
+        内存占用只与块大小有关。写回前重新读取一遍核对原文（长度和哈希），
+        翻译期间文本被修改时放弃替换。
+        """
+        import hashlib
+        import tempfile
+        from batch_translate import Record, translate_ordered
+
+        if not self.services.wait(10):
+            print("翻译引擎未就绪")
+            return
+        chunks = win32_calls.iter_text(target)
+        first = next(chunks, "")
+        detection = detect(first)
+        if not detection.has_letters or is_target_language(detection, self.target_lang):
+            print("文本已是目标语言或没有需要翻译的文字，跳过翻译")
+            return
+        source_lang = choose_source_lang(detection, self.source_lang)
+        print(f"文本较大（{length} 字符），分块翻译...")
+        digest = hashlib.blake2b()
+
+        def records():
+            # 块尾的换行不交给引擎，原样接回（Record.raw）
+            for index, chunk in enumerate(itertools.chain([first], chunks)):
+                digest.update(chunk.encode("utf-8"))
+                body = chunk.rstrip("\r\n")
+                yield Record(index, chunk[len(body):], body or None, None, source_lang)
+
+        def translate(text: str, sl: str) -> Optional[str]:
+            return self.translator.translate(text, sl, self.target_lang)
+
+        with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as spool:
+            translated_length = 0  # UTF-16 字符数，与编辑框的计数一致
+            with metrics.span("stage", stage="translate"):
+                for record, translated in translate_ordered(records(), translate, concurrency=4):
+                    if job and job.cancelled:
+                        print("任务已被新的触发取代")
+                        return
+                    if record.text is not None and not translated:
+                        print("分块翻译失败，保留原文")
+                        return
+                    part = (translated or "") + record.raw
+                    spool.write(part)
+                    translated_length += len(part.encode("utf-16-le")) // 2
+
+            if win32gui.GetForegroundWindow() != hwnd:
+                print("窗口已改变")
+                return
+            if not self.large_text_unchanged(target, length, digest.digest()):
+                print("翻译期间文本已被修改，放弃替换")
+                return
+
+            with metrics.span("stage", stage="replace"):
+                spool.seek(0)
+                parts = iter(lambda: spool.read(win32_calls.CHUNK_CHARS), "")
+                replaced = win32_calls.write_text(target, parts, translated_length)
+                if not replaced:
+                    # 不是编辑框或超过其长度上限：一次性写回
+                    spool.seek(0)
+                    replaced = handler.set_text(hwnd, spool.read())
+        print("✓ 文本替换成功" if replaced else "✗ 文本替换失败")
+
+    @staticmethod
+    def large_text_unchanged(target: int, length: int, expected: bytes) -> bool:
+        """编辑框的文本与翻译前读取的是否相同（先比长度，再分块计算哈希）"""
+        import hashlib
+        if win32_calls.text_length(target) != length:
+            return False
+        digest = hashlib.blake2b()
+        for chunk in win32_calls.iter_text(target):
+            digest.update(chunk.encode("utf-8"))
+        return digest.digest() == expected
+
+    def trigger_translation(self):
+        """翻译快捷键回调：只投递任务，不在钩子线程中执行翻译"""
+        print("检测到翻译快捷键，开始翻译...")
+        self.worker.submit(win32gui.GetForegroundWindow())
+
+    def quit(self):
+        """退出快捷键回调"""
+        print("检测到退出快捷键，程序即将退出...")
+        import sys
+        sys.exit(0)
+
     def on_press(self, key):
         """按键按下事件"""
-        try:
-            if key == keyboard.Key.shift:
-                self.shift_pressed = True
-            elif key == keyboard.Key.f11:
-                self.f11_pressed = True
-            elif key == keyboard.Key.f12:
-                self.f12_pressed = True
-
-            current_time = time.time()
-            # 检查组合键和时间间隔
-            if self.shift_pressed and self.f11_pressed:
-                if current_time - self.last_translation_time >= self.min_interval:
-                    print("检测到翻译快捷键，开始翻译...")
-                    self.handle_translation()
-                    self.last_translation_time = current_time
-                    # 重置按键状态
-                    self.shift_pressed = False
-                    self.f11_pressed = False
-                else:
-                    print("操作过于频繁，请稍后再试")
-            elif self.shift_pressed and self.f12_pressed:
-                print("检测到退出快捷键，程序即将退出...")
-                import sys
-                sys.exit(0)
-
-        except AttributeError:
-            pass
+        self.hotkeys.on_press(key)
+        if self.pretranslator:
+            self.pretranslator.on_keystroke()
 
     def on_release(self, key):
         """按键释放事件"""
-        try:
-            if key == keyboard.Key.shift:
-                self.shift_pressed = False
-            elif key == keyboard.Key.f11:
-                self.f11_pressed = False
-            elif key == keyboard.Key.f12:
-                self.f12_pressed = False
-        except AttributeError:
-            pass
+        self.hotkeys.on_release(key)
 
     def run(self):
         """运行翻译器"""
         with keyboard.Listener(
             on_press=self.on_press,
             on_release=self.on_release) as listener:
+            if mark_listening(listener):
+                return
             listener.join()
 
 def main():
+    configure_from_env()
     translator = SimpleTranslator()
     translator.run()
 
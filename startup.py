@@ -0,0 +1,167 @@
+"""启动优化辅助：后台初始化、监听就绪标记和启动耗时报告
+
+用法:
+    python startup.py simple_translator.py --budget 0.8
+
+报告入口脚本的导入耗时（基于 python -X importtime），并测量从进程启动到
+键盘监听注册完成的时间；超过 --budget 秒时以非零状态退出，可用于回归检查。
+没有安装 pywin32 时（或指定 --fake-win32）在子进程中先安装 fake_win32 替身层，
+benchmarks.py startup 即以这种方式检查启动预算。
+"""
+import importlib.util
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+PROBE_ENV = "TRANSLATOR_STARTUP_PROBE"
+LISTENING_MARKER = "TRANSLATOR_LISTENING"
+
+
+class BackgroundInit:
+    """在后台线程中执行初始化，使用方在需要时等待完成"""
+    def __init__(self, name: str, init: Callable[[], None]):
+        self.name = name
+        self.error: Optional[BaseException] = None
+        self.elapsed = 0.0
+        self._done = threading.Event()
+        self._init = init
+        threading.Thread(target=self._run, name=f"init-{name}", daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._init()
+        except BaseException as e:
+            self.error = e
+            print(f"{self.name} 初始化失败: {e}")
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待初始化完成，成功返回True"""
+        return self._done.wait(timeout) and self.error is None
+
+
+def mark_listening(listener) -> bool:
+    """键盘监听已注册；探测模式下输出标记并停止监听，返回是否应退出"""
+    if not os.environ.get(PROBE_ENV):
+        return False
+    print(LISTENING_MARKER, flush=True)
+    listener.stop()
+    return True
+
+
+def needs_fake_win32() -> bool:
+    """没有安装 pywin32（非Windows平台）时需要替身层才能启动入口脚本"""
+    return importlib.util.find_spec("win32gui") is None
+
+
+def _fake_prelude() -> str:
+    """子进程中安装替身层的代码（须在导入入口脚本之前执行）"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return f"import sys; sys.path.insert(0, {here!r}); import fake_win32; fake_win32.install(); "
+
+
+def import_times(script: str, fake_win32: bool = False) -> List[Tuple[float, str]]:
+    """使用 -X importtime 统计脚本导入的模块累计耗时（秒），按耗时降序
+
+    fake_win32 为True时先安装替身层（替身层本身的导入也会列出）。
+    """
+    module = os.path.splitext(os.path.basename(script))[0]
+    prelude = _fake_prelude() if fake_win32 else ""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{prelude}import {module}"],
+        cwd=os.path.dirname(os.path.abspath(script)), capture_output=True, text=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s*)(\S+)", line)
+        if match and not match.group(2).startswith("   "):
+            # 只统计顶层导入（缩进最少的行）
+            times.append((int(match.group(1)) / 1e6, match.group(3)))
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败")
+    return sorted(times, reverse=True)
+
+
+def time_to_listening(script: str, timeout: float = 30.0,
+                      fake_win32: bool = False) -> Optional[float]:
+    """启动脚本直到输出监听就绪标记，返回耗时（秒）；超时、提前退出等失败返回None
+
+    子进程的输出在单独的线程中读取，子进程不再输出时也按timeout结束。
+    """
+    env = dict(os.environ, **{PROBE_ENV: "1"})
+    path = os.path.abspath(script)
+    if fake_win32:
+        command = [sys.executable, "-c",
+                   f"{_fake_prelude()}import runpy; sys.argv = [{path!r}]; "
+                   f"runpy.run_path({path!r}, run_name='__main__')"]
+    else:
+        command = [sys.executable, path]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=os.path.dirname(path), env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    events: "queue.Queue[Optional[float]]" = queue.Queue()
+    output: List[str] = []
+
+    def read():
+        for line in process.stdout:
+            if line.strip() == LISTENING_MARKER:
+                events.put(time.perf_counter() - start)
+                return
+            output.append(line.rstrip())
+        events.put(None)  # 子进程退出而没有进入监听状态
+
+    threading.Thread(target=read, name="startup-probe", daemon=True).start()
+    try:
+        elapsed = events.get(timeout=timeout)
+    except queue.Empty:
+        print(f"  {timeout:.0f}秒内没有进入监听状态")
+        elapsed = None
+    finally:
+        process.kill()
+        process.wait()
+    if elapsed is None and output:
+        print(f"  子进程输出: {output[-1]}")
+    return elapsed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="入口脚本启动耗时报告")
+    parser.add_argument("scripts", nargs="*",
+                        default=["simple_translator.py", "translator.py", "silent_translator.py"])
+    parser.add_argument("--budget", type=float, default=1.0, help="监听就绪耗时上限（秒）")
+    parser.add_argument("--top", type=int, default=10, help="显示耗时最多的导入数")
+    parser.add_argument("--fake-win32", action="store_true",
+                        help="先安装 fake_win32 替身层（没有安装 pywin32 时自动启用）")
+    args = parser.parse_args(argv)
+
+    fake = args.fake_win32 or needs_fake_win32()
+    if fake:
+        print("使用 fake_win32 替身层启动入口脚本")
+    failed = False
+    for script in args.scripts:
+        print(f"== {script} ==")
+        for seconds, module in import_times(script, fake)[:args.top]:
+            print(f"  {seconds * 1000:8.1f}ms  {module}")
+        elapsed = time_to_listening(script, fake_win32=fake)
+        if elapsed is None:
+            print("  ✗ 未能进入监听状态")
+            failed = True
+        elif elapsed > args.budget:
+            print(f"  ✗ 监听就绪耗时 {elapsed * 1000:.1f}ms，超过预算 {args.budget * 1000:.0f}ms")
+            failed = True
+        else:
+            print(f"  ✓ 监听就绪耗时 {elapsed * 1000:.1f}ms（预算 {args.budget * 1000:.0f}ms）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import metrics
+
+_SPACE_RUN = re.compile(r"[ \t　]+")
+
+
+class TranslationCache:
+    """翻译缓存：内存LRU + SQLite(WAL)持久化"""
+    def __init__(self, path: str = "translation_cache.db", memory_size: int = 2048,
+                 max_entries: int = 100000, max_age: float = 30 * 24 * 3600):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._open_db()
+
+    def _open_db(self):
+        """打开SQLite数据库，失败时只使用内存缓存"""
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key BLOB PRIMARY KEY, translation TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_translations_created ON translations(created)"
+            )
+            self._db.commit()
+            self.evict()
+        except sqlite3.Error as e:
+            print(f"翻译缓存数据库不可用，仅使用内存缓存: {e}")
+            self._db = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化文本：NFC、去除首尾空白、合并行内连续空白"""
+        text = unicodedata.normalize("NFC", text).strip()
+        return _SPACE_RUN.sub(" ", text)
+
+    @classmethod
+    def make_key(cls, engine: str, source: str, target: str, text: str) -> bytes:
+        """生成缓存键（引擎、源语言、目标语言、规范化文本）"""
+        raw = "\x1f".join((engine.lower(), source.lower(), target.lower(), cls.normalize(text)))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, engine: str, source: str, target: str, text: str) -> Optional[str]:
+        """查询缓存，未命中返回None"""
+        key = self.make_key(engine, source, target, text)
+        with self._lock:
+            translated = self._memory.get(key)
+            if translated is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                metrics.inc("cache_hits", tier="memory")
+                return translated
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT translation, created FROM translations WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"读取翻译缓存错误: {e}")
+                    row = None
+                if row and time.time() - row[1] <= self.max_age:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    metrics.inc("cache_hits", tier="sqlite")
+                    return row[0]
+
+            self.misses += 1
+            metrics.inc("cache_misses")
+            return None
+
+    def put(self, engine: str, source: str, target: str, text: str, translated: str):
+        """写入缓存"""
+        if not translated:
+            return
+        key = self.make_key(engine, source, target, text)
+        with self._lock:
+            self._remember(key, translated)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO translations (key, translation, created) VALUES (?, ?, ?)",
+                    (key, translated, time.time())
+                )
+                self._db.commit()
+                self.writes += 1
+            except sqlite3.Error as e:
+                print(f"写入翻译缓存错误: {e}")
+                return
+        # 每写入一批后做一次淘汰
+        if self.writes % 256 == 0:
+            self.evict()
+
+    def _remember(self, key: bytes, translated: str):
+        """写入内存LRU（调用方持有锁）"""
+        self._memory[key] = translated
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def evict(self):
+        """按时间和容量淘汰持久化条目"""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                self._db.execute(
+                    "DELETE FROM translations WHERE created < ?", (time.time() - self.max_age,)
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                if count > self.max_entries:
+                    self._db.execute(
+                        "DELETE FROM translations WHERE key IN ("
+                        "SELECT key FROM translations ORDER BY created LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"淘汰翻译缓存错误: {e}")
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        """关闭数据库"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> TranslationCache:
+    """获取进程内共享的默认缓存"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            path = os.environ.get("TRANSLATOR_CACHE_PATH", "translation_cache.db")
+            _default_cache = TranslationCache(path)
+        return _default_cache
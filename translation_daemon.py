@@ -0,0 +1,432 @@
+"""常驻本地翻译服务
+
+一个长期运行的进程持有翻译引擎的连接池、翻译缓存、限流/熔断状态和增量翻译状态，
+各快捷键前端只需一次本地HTTP往返即可拿到译文。
+
+接口（仅监听 127.0.0.1，请求格式与 Pot 的 /translate 一致）:
+    POST /translate  {"text": "...", "from": "auto", "to": "en", "window": 可选, "timeout": 可选,
+                      "engine": 可选}
+                     -> 200 {"text": "译文", "from": ..., "to": ..., "engine": ...}
+                     -> 409 {"error": "...", "engine": ...}  服务使用的不是请求的引擎
+                     -> 502 {"error": "..."}
+    GET  /health     -> 200 {"status": "ok", "engine": ..., "pid": ...}
+    GET  /metrics    -> Prometheus 文本格式
+
+用法: python translation_daemon.py [--port 60829] [--engine google,deepl]
+一个服务进程只使用一组引擎（启动参数 --engine，默认按 translator_config.json 解析）。
+前端通过 connect_or_local() 连接（服务未运行时按前端的引擎设置启动它）；
+服务使用的引擎不同或无法连接时退回进程内翻译。
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from protected_spans import Protected, protect
+
+DEFAULT_PORT = 60829
+PORT_ENV = "TRANSLATOR_DAEMON_PORT"
+
+
+def daemon_port(config: Optional[dict] = None) -> int:
+    """服务端口：环境变量 > 配置项 daemon_port > 默认值"""
+    port = os.environ.get(PORT_ENV) or (config or {}).get("daemon_port") or DEFAULT_PORT
+    return int(port)
+
+
+class TranslationService:
+    """翻译服务：受保护片段 + 缓存 + 翻译记忆 + 引擎 + 按窗口的增量翻译"""
+    def __init__(self, engine=None, cache=None, config: Optional[dict] = None,
+                 default: str = "google", memory=None):
+        from engines import build_engine, engine_names, load_engine_config
+        from incremental import IncrementalTranslator
+        from translation_cache import get_default_cache
+        from translation_memory import get_default_memory
+
+        if config is None:
+            config = load_engine_config() if engine is None else {}
+        if engine is None:
+            # 与 batch_translate 相同的解析方式: engines > 可用的 api_type > default
+            self.engine_key = ",".join(engine_names(config, default))
+            engine = build_engine(config, default)
+            engine.warm_up()
+        else:
+            self.engine_key = engine.name
+        self.engine = engine
+        self.cache = cache if cache is not None else get_default_cache()
+        # 配置 "translation_memory": false 时不使用翻译记忆
+        if memory is None and config.get("translation_memory", True):
+            memory = get_default_memory()
+        self.memory = memory
+        # 配置 "protect_spans": false 时URL、代码、@提及和表情也交给引擎
+        self.protect_spans = config.get("protect_spans", True)
+        self.incremental = IncrementalTranslator(engine)
+
+    @property
+    def name(self) -> str:
+        return self.engine.name
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  window_key=None, timeout: float = 5.0) -> Optional[str]:
+        """翻译文本，指定window_key时按窗口增量翻译；失败返回None"""
+        if not text or not text.strip():
+            return None
+        masked = self._protect(text)
+        if masked is None:
+            return text
+        translated = self._lookup(masked.text, source_lang, target_lang)
+        if translated is None:
+            source = masked.text.strip()
+            if window_key is None:
+                translated = self.engine.translate(source, source_lang, target_lang, timeout)
+            else:
+                translated = self.incremental.translate(
+                    window_key, source, source_lang, target_lang, timeout)
+                print(f"增量翻译: 发送 {self.incremental.last_sent} 字符，"
+                      f"复用 {self.incremental.last_reused} 字符")
+            if not translated or not translated.strip():
+                return None
+            self._store(masked.text, source_lang, target_lang, translated)
+        return masked.restore(translated)
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str,
+                        timeout: float = 5.0) -> List[Optional[str]]:
+        """翻译多条互相独立的文本，缓存和翻译记忆未命中的打包成尽量少的引擎请求
+
+        结果与texts一一对应，失败的为None。
+        """
+        results: List[Optional[str]] = [None] * len(texts)
+        misses = []
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            masked = self._protect(text)
+            if masked is None:
+                results[index] = text
+                continue
+            translated = self._lookup(masked.text, source_lang, target_lang)
+            if translated is not None:
+                results[index] = masked.restore(translated)
+            else:
+                misses.append((index, masked))
+        if not misses:
+            return results
+
+        sources = [masked.text.strip() for _, masked in misses]
+        translate_batch = getattr(self.engine, "translate_batch", None)
+        if translate_batch is not None:
+            translations = translate_batch(sources, source_lang, target_lang, timeout)
+        else:
+            translations = [self.engine.translate(source, source_lang, target_lang, timeout)
+                            for source in sources]
+        for (index, masked), translated in zip(misses, translations):
+            if translated and translated.strip():
+                self._store(masked.text, source_lang, target_lang, translated)
+                results[index] = masked.restore(translated)
+        return results
+
+    def _protect(self, text: str) -> Optional[Protected]:
+        """URL、代码、@提及等换成占位符后再查缓存和请求引擎，译文中再换回原文
+
+        去掉这些片段后没有需要翻译的文字时返回None。
+        """
+        if not self.protect_spans:
+            return Protected(text)
+        masked = protect(text)
+        if not masked.translatable:
+            from metrics import metrics
+            metrics.inc("protected_skips")
+            print("没有需要翻译的文字（只有链接、代码、@提及或表情），不请求翻译引擎")
+            return None
+        return masked
+
+    def _lookup(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """查翻译缓存和翻译记忆，都没有时返回None"""
+        cached = self.cache.get(self.engine.name, source_lang, target_lang, text)
+        if cached is not None:
+            print(f"命中翻译缓存: {cached[:50]}")
+            return cached
+
+        # 相似的片段译过时复用其译文（必要时修补数字、名字和标点），不请求引擎
+        if self.memory is not None:
+            match = self.memory.lookup(text, source_lang, target_lang)
+            if match is not None:
+                print(f"命中翻译记忆: 相似度 {match.similarity:.2f}，修补 {match.patches} 处")
+                self.cache.put(self.engine.name, source_lang, target_lang, text, match.translation)
+                return match.translation
+        return None
+
+    def _store(self, text: str, source_lang: str, target_lang: str, translated: str):
+        self.cache.put(self.engine.name, source_lang, target_lang, text, translated)
+        if self.memory is not None:
+            self.memory.add(text, source_lang, target_lang, translated)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """本地翻译服务的请求处理器"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    service: TranslationService = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            payload = {"status": "ok", "engine": self.service.engine_key, "pid": os.getpid()}
+            if self.service.memory is not None:
+                payload["memory"] = self.service.memory.stats()
+            self._reply(200, payload)
+        elif self.path == "/metrics":
+            from metrics import metrics
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            text = request["text"]
+            source_lang = request.get("from", "auto")
+            target_lang = request.get("to", "en")
+            window_key = request.get("window")
+            timeout = float(request.get("timeout", 5.0))
+            engine = request.get("engine")
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"请求格式错误: {e}"})
+            return
+        if engine is not None and engine != self.service.engine_key:
+            self._reply(409, {"error": f"翻译服务使用的引擎是 {self.service.engine_key}",
+                              "engine": self.service.engine_key})
+            return
+
+        try:
+            translated = self.service.translate(text, source_lang, target_lang, window_key, timeout)
+        except Exception as e:
+            print(f"翻译错误: {e}")
+            translated = None
+        if translated is None:
+            self._reply(502, {"error": "翻译失败"})
+            return
+        self._reply(200, {"text": translated, "from": source_lang, "to": target_lang,
+                          "engine": self.service.name})
+
+
+def serve(service: Optional[TranslationService], port: int = DEFAULT_PORT,
+          host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """创建服务（调用方负责 serve_forever）"""
+    handler = type("Handler", (DaemonHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class DaemonClient:
+    """本地翻译服务的客户端，每个线程保持一个长连接
+
+    指定engine时只接受使用这组引擎的服务（如 "deepl" 或 "google,deepl"）。
+    """
+    def __init__(self, port: int = DEFAULT_PORT, host: str = "127.0.0.1", timeout: float = 10.0,
+                 engine: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.engine = engine
+        self.timeout = timeout
+        self.name = f"daemon:{port}"
+        self._local = threading.local()
+
+    def _connection(self):
+        import http.client
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _call(self, method: str, path: str, payload: Optional[dict] = None):
+        """发送请求，返回 (状态码, JSON)；长连接失效时重连一次"""
+        import http.client
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read().decode("utf-8"))
+            except (http.client.HTTPException, ConnectionError) as e:
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise ConnectionError(f"翻译服务连接失败: {e}") from e
+            except OSError:
+                connection.close()
+                self._local.connection = None
+                raise
+
+    def restart(self, wait: float = 15.0) -> bool:
+        """启动服务进程并等待其就绪"""
+        print("启动本地翻译服务...")
+        spawn_daemon(self.port, self.engine)
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            info = self.status()
+            if info is not None:
+                if not self._serves(info):
+                    return False
+                print(f"✓ 已连接本地翻译服务 (端口 {self.port}，引擎 {info.get('engine')})")
+                return True
+        print("✗ 本地翻译服务未能启动")
+        return False
+
+    def status(self) -> Optional[dict]:
+        """服务的 /health 信息，未运行时返回None"""
+        try:
+            status, result = self._call("GET", "/health")
+        except (OSError, ValueError):
+            return None
+        if status != 200 or result.get("status") != "ok":
+            return None
+        return result
+
+    def _serves(self, info: dict) -> bool:
+        """服务使用的引擎是否与客户端要求的相同"""
+        if self.engine is None or info.get("engine") == self.engine:
+            return True
+        print(f"端口 {self.port} 上的翻译服务使用引擎 {info.get('engine')}，"
+              f"不是所需的 {self.engine}")
+        return False
+
+    def health(self) -> bool:
+        info = self.status()
+        return info is not None and self._serves(info)
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  window_key=None, timeout: float = 5.0) -> Optional[str]:
+        """请求翻译，失败返回None"""
+        payload = {"text": text, "from": source_lang, "to": target_lang, "timeout": timeout}
+        if self.engine is not None:
+            payload["engine"] = self.engine
+        if window_key is not None:
+            payload["window"] = window_key
+        try:
+            try:
+                status, result = self._call("POST", "/translate", payload)
+            except ConnectionError:
+                # 服务进程已退出：重新启动后再试一次
+                if not self.restart():
+                    raise
+                status, result = self._call("POST", "/translate", payload)
+        except (OSError, ValueError) as e:
+            print(f"翻译服务请求错误: {e}")
+            return None
+        if status != 200:
+            print(f"翻译服务返回错误: {result.get('error', status)}")
+            return None
+        return result.get("text")
+
+
+def spawn_daemon(port: int, engine: Optional[str] = None):
+    """在后台启动服务进程（与前端进程分离，前端退出后继续运行）"""
+    script = os.path.abspath(__file__)
+    log = open(os.path.join(os.path.dirname(script), "translation_daemon.log"), "ab")
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = (subprocess.DETACHED_PROCESS
+                                   | subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs["start_new_session"] = True
+    args = [sys.executable, "-u", script, "--port", str(port)]
+    if engine:
+        args += ["--engine", engine]
+    subprocess.Popen(args, cwd=os.path.dirname(script),
+                     stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+    log.close()
+
+
+def connect(port: Optional[int] = None, spawn: bool = True, wait: float = 15.0,
+            engine: Optional[str] = None) -> Optional[DaemonClient]:
+    """连接本地翻译服务，未运行时启动它；失败或服务使用的不是engine时返回None"""
+    client = DaemonClient(port or daemon_port(), engine=engine)
+    info = client.status()
+    if info is not None:
+        return client if client._serves(info) else None
+    if spawn and client.restart(wait):
+        return client
+    return None
+
+
+def connect_or_local(config: Optional[dict] = None, default: str = "google"):
+    """返回翻译服务客户端；配置 "daemon": false 或无法连接时在进程内翻译"""
+    if config is None:
+        from engines import load_engine_config
+        config = load_engine_config()
+    if config.get("daemon", True):
+        from engines import engine_names
+        from startup import PROBE_ENV
+        # 测量启动耗时的探测进程很快会被终止，不为它启动服务进程
+        client = connect(daemon_port(config), spawn=not os.environ.get(PROBE_ENV),
+                         engine=",".join(engine_names(config, default)))
+        if client is not None:
+            return client
+        print("改为在进程内翻译")
+    return TranslationService(config=config, default=default)
+
+
+def main(argv=None) -> int:
+    import argparse
+    from metrics import metrics
+
+    parser = argparse.ArgumentParser(description="常驻本地翻译服务")
+    parser.add_argument("--port", type=int, default=None, help=f"监听端口（默认 {DEFAULT_PORT}）")
+    parser.add_argument("--engine", default=None,
+                        help="使用的引擎，多个以逗号分隔（默认按 translator_config.json）")
+    args = parser.parse_args(argv)
+
+    metrics.enabled = True  # 通过 /metrics 导出
+    port = args.port or daemon_port()
+    try:
+        # 先占用端口，已有服务在运行时不必再创建引擎
+        server = serve(None, port)
+    except OSError as e:
+        print(f"端口 {port} 无法使用（服务可能已在运行）: {e}")
+        return 1
+    from engines import load_engine_config
+    config = load_engine_config()
+    if args.engine:
+        config = dict(config, engines=args.engine.split(","))
+    server.RequestHandlerClass.service = TranslationService(config=config)
+    print(f"本地翻译服务已启动: http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""模糊翻译记忆
+
+翻译缓存只能命中完全相同的文本，而很多消息只差一个名字、数字或标点。
+翻译记忆为每条译过的片段计算 MinHash 签名并按 LSH 分段写入索引，
+查询时只取与之共享分段桶的少数候选（索引查找，与记忆大小基本无关），
+再逐个计算相似度。相似度达到阈值、且差异可以安全修补时复用其译文:
+- 数字、拉丁字母单词（人名、代号、网址等）原样出现在译文中且只出现一次时，直接替换；
+  原文和译文是同一种文字（如英译法）时，普通单词在译文中原样出现只是巧合（hotel -> hotel），
+  只替换数字和看起来是名字或代号的单词（句中大写、含数字或符号）
+- 只有标点不同时沿用译文，句末标点换成新文本的句末标点
+其他差异（例如中文人名）无法在译文中定位，不复用，交给翻译引擎。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from difflib import SequenceMatcher
+from typing import List, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+
+_TOKEN = re.compile(
+    r"(?P<num>\d+(?:[.,:]\d+)*%?)"
+    r"|(?P<word>[A-Za-z][A-Za-z0-9_@'.-]*[A-Za-z0-9_]|[A-Za-z])"
+    r"|(?P<space>\s+)"
+    r"|(?P<char>.)",
+    re.S
+)
+_MASK64 = (1 << 64) - 1
+_NUMBER = "\x00num"  # 建索引和比较相似度时数字统一替换为占位符
+# 句末标点在译文中的对应（中文标点 -> 英文标点）
+_PUNCT_MAP = {"。": ".", "！": "!", "？": "?", "，": ",", "；": ";", "：": ":", "…": "..."}
+
+
+class Token(NamedTuple):
+    kind: str   # num / word / punct / char
+    text: str
+    start: int
+    end: int
+
+
+def tokenize(text: str) -> List[Token]:
+    """切分为数字、拉丁单词、单个字符和标点（跳过空白）"""
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        value = match.group()
+        if kind == "char" and unicodedata.category(value)[0] in "PS":
+            kind = "punct"
+        tokens.append(Token(kind, value, match.start(), match.end()))
+    return tokens
+
+
+def _masked(tokens: List[Token]) -> List[str]:
+    """用于建索引和比较相似度的词元：去掉标点，数字换成占位符"""
+    return [_NUMBER if token.kind == "num" else token.text.lower()
+            for token in tokens if token.kind != "punct"]
+
+
+def _shingles(masked: List[str]) -> set:
+    """相邻两个词元为一组（文本只有一个词元时取单个）"""
+    if len(masked) < 2:
+        return {zlib.crc32(masked[0].encode("utf-8"))} if masked else set()
+    return {zlib.crc32(f"{a}\x1f{b}".encode("utf-8")) for a, b in zip(masked, masked[1:])}
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    """固定的哈希参数（乘法-移位哈希），保证签名跨进程稳定"""
+    params = []
+    for i in range(count):
+        digest = hashlib.blake2b(f"minhash{i}".encode(), digest_size=16).digest()
+        params.append((int.from_bytes(digest[:8], "little") | 1, int.from_bytes(digest[8:], "little")))
+    return params
+
+
+class Match(NamedTuple):
+    """查询结果"""
+    translation: str
+    source: str         # 记忆中的原文
+    similarity: float
+    patches: int        # 修补的位置数
+
+
+class TranslationMemory:
+    """模糊翻译记忆：SQLite(WAL)持久化，MinHash + LSH 索引"""
+    def __init__(self, path: str = "translation_memory.db", threshold: float = 0.8,
+                 num_perm: int = 64, bands: int = 16, max_chars: int = 500,
+                 max_candidates: int = 20, max_entries: int = 1000000):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_chars = max_chars
+        self.max_candidates = max_candidates
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.hits = 0
+        self.patched = 0
+        self.unsafe = 0
+        self.writes = 0
+        self._permutations = _permutations(num_perm)
+        self._np_permutations = None
+        self._lock = threading.Lock()
+        self._db = None
+        self._open_db()
+
+    def _open_db(self):
+        """打开SQLite数据库，失败时不使用翻译记忆"""
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                "id INTEGER PRIMARY KEY, key BLOB UNIQUE NOT NULL, source TEXT NOT NULL, "
+                "translation TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "bucket INTEGER NOT NULL, segment INTEGER NOT NULL, "
+                "PRIMARY KEY (bucket, segment)) WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_buckets_segment ON buckets(segment)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_segments_created ON segments(created)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"翻译记忆数据库不可用: {e}")
+            self._db = None
+
+    def signature(self, masked: List[str]) -> List[int]:
+        """MinHash签名（安装了NumPy时向量化计算，结果相同）"""
+        shingles = _shingles(masked)
+        if not shingles:
+            return []
+        try:
+            import numpy as np
+        except ImportError:
+            return [min(((a * x + b) & _MASK64) >> 32 for x in shingles)
+                    for a, b in self._permutations]
+        if self._np_permutations is None:
+            self._np_permutations = (
+                np.array([[a] for a, _ in self._permutations], dtype=np.uint64),
+                np.array([[b] for _, b in self._permutations], dtype=np.uint64),
+            )
+        a, b = self._np_permutations
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        with np.errstate(over="ignore"):
+            hashed = (a * values + b) >> np.uint64(32)  # uint64 运算自然按 2^64 取模
+        return hashed.min(axis=1).tolist()
+
+    def _buckets(self, source_lang: str, target_lang: str, masked: List[str]) -> List[int]:
+        """LSH：签名分成bands段，每段（连同语言）哈希为一个桶"""
+        signature = self.signature(masked)
+        if not signature:
+            return []
+        prefix = f"{source_lang.lower()}\x1f{target_lang.lower()}"
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            raw = f"{prefix}\x1f{band}\x1f{','.join(map(str, rows))}".encode("utf-8")
+            buckets.append(int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(),
+                                          "little", signed=True))
+        return buckets
+
+    @staticmethod
+    def _key(source_lang: str, target_lang: str, text: str) -> bytes:
+        raw = "\x1f".join((source_lang.lower(), target_lang.lower(), text.strip()))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def lookup(self, text: str, source_lang: str, target_lang: str) -> Optional[Match]:
+        """查找相似片段并返回（必要时修补过的）译文，没有可安全复用的结果时返回None"""
+        text = text.strip()
+        if self._db is None or not text or len(text) > self.max_chars:
+            return None
+        tokens = tokenize(text)
+        masked = _masked(tokens)
+        buckets = self._buckets(source_lang, target_lang, masked)
+        if not buckets:
+            return None
+
+        with self._lock:
+            self.lookups += 1
+            try:
+                candidates = self._db.execute(
+                    "SELECT s.source, s.translation FROM ("
+                    f"SELECT segment, COUNT(*) AS shared FROM buckets "
+                    f"WHERE bucket IN ({','.join('?' * len(buckets))}) "
+                    "GROUP BY segment ORDER BY shared DESC LIMIT ?"
+                    ") AS c JOIN segments AS s ON s.id = c.segment ORDER BY c.shared DESC",
+                    (*buckets, self.max_candidates)
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"读取翻译记忆错误: {e}")
+                candidates = []
+
+        scored = []
+        for source, translation in candidates:
+            source_tokens = tokenize(source)
+            matcher = SequenceMatcher(None, _masked(source_tokens), masked, autojunk=False)
+            if matcher.real_quick_ratio() < self.threshold or matcher.quick_ratio() < self.threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity >= self.threshold:
+                scored.append((similarity, source, source_tokens, translation))
+
+        # 从最相似的开始，取第一个可以安全修补的
+        result = None
+        for similarity, source, source_tokens, translation in sorted(
+                scored, key=lambda item: item[0], reverse=True):
+            patched = patch_translation(source, source_tokens, text, tokens, translation)
+            if patched is not None:
+                result = Match(patched[0], source, similarity, patched[1])
+                break
+
+        if result is not None:
+            outcome = "patched" if result.patches else "hit"
+        else:
+            outcome = "unsafe" if scored else "miss"
+        with self._lock:
+            if result is not None:
+                self.hits += 1
+                self.patched += 1 if result.patches else 0
+            elif scored:
+                self.unsafe += 1
+        metrics.inc("memory_lookups", result=outcome)
+        return result
+
+    def add(self, text: str, source_lang: str, target_lang: str, translated: str):
+        """记录一条译文"""
+        text = text.strip()
+        if self._db is None or not text or not translated or len(text) > self.max_chars:
+            return
+        buckets = self._buckets(source_lang, target_lang, _masked(tokenize(text)))
+        if not buckets:
+            return
+        key = self._key(source_lang, target_lang, text)
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT id FROM segments WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE segments SET translation = ?, created = ? WHERE id = ?",
+                        (translated, time.time(), row[0])
+                    )
+                else:
+                    cursor = self._db.execute(
+                        "INSERT INTO segments (key, source, translation, created) VALUES (?, ?, ?, ?)",
+                        (key, text, translated, time.time())
+                    )
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO buckets (bucket, segment) VALUES (?, ?)",
+                        [(bucket, cursor.lastrowid) for bucket in buckets]
+                    )
+                self._db.commit()
+                self.writes += 1
+            except sqlite3.Error as e:
+                print(f"写入翻译记忆错误: {e}")
+                return
+        if self.writes % 1024 == 0:
+            self.evict()
+
+    def evict(self):
+        """超过容量时删除最早的条目"""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                count = self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+                if count > self.max_entries:
+                    ids = [row[0] for row in self._db.execute(
+                        "SELECT id FROM segments ORDER BY created LIMIT ?",
+                        (count - self.max_entries,)
+                    )]
+                    self._db.executemany("DELETE FROM buckets WHERE segment = ?",
+                                         [(i,) for i in ids])
+                    self._db.executemany("DELETE FROM segments WHERE id = ?", [(i,) for i in ids])
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"淘汰翻译记忆错误: {e}")
+
+    def __len__(self) -> int:
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def stats(self) -> dict:
+        """返回复用统计（hits 即省下的引擎请求数）"""
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "patched": self.patched,
+            "unsafe": self.unsafe,
+            "avoided_rate": self.hits / self.lookups if self.lookups else 0.0,
+        }
+
+    def close(self):
+        """关闭数据库"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _occurrences(text: str, value: str) -> List[int]:
+    """value在text中作为完整单词或数字出现的位置"""
+    pattern = re.compile(r"(?<![A-Za-z0-9_])(?<![0-9][.,])" + re.escape(value)
+                         + r"(?![A-Za-z0-9_]|[.,][0-9])")
+    return [match.start() for match in pattern.finditer(text)]
+
+
+def _trailing_punct(tokens: List[Token]) -> str:
+    end = len(tokens)
+    while end and tokens[end - 1].kind == "punct":
+        end -= 1
+    return "".join(token.text for token in tokens[end:])
+
+
+_SENTENCE_START = {".", "!", "?", "。", "！", "？", "…", "\"", "“", "(", "（", "[", "【"}
+
+
+def _name_like(tokens: List[Token], index: int) -> bool:
+    """数字，或看起来是名字、代号的单词：含数字或符号、句中大写开头、首字母以外有大写"""
+    token = tokens[index]
+    if token.kind == "num":
+        return True
+    value = token.text
+    if any(not ch.isalpha() for ch in value) or any(ch.isupper() for ch in value[1:]):
+        return True
+    # 句首的大写不能说明是名字
+    return value[0].isupper() and index > 0 and tokens[index - 1].text not in _SENTENCE_START
+
+
+def patch_translation(source: str, source_tokens: List[Token], text: str, tokens: List[Token],
+                      translation: str) -> Optional[Tuple[str, int]]:
+    """把source的译文改为text的译文，返回 (译文, 修补数)；无法安全修补时返回None"""
+    from language_detect import detect
+
+    replacements = []  # (译文中的位置, 原值, 新值)
+    trailing_changed = False
+    same_script = None
+    matcher = SequenceMatcher(None, [t.text for t in source_tokens], [t.text for t in tokens],
+                              autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        old, new = source_tokens[i1:i2], tokens[j1:j2]
+        if all(token.kind == "punct" for token in old + new):
+            # 只有标点不同：句末标点在后面统一处理，句中标点沿用译文
+            if i2 == len(source_tokens) and j2 == len(tokens):
+                trailing_changed = True
+            continue
+        if tag != "replace" or not all(token.kind in ("num", "word") for token in old + new):
+            return None
+        if any(token.kind == "word" for token in old + new):
+            if same_script is None:
+                same_script = detect(source).script == detect(translation).script
+            if same_script and not (all(_name_like(source_tokens, i) for i in range(i1, i2))
+                                    and all(_name_like(tokens, j) for j in range(j1, j2))):
+                return None
+        old_text = source[old[0].start:old[-1].end]
+        new_text = text[new[0].start:new[-1].end]
+        positions = _occurrences(translation, old_text)
+        if len(positions) != 1:
+            return None
+        replacements.append((positions[0], old_text, new_text))
+
+    # 从后向前替换，前面的位置不受影响
+    for position, old_text, new_text in sorted(replacements, reverse=True):
+        translation = translation[:position] + new_text + translation[position + len(old_text):]
+    if trailing_changed:
+        body = translation.rstrip()
+        stripped = body.rstrip(".!?,;:…。！？，；：")
+        suffix = "".join(_PUNCT_MAP.get(ch, ch) for ch in _trailing_punct(tokens))
+        translation = stripped + suffix
+    return translation, len(replacements) + (1 if trailing_changed else 0)
+
+
+_default_memory = None
+_default_lock = threading.Lock()
+
+
+def get_default_memory() -> TranslationMemory:
+    """获取进程内共享的默认翻译记忆"""
+    global _default_memory
+    with _default_lock:
+        if _default_memory is None:
+            path = os.environ.get("TRANSLATOR_MEMORY_PATH", "translation_memory.db")
+            _default_memory = TranslationMemory(path)
+        return _default_memory
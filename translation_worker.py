@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TranslationJob:
+    """一次翻译任务（对应一次快捷键触发）"""
+    def __init__(self, hwnd: Optional[int] = None):
+        self.hwnd = hwnd
+        self.created = time.time()
+        self.presses = 1  # 合并进来的触发次数
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """取消任务"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+class TranslationWorker:
+    """后台翻译工作线程：键盘回调只负责投递任务，耗时操作都在这里执行
+
+    - 尚未开始的任务会被新的触发合并（只保留最新的一次）
+    - 正在执行的任务在新触发到来时被取消，由新任务重新读取窗口和文本
+    """
+    def __init__(self, handler: Callable[[TranslationJob], None], settle_delay: float = 0.05):
+        self.handler = handler
+        self.settle_delay = settle_delay  # 等待连续按键稳定后再开始
+        self.coalesced = 0
+        self.cancelled = 0
+        self._pending: Optional[TranslationJob] = None
+        self._current: Optional[TranslationJob] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="translation-worker", daemon=True)
+
+    def start(self):
+        """启动工作线程"""
+        self._thread.start()
+        return self
+
+    def submit(self, hwnd: Optional[int] = None) -> TranslationJob:
+        """投递任务（在键盘钩子线程中调用，必须立即返回）"""
+        job = TranslationJob(hwnd)
+        with self._lock:
+            if self._pending is not None:
+                job.presses += self._pending.presses
+                self._pending.cancel()
+                self.coalesced += 1
+            if self._current is not None and not self._current.cancelled:
+                self._current.cancel()
+                self.cancelled += 1
+            self._pending = job
+        self._wakeup.set()
+        return job
+
+    def _take(self) -> Optional[TranslationJob]:
+        with self._lock:
+            job, self._pending = self._pending, None
+            self._current = job
+            return job
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            if self.settle_delay:
+                time.sleep(self.settle_delay)
+            job = self._take()
+            if job is None or job.cancelled:
+                continue
+            try:
+                self.handler(job)
+            except Exception as e:
+                print(f"翻译任务错误: {e}")
+            finally:
+                with self._lock:
+                    self._current = None
+
+    def stop(self, timeout: float = 1.0):
+        """停止工作线程"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
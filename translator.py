@@ -1,28 +1,51 @@
 import win32gui
-import win32con
-import requests
 from pynput import keyboard
-import time
 from typing import Optional
 import json
 import os
+from translation_worker import TranslationJob, TranslationWorker
+from startup import BackgroundInit, mark_listening
+from metrics import configure_from_env, metrics
+import win32_calls
+from language_detect import choose_source_lang, detect, is_target_language
+from hotkeys import build_matcher
+from pretranslate import build_pretranslator
+
+# 快捷键触发时翻译（含等待预翻译）的总时限（秒）
+TRANSLATE_TIMEOUT = 5.0
 
 class Translator:
     def __init__(self):
         """初始化翻译器"""
-        self.ctrl_pressed = False
-        self.win_pressed = False
-        self.t_pressed = False
-        self.last_translation_time = 0
-        
         # 加载配置
         self.config = self.load_config()
         if not self.config:
             print("请先配置翻译API密钥")
             return
             
+        # 引擎、缓存等在后台加载，先注册键盘监听
+        self.services = BackgroundInit("翻译引擎", self.load_services)
+        
+        # 翻译在后台线程执行，键盘回调只投递任务
+        self.worker = TranslationWorker(self.handle_translation).start()
+        
+        # 快捷键在配置的 hotkeys 中设置
+        self.hotkeys = build_matcher(self.config, {"translate": "ctrl+win+t"},
+                                     {"translate": self.trigger_translation}, keyboard.Key)
+        # 可选：打字停顿时在后台预翻译当前窗口的文本（配置 "pretranslate": true）
+        self.pretranslator = build_pretranslator(
+            self.config, win32gui.GetForegroundWindow, self.get_window_text, self.pretranslate)
+        
         print("✓ 翻译器初始化完成")
-        print("等待快捷键触发 (Ctrl+Win+T)...")
+        print(f"等待快捷键触发 ({self.hotkeys.describe()})...")
+
+    def load_services(self):
+        """连接翻译服务（在后台线程中执行）"""
+        from translation_daemon import connect_or_local
+        
+        # 常驻的本地翻译服务持有引擎连接、缓存和限流状态；
+        # 配置 "daemon": false 或无法连接时在进程内创建引擎
+        self.translator = connect_or_local(self.config)
 
     def load_config(self) -> dict:
         """加载配置文件"""
@@ -31,10 +54,34 @@ class Translator:
             if not os.path.exists(config_path):
                 # 创建默认配置
                 config = {
-                    "api_type": "deepl",  # deepl, google, microsoft
-                    "api_key": "",  # 需要填写API密钥
+                    "api_type": "google",  # google（无需密钥）或 deepl（需要填写api_key）
+                    "api_key": "",  # deepl 的API密钥；为空时 api_type 不生效
                     "source_lang": "auto",
                     "target_lang": "EN",
+                    "http2": False,  # 需要安装httpx[http2]
+                    "engines": ["google"],  # 配置多个引擎时启用对冲模式
+                    "deadline": 3.0,  # 对冲模式截止时间（秒）
+                    "hedge_delay": 0.0,  # 发出下一个引擎请求前的等待（秒）
+                    "quality_engine": None,  # 截止时间内优先采用的引擎
+                    "async_engines": False,  # 引擎请求走共享的异步HTTP客户端（需要httpx；不提高吞吐量）
+                    "async_max_connections": 100,
+                    "daemon": True,  # 使用常驻的本地翻译服务（translation_daemon.py）
+                    "daemon_port": 60829,
+                    "rate_limits": {"google": [10, 20], "deepl": [10, 20]},  # [每秒请求数, 突发容量]
+                    "max_attempts": 3,  # 429/5xx/网络错误时的最多尝试次数
+                    "breaker_threshold": 5,  # 连续失败多少次后熔断，改用下一个引擎
+                    "breaker_reset": 30.0,  # 熔断冷却时间（秒）
+                    "translation_memory": True,  # 复用相似片段的译文（translation_memory.db）
+                    "protect_spans": True,  # 链接、代码、@提及、路径和表情不发送给翻译引擎
+                    "dictionary": "",  # 本地词典索引（python dictionary.py build ecdict.csv ecdict.idx）
+                    # 也可以加上按键序列，如 ["ctrl+win+t", "space space space"]（默认不开启：
+                    # 在任何输入框中连按三次空格都会触发翻译并替换文本）
+                    "hotkeys": {"translate": "ctrl+win+t"},
+                    "sequence_timeout_ms": 400,  # 按键序列需在多少毫秒内按完
+                    "pretranslate": False,  # 打字停顿时在后台预翻译
+                    "pretranslate_pause_ms": 800,
+                    "pretranslate_max_concurrent": 1,
+                    "pretranslate_chars_per_minute": 2000,
                 }
                 with open(config_path, "w", encoding="utf-8") as f:
                     json.dump(config, f, indent=4, ensure_ascii=False)
@@ -51,13 +98,8 @@ class Translator:
     def get_window_text(self, hwnd) -> str:
         """获取窗口文本"""
         try:
-            length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
-            if length == 0:
-                return ""
-            buffer = win32gui.PyMakeBuffer(length + 1)
-            win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
-            text = buffer[:length].tobytes().decode('utf-16')
-            return text
+            # 限时读取，目标程序卡死时不会阻塞
+            return win32_calls.get_text(hwnd)
         except Exception as e:
             print(f"获取文本错误: {e}")
             return ""
@@ -65,75 +107,99 @@ class Translator:
     def set_window_text(self, hwnd, text: str) -> bool:
         """设置窗口文本"""
         try:
-            result = win32gui.SendMessage(hwnd, win32con.WM_SETTEXT, 0, text)
-            return result != 0
+            return win32_calls.set_text(hwnd, text)
         except Exception as e:
             print(f"设置文本错误: {e}")
             return False
 
-    def translate_text(self, text: str) -> Optional[str]:
+    def translate_text(self, text: str, window_key=None,
+                       source_lang: Optional[str] = None,
+                       timeout: float = TRANSLATE_TIMEOUT) -> Optional[str]:
         """翻译文本"""
         if not text.strip():
             return None
             
-        try:
-            # 使用Google Translate API
-            response = requests.get(
-                "https://translate.googleapis.com/translate_a/single",
-                params={
-                    "client": "gtx",
-                    "sl": self.config["source_lang"],
-                    "tl": self.config["target_lang"],
-                    "dt": "t",
-                    "q": text
-                },
-                timeout=5
-            )
+        if not self.services.wait(10):
+            print("翻译引擎未就绪")
+            return None
             
-            if response.status_code == 200:
-                result = response.json()
-                translated = ''.join([item[0] for item in result[0] if item[0]])
-                return translated
-            else:
-                print(f"翻译请求失败: {response.status_code}")
-                print(f"错误信息: {response.text}")
-                
+        # 指定window_key时按窗口增量翻译，只发送新增或修改的段落
+        return self.translator.translate(
+            text, source_lang or self.config["source_lang"], self.config["target_lang"], window_key,
+            timeout)
+
+    def pretranslate(self, hwnd, text: str) -> Optional[str]:
+        """预翻译（在后台线程中执行），不需要翻译或引擎未就绪时返回None"""
+        if not self.services.wait(0):
             return None
-        except Exception as e:
-            print(f"翻译错误: {e}")
+        detection = detect(text)
+        if not detection.has_letters or is_target_language(detection, self.config["target_lang"]):
             return None
+        source_lang = self.config["source_lang"]
+        if source_lang.lower() == "auto":
+            source_lang = choose_source_lang(detection)
+        return self.translator.translate(text, source_lang, self.config["target_lang"], hwnd)
 
-    def handle_translation(self):
+    def handle_translation(self, job: Optional[TranslationJob] = None):
         """处理翻译"""
-        current_time = time.time()
-        if current_time - self.last_translation_time < 1.0:
-            return
-        self.last_translation_time = current_time
-
         try:
-            # 获取当前窗口
-            hwnd = win32gui.GetForegroundWindow()
+            # 使用触发时的窗口，没有则取当前窗口
+            hwnd = job.hwnd if job and job.hwnd else win32gui.GetForegroundWindow()
             window_title = win32gui.GetWindowText(hwnd)
             print(f"\n当前窗口: {window_title}")
+            if win32_calls.hung_windows.is_hung(hwnd):
+                print("窗口无响应，暂时跳过")
+                return
 
             # 获取文本
-            text = self.get_window_text(hwnd)
+            with metrics.span("stage", stage="read"):
+                text = self.get_window_text(hwnd)
             if not text:
                 print("未获取到文本")
                 return
 
             print(f"原文: {text}")
+
+            # 检查是否已是目标语言；源语言为auto时按检测结果确定
+            detection = detect(text)
+            if not detection.has_letters or is_target_language(detection, self.config["target_lang"]):
+                print("文本已是目标语言，跳过翻译")
+                return
+            source_lang = self.config["source_lang"]
+            if source_lang.lower() == "auto":
+                source_lang = choose_source_lang(detection)
             
-            # 翻译
-            translated = self.translate_text(text)
+            # 翻译；打字停顿时已预翻译过同样的文本则直接使用结果
+            with metrics.span("stage", stage="translate"):
+                if self.pretranslator:
+                    translated = self.pretranslator.take_or_translate(
+                        hwnd, text, lambda remaining: self.translate_text(
+                            text, hwnd, source_lang, remaining), TRANSLATE_TIMEOUT)
+                else:
+                    translated = self.translate_text(text, hwnd, source_lang)
             if not translated:
                 print("翻译失败")
                 return
 
             print(f"译文: {translated}")
             
+            if job and job.cancelled:
+                print("任务已被新的触发取代，放弃替换")
+                return
+            
+            # 窗口或文本已变化时放弃本次结果
+            with metrics.span("stage", stage="inspect"):
+                if win32gui.GetForegroundWindow() != hwnd:
+                    print("窗口已改变，放弃替换")
+                    return
+                if self.get_window_text(hwnd) != text:
+                    print("文本已变化，放弃替换")
+                    return
+            
             # 替换文本
-            if self.set_window_text(hwnd, translated):
+            with metrics.span("stage", stage="replace"):
+                replaced = self.set_window_text(hwnd, translated)
+            if replaced:
                 print("✓ 文本替换成功")
             else:
                 print("✗ 文本替换失败")
@@ -141,34 +207,20 @@ class Translator:
         except Exception as e:
             print(f"翻译处理错误: {e}")
 
+    def trigger_translation(self):
+        """快捷键回调（在键盘钩子线程中执行，只投递任务）"""
+        print("检测到快捷键，开始翻译...")
+        self.worker.submit(win32gui.GetForegroundWindow())
+
     def on_press(self, key):
         """按键按下事件"""
-        try:
-            if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                self.ctrl_pressed = True
-            elif key == keyboard.Key.cmd:
-                self.win_pressed = True
-            elif str(key) == "'t'" or str(key) == "'\\x14'":
-                self.t_pressed = True
-
-            if self.ctrl_pressed and self.win_pressed and self.t_pressed:
-                print("检测到快捷键，开始翻译...")
-                self.handle_translation()
-
-        except AttributeError:
-            pass
+        self.hotkeys.on_press(key)
+        if self.pretranslator:
+            self.pretranslator.on_keystroke()
 
     def on_release(self, key):
         """按键释放事件"""
-        try:
-            if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                self.ctrl_pressed = False
-            elif key == keyboard.Key.cmd:
-                self.win_pressed = False
-            elif str(key) == "'t'" or str(key) == "'\\x14'":
-                self.t_pressed = False
-        except AttributeError:
-            pass
+        self.hotkeys.on_release(key)
 
     def run(self):
         """运行翻译器"""
@@ -178,9 +230,12 @@ class Translator:
         with keyboard.Listener(
             on_press=self.on_press,
             on_release=self.on_release) as listener:
+            if mark_listening(listener):
+                return
             listener.join()
 
 def main():
+    configure_from_env()
     translator = Translator()
     translator.run()
 
@@ -0,0 +1,119 @@
+"""UI Automation 的后台预加载与元素缓存
+
+uiautomation/comtypes 的导入和 IUIAutomation 的创建在启动时放到后台线程，
+解析出的自动化元素按窗口缓存，失效（COM 报错）时自动重新查找。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+_auto = None
+_loaded = threading.Event()
+_load_lock = threading.Lock()
+_load_started = False
+_thread_state = threading.local()
+
+
+def _load():
+    global _auto
+    try:
+        import comtypes.client  # noqa: F401  FirefoxHandler 也会用到
+        import uiautomation as auto
+        # 创建 IUIAutomation 实例，之后的首次调用不再付出初始化代价
+        with auto.UIAutomationInitializerInThread():
+            auto.GetRootControl()
+        _auto = auto
+    except Exception as e:
+        print(f"UI Automation 不可用: {e}")
+    finally:
+        _loaded.set()
+
+
+def preload_async():
+    """在后台线程中导入 uiautomation 和 comtypes"""
+    global _load_started
+    with _load_lock:
+        if _load_started:
+            return
+        _load_started = True
+    threading.Thread(target=_load, name="uia-preload", daemon=True).start()
+
+
+def get_automation(timeout: float = 2.0):
+    """获取 uiautomation 模块（等待预加载完成），不可用时返回None"""
+    preload_async()
+    if not _loaded.wait(timeout) or _auto is None:
+        return None
+    # 每个使用 UI Automation 的线程都需要初始化COM
+    if not getattr(_thread_state, "initialized", False):
+        initializer = getattr(_auto, "InitializeUIAutomationInCurrentThread", None)
+        if initializer is not None:
+            initializer()
+        _thread_state.initialized = True
+    return _auto
+
+
+def walk_find(root, predicate: Callable, max_depth: int):
+    """按有限深度遍历控件树，返回第一个满足条件的控件"""
+    auto = get_automation()
+    if auto is None or root is None:
+        return None
+    for control, depth in auto.WalkControl(root, includeTop=False, maxDepth=max_depth):
+        if predicate(control):
+            return control
+    return None
+
+
+class ElementCache:
+    """按窗口缓存已解析的自动化元素（有容量上限）"""
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_alive(control) -> bool:
+        """元素所在的窗口或控件已销毁时，访问属性会抛出COM错误"""
+        try:
+            control.Element.CurrentProcessId
+            return True
+        except Exception:
+            return False
+
+    def find(self, hwnd: int, kind: str, search: Callable) -> Optional[object]:
+        """返回缓存的元素；没有或已失效时调用search(root)重新查找"""
+        key = (hwnd, kind)
+        with self._lock:
+            control = self._entries.get(key)
+        if control is not None:
+            if self.is_alive(control):
+                with self._lock:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                return control
+            self.stale += 1
+
+        auto = get_automation()
+        if auto is None:
+            return None
+        self.misses += 1
+        control = search(auto.ControlFromHandle(hwnd))
+        with self._lock:
+            if control is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = control
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return control
+
+    def clear(self):
+        """清空缓存（元素所在的线程被放弃时）"""
+        with self._lock:
+            self._entries.clear()
+
+
+element_cache = ElementCache()
@@ -0,0 +1,314 @@
+"""带截止时间的跨进程 Win32 调用
+
+win32gui.SendMessage(WM_GETTEXT/WM_SETTEXT) 会一直等到目标程序处理完消息；目标程序
+卡死时，我们的翻译线程（以及等待它的键盘钩子）也会跟着卡死。这里的调用都有时间预算:
+
+- 窗口消息用 SendMessageTimeout（SMTO_ABORTIFHUNG），超时或目标已无响应时立即失败
+- UI Automation 调用在受监督的工作线程中执行；超时后放弃该线程（COM调用无法中断），
+  下次调用换一个新线程
+- 超时的窗口（按顶层窗口计）进入黑名单 BLACKLIST_SECONDS 秒，期间对它的调用直接失败
+
+失败时抛出 WindowTimeout；调用方按读取/替换失败处理。
+
+UTF-16 直接从memoryview解码，不经过 tobytes() 的中间拷贝。超过 LARGE_TEXT_CHARS 的
+编辑框可以按行分块读取（iter_text）边读边翻译，再分块写回（write_text），
+缓冲区只与块大小有关。
+"""
+import codecs
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+# 每次调用的时间预算（秒）
+TEXT_TIMEOUT = 1.0     # 读取/设置文本（含 GETTEXTLENGTH + GETTEXT 两条消息）
+UIA_TIMEOUT = 2.0      # 一次 UI Automation 操作（查找元素 + 读取值）
+BLACKLIST_SECONDS = 30.0
+LARGE_TEXT_TIMEOUT = 30.0  # 分块读取/写入整个大文本
+
+LARGE_TEXT_CHARS = 256 * 1024  # 超过该长度时分块读取并流水线翻译
+CHUNK_CHARS = 64 * 1024
+COPY_CHARS_PER_SECOND = 2_000_000  # 一次复制大量文本时按长度放宽时间预算
+
+_ERROR_TIMEOUT = 1460  # ERROR_TIMEOUT
+_GA_ROOT = 2
+
+
+class WindowTimeout(Exception):
+    """目标窗口在时间预算内没有响应（或仍在黑名单中）"""
+    def __init__(self, hwnd: int, operation: str):
+        super().__init__(f"窗口 {hwnd:#x} 无响应: {operation}")
+        self.hwnd = hwnd
+        self.operation = operation
+
+
+def _root(hwnd: int) -> int:
+    """窗口所属的顶层窗口；同一程序卡死时它的子窗口都会卡死"""
+    import win32gui
+    try:
+        return win32gui.GetAncestor(hwnd, _GA_ROOT) or hwnd
+    except Exception:
+        return hwnd
+
+
+class HungWindows:
+    """无响应窗口的黑名单（按顶层窗口，过期自动移除）"""
+    def __init__(self, cooldown: float = BLACKLIST_SECONDS):
+        self.cooldown = cooldown
+        self._until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, hwnd: int):
+        root = _root(hwnd)
+        with self._lock:
+            self._until[root] = time.monotonic() + self.cooldown
+        print(f"窗口 {root:#x} 无响应，{self.cooldown:.0f} 秒内跳过")
+
+    def is_hung(self, hwnd: int) -> bool:
+        if not self._until:
+            return False
+        root = _root(hwnd)
+        with self._lock:
+            until = self._until.get(root)
+            if until is None:
+                return False
+            if time.monotonic() >= until:
+                del self._until[root]
+                return False
+            return True
+
+    def check(self, hwnd: int, operation: str):
+        """窗口在黑名单中时立即抛出WindowTimeout"""
+        if self.is_hung(hwnd):
+            raise WindowTimeout(hwnd, operation)
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+
+
+hung_windows = HungWindows()
+
+
+def send_message(hwnd: int, msg: int, wparam=0, lparam=0, timeout: float = TEXT_TIMEOUT) -> int:
+    """SendMessage 的限时版本，返回消息的结果；超时抛出WindowTimeout"""
+    import win32con
+    import win32gui
+    hung_windows.check(hwnd, "SendMessage")
+    flags = win32con.SMTO_ABORTIFHUNG | win32con.SMTO_BLOCK
+    try:
+        _, result = win32gui.SendMessageTimeout(hwnd, msg, wparam, lparam, flags,
+                                                max(1, int(timeout * 1000)))
+    except win32gui.error as e:
+        # 超时或目标已被系统判定为无响应（此时错误码可能为0）
+        if e.args and e.args[0] in (0, _ERROR_TIMEOUT):
+            hung_windows.mark(hwnd)
+            raise WindowTimeout(hwnd, "SendMessage") from e
+        raise
+    return result
+
+
+def _decode(buffer, chars: int) -> str:
+    """从缓冲区解码前chars个UTF-16字符（memoryview切片不拷贝）"""
+    return codecs.utf_16_le_decode(memoryview(buffer)[:chars * 2])[0]
+
+
+def text_length(hwnd: int, timeout: float = TEXT_TIMEOUT, length_msg: Optional[int] = None) -> int:
+    """窗口文本的字符数（默认 WM_GETTEXTLENGTH）"""
+    import win32con
+    if length_msg is None:
+        length_msg = win32con.WM_GETTEXTLENGTH
+    return send_message(hwnd, length_msg, 0, 0, timeout)
+
+
+def get_text(hwnd: int, timeout: float = TEXT_TIMEOUT,
+             length_msg: Optional[int] = None, text_msg: Optional[int] = None) -> str:
+    """读取窗口文本（默认 WM_GETTEXTLENGTH + WM_GETTEXT），两条消息共用timeout"""
+    import win32con
+    import win32gui
+    deadline = time.monotonic() + timeout
+    length = text_length(hwnd, timeout, length_msg)
+    if length <= 0:
+        return ""
+    # 缓冲区按字节计：UTF-16 每个字符2字节，外加结尾的NUL
+    buffer = win32gui.PyMakeBuffer((length + 1) * 2)
+    remaining = deadline - time.monotonic() + length / COPY_CHARS_PER_SECOND
+    copied = send_message(hwnd, win32con.WM_GETTEXT if text_msg is None else text_msg,
+                          length + 1, buffer, max(0.001, remaining))
+    return _decode(buffer, min(copied, length))
+
+
+def _sender(hwnd: int, deadline: float, operation: str) -> Callable[..., int]:
+    """分块读写用的send：每条消息按 TEXT_TIMEOUT 判断目标是否卡死，总耗时不超过deadline"""
+    def send(msg: int, wparam=0, lparam=0) -> int:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise WindowTimeout(hwnd, operation)
+        return send_message(hwnd, msg, wparam, lparam, min(TEXT_TIMEOUT, remaining))
+    return send
+
+
+def iter_text(hwnd: int, chunk_chars: int = CHUNK_CHARS,
+              timeout: float = LARGE_TEXT_TIMEOUT) -> Iterator[str]:
+    """按行分块读取编辑框文本，每块约chunk_chars个字符（在行尾切分）
+
+    用 EM_LINEINDEX / EM_GETLINE 逐行复制到一个复用的缓冲区，额外内存只与块大小
+    （以及最长的一行）有关。每条消息仍按 TEXT_TIMEOUT 判断目标是否卡死，
+    整个读取超过timeout时抛出WindowTimeout（不加入黑名单）。
+    不是编辑框（没有行信息）或单行超过65535个字符时，剩余部分退回一次性读取。
+    """
+    import win32con
+    deadline = time.monotonic() + timeout
+    send = _sender(hwnd, deadline, "分块读取超时")
+
+    count = send(win32con.EM_GETLINECOUNT)
+    if count <= 0:
+        yield get_text(hwnd, timeout)
+        return
+    buffer = bytearray(2)
+    parts = []
+    size = 0
+    start = send(win32con.EM_LINEINDEX, 0)
+    for line in range(count):
+        if line + 1 < count:
+            end = send(win32con.EM_LINEINDEX, line + 1)
+            span = end - start  # 本行及其后的换行符
+        else:
+            end = -1
+            span = send(win32con.EM_LINELENGTH, start)
+        if start < 0 or span < 0 or span > 0xFFFF:
+            # EM_GETLINE 的缓冲区长度只有16位
+            if parts:
+                yield "".join(parts)
+            yield get_text(hwnd, max(0.001, deadline - time.monotonic()))[max(start, 0):]
+            return
+        if len(buffer) < span * 2 + 2:
+            buffer = bytearray(max(span * 2 + 2, len(buffer) * 2))
+        struct.pack_into("<H", buffer, 0, span)
+        copied = send(win32con.EM_GETLINE, line, buffer) if span else 0
+        text = _decode(buffer, min(copied, span))
+        if end >= 0:
+            # 硬换行：\r\n，或单字符的 \n（记事本打开的LF文件）/ \r（RichEdit，写回时同样
+            # 识别 \n）；自动换行产生的行之间没有字符
+            gap = end - start - copied
+            text += "\r\n" if gap >= 2 else "\n" if gap == 1 else ""
+        parts.append(text)
+        size += len(text)
+        if size >= chunk_chars:
+            yield "".join(parts)
+            parts = []
+            size = 0
+        start = end
+    if parts:
+        yield "".join(parts)
+
+
+def set_text(hwnd: int, text: str, timeout: float = TEXT_TIMEOUT,
+             msg: Optional[int] = None) -> bool:
+    """设置窗口文本（默认 WM_SETTEXT），时间预算按文本长度放宽"""
+    import win32con
+    timeout += len(text) / COPY_CHARS_PER_SECOND
+    return bool(send_message(hwnd, win32con.WM_SETTEXT if msg is None else msg, 0, text, timeout))
+
+
+def write_text(hwnd: int, chunks: Iterable[str], length: int,
+               timeout: float = LARGE_TEXT_TIMEOUT) -> bool:
+    """分块写入编辑框，替换原有的全部文本；length 为写入后的字符数（UTF-16）
+
+    全选后用 EM_REPLACESEL 写入第一块，之后每块接在光标（上一块末尾）处，
+    不需要把整个文本拼成一个字符串。不是编辑框（没有行信息）或 length 超过
+    编辑框的长度上限（EM_REPLACESEL 受 EM_LIMITTEXT 限制）时不写入，返回False，
+    由调用方一次性写入。写入后长度不符时也返回False。
+    """
+    import win32con
+    deadline = time.monotonic() + timeout
+    send = _sender(hwnd, deadline, "分块写入超时")
+    if send(win32con.EM_GETLINECOUNT) <= 0 or send(win32con.EM_GETLIMITTEXT) < length:
+        return False
+    send(win32con.EM_SETSEL, 0, -1)
+    for chunk in chunks:
+        # 不可撤销，与 WM_SETTEXT 相同
+        send(win32con.EM_REPLACESEL, 0, chunk)
+    return text_length(hwnd, max(0.001, min(TEXT_TIMEOUT, deadline - time.monotonic()))) == length
+
+
+class CallTimeout(FutureTimeout):
+    """受监督的调用超时；started 为False表示调用还排在之前卡住的调用后面，没有开始"""
+    def __init__(self, started: bool):
+        super().__init__("调用超时" if started else "等待之前的调用超时")
+        self.started = started
+
+
+class SupervisedWorker:
+    """在单独的守护线程中执行可能卡住的调用
+
+    调用超时后放弃当前线程（它会在卡住的调用返回后自行退出），
+    后续调用使用新线程，不会排在卡住的调用后面。
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.abandoned = 0
+        self._queue = None
+        self._thread_id = None
+        self._lock = threading.Lock()
+
+    def _loop(self, jobs: "queue.SimpleQueue"):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            func, args, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _jobs(self) -> "queue.SimpleQueue":
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.SimpleQueue()
+                thread = threading.Thread(target=self._loop, args=(self._queue,),
+                                          name=self.name, daemon=True)
+                thread.start()
+                self._thread_id = thread.ident
+            return self._queue
+
+    def call(self, timeout: float, func: Callable, *args):
+        """在工作线程中执行func(*args)，timeout秒内没有完成时抛出CallTimeout"""
+        if threading.get_ident() == self._thread_id:
+            return func(*args)  # 已在工作线程中（嵌套调用）
+        jobs = self._jobs()
+        future = Future()
+        jobs.put((func, args, future))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            started = not future.cancel()
+            with self._lock:
+                if self._queue is jobs:
+                    self._queue = None
+                    self._thread_id = None
+                    self.abandoned += 1
+            jobs.put(None)
+            raise CallTimeout(started) from None
+
+
+uia_worker = SupervisedWorker("uia-call")
+
+
+def call_uia(hwnd: int, func: Callable, *args, timeout: float = UIA_TIMEOUT):
+    """在受监督的线程中执行针对窗口hwnd的 UI Automation 操作"""
+    hung_windows.check(hwnd, "UI Automation")
+    try:
+        return uia_worker.call(timeout, func, *args)
+    except CallTimeout as e:
+        # 被放弃的线程里创建的元素不再使用
+        import uia_cache
+        uia_cache.element_cache.clear()
+        if e.started:
+            hung_windows.mark(hwnd)
+        raise WindowTimeout(hwnd, "UI Automation") from None